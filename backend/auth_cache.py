@@ -0,0 +1,136 @@
+"""Short-lived cache of verified tokens -> user principals.
+
+`get_current_user` used to decode the JWT and then load the user row on every
+authenticated request. Entries here are keyed on the token signature, so a
+repeat request with the same token skips both the user query and the
+signature check. An entry lives for at most `AUTH_CACHE_TTL` seconds and never
+beyond the token's own `exp`.
+
+Any committed change to a user's role, password or username (and deleting the
+user) drops that user's entries, via ORM events on `User`. Other workers only
+see such a change once their entries expire, which the TTL bounds.
+"""
+
+import os
+import threading
+import time
+from typing import NamedTuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from cache import _MISSING, LRUCache
+from models import User
+
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "4096"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+
+# User columns that change what a token is allowed to do
+_PRINCIPAL_FIELDS = ("username", "role", "password_hash")
+
+
+class Principal(NamedTuple):
+    """The authenticated user as seen by endpoints; detached from any session."""
+
+    id: int
+    username: str
+    role: str
+    email: str | None = None
+    # `jti` of the access token this principal was authenticated with
+    jti: str | None = None
+
+    @classmethod
+    def from_user(cls, user: User, jti: str | None = None) -> "Principal":
+        return cls(user.id, user.username, user.role, user.email, jti)
+
+
+class PrincipalCache:
+    def __init__(self, max_entries: int, ttl: float):
+        self.ttl = ttl
+        self._entries = LRUCache(max_entries)
+        # Bumped per username on invalidation; older entries for it are ignored
+        self._generations: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.invalidations = 0
+
+    @staticmethod
+    def _split(token: str) -> tuple[str, str]:
+        signing_input, _, signature = token.rpartition(".")
+        return signing_input, signature
+
+    def generation(self, username: str) -> int:
+        """Read before loading the user, and pass to `put`: a change committed in
+        between then can't be cached."""
+
+        with self._lock:
+            return self._generations.get(username, 0)
+
+    def get(self, token: str) -> Principal | None:
+        signing_input, signature = self._split(token)
+        entry = self._entries.get(signature)
+        if entry is _MISSING:
+            return None
+        cached_input, principal, generation = entry
+        # Same signature but a different header/payload is not the same token
+        if cached_input != signing_input or generation != self.generation(principal.username):
+            return None
+        return principal
+
+    def put(self, token: str, principal: Principal, generation: int, expires_at: float | None = None) -> None:
+        ttl = self.ttl
+        if expires_at is not None:
+            ttl = min(ttl, expires_at - time.time())
+        if ttl <= 0:
+            return
+
+        signing_input, signature = self._split(token)
+        self._entries.set(signature, (signing_input, principal, generation), ttl)
+
+    def invalidate_user(self, username: str) -> None:
+        with self._lock:
+            self._generations[username] = self._generations.get(username, 0) + 1
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict[str, float]:
+        return {**self._entries.stats(), "invalidations": self.invalidations, "ttl_seconds": self.ttl}
+
+
+principal_cache = PrincipalCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+
+def _changed_usernames(user: User) -> set[str]:
+    state = inspect(user)
+    history = {field: state.attrs[field].history for field in _PRINCIPAL_FIELDS}
+    if not any(h.has_changes() for h in history.values()):
+        return set()
+    # A rename must also drop tokens issued for the old name
+    return {user.username, *(name for name in history["username"].deleted if name)}
+
+
+@event.listens_for(User, "after_update")
+def _user_updated(mapper, connection, target: User) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_principals", set()).update(_changed_usernames(target))
+
+
+@event.listens_for(User, "after_delete")
+def _user_deleted(mapper, connection, target: User) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_principals", set()).add(target.username)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_principals(session: Session) -> None:
+    # After commit, so a concurrent request can't re-cache the old row
+    for username in session.info.pop("changed_principals", ()):
+        principal_cache.invalidate_user(username)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_principals(session: Session) -> None:
+    session.info.pop("changed_principals", None)
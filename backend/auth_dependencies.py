@@ -2,8 +2,10 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from sqlmodel import Session, select
+from auth_cache import Principal, principal_cache
 from database import get_session
 from models import User
+from revocation import revocation_list
 from security import SECRET_KEY, ALGORITHM
 
 # Import necessary FastAPI and JWT dependencies
@@ -19,6 +21,13 @@ def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Dep
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    # A token we've already verified skips the signature check and the user query
+    principal = principal_cache.get(token)
+    if principal is not None:
+        if revocation_list.is_revoked(session, principal.jti):
+            raise credentials_exception
+        return principal
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -26,16 +35,23 @@ def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Dep
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
+
+    if revocation_list.is_revoked(session, payload.get("jti")):
+        raise credentials_exception
+
+    generation = principal_cache.generation(username)
     user = session.exec(select(User).where(User.username == username)).first()
     if user is None:
         raise credentials_exception
-    return user
+
+    principal = Principal.from_user(user, payload.get("jti"))
+    principal_cache.put(token, principal, generation, expires_at=payload.get("exp"))
+    return principal
 
 # Define a function get_current_admin(current_user: User = Depends(get_current_user))
 # If current_user.role is not "admin", raise HTTPException 403 (Forbidden).
 # Return current_user.
-def get_current_admin(current_user: User = Depends(get_current_user)):
+def get_current_admin(current_user: Principal = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -0,0 +1,128 @@
+"""Read-through cache for catalog reads.
+
+`CatalogCache` sits between the GET endpoints and the database. Values are
+plain JSON-able data (never ORM objects), so they can outlive the request's
+session. The storage is pluggable through `CacheBackend`; `LRUCache` is the
+bounded in-process default. Every catalog write calls `invalidate()`.
+"""
+
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable
+
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "1024"))
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "30"))
+
+_MISSING = object()
+
+
+class CacheBackend(ABC):
+    """Storage interface for the catalog cache.
+
+    A shared backend (e.g. Redis) only has to implement these methods; `clear`
+    must drop every key written by this cache.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Any:
+        """Return the cached value, or `_MISSING` when absent or expired."""
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: float) -> None: ...
+
+    @abstractmethod
+    def clear(self) -> None: ...
+
+    @abstractmethod
+    def stats(self) -> dict[str, int]: ...
+
+
+class LRUCache(CacheBackend):
+    """Thread-safe, size-bounded LRU with per-entry expiry."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class CatalogCache:
+    def __init__(self, backend: CacheBackend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        # Bumped by invalidate(); a value loaded across a bump may predate the write
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.invalidations = 0
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        return "catalog:" + json.dumps(parts, separators=(",", ":"))
+
+    def get_or_load(self, key: str, loader: Callable[[], Any]) -> Any:
+        value = self.backend.get(key)
+        if value is _MISSING:
+            generation = self._generation
+            value = loader()
+            with self._lock:
+                # Not cached if a write committed while loading: the value may be stale
+                if generation == self._generation:
+                    self.backend.set(key, value, self.ttl)
+        return value
+
+    def invalidate(self) -> None:
+        """Drop all catalog entries; called after every committed catalog write."""
+
+        with self._lock:
+            self._generation += 1
+            self.backend.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict[str, Any]:
+        return {**self.backend.stats(), "invalidations": self.invalidations, "ttl_seconds": self.ttl}
+
+
+catalog_cache = CatalogCache(LRUCache(CATALOG_CACHE_SIZE), CATALOG_CACHE_TTL)
@@ -0,0 +1,311 @@
+"""Bulk-load sweets, from a file or from a synthetic catalog generator.
+
+    python catalog_loader.py [--batch-size 5000] [--on-conflict update|ignore] [--defer-search-index] load sweets.ndjson|sweets.csv
+    python catalog_loader.py [...] generate 1000000 [--seed 0] [--categories "Indian=3,Candy=1"] [--prices lognormal:1.2,0.6]
+
+Rows are upserted by name, one transaction per batch:
+
+- one indexed `SELECT` finds the names that already exist;
+- new rows go in with one executemany INSERT (multi-row VALUES under the
+  hood), or with `COPY` on PostgreSQL/psycopg2;
+- existing rows get one executemany UPDATE, which skips rows that already
+  hold the same values. `--on-conflict ignore` leaves them untouched instead.
+
+Loading the same rows again therefore changes nothing. `category_key` and
+default images are filled in as the API would. The category summary is
+rebuilt once at the end.
+
+On SQLite, the triggers that sync the search index cost most of the insert
+time. `--defer-search-index` drops them for the load and rebuilds the index
+once at the end (see `search_index.py`). Until then, name searches don't
+find rows written by anyone during the load. `load` reads the files that `/sweets/export` writes;
+their ids are ignored.
+
+`generate` makes a deterministic catalog: the same seed and options always
+produce the same rows, and a smaller count yields a prefix of a larger one.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import json
+import math
+import random
+import time
+from contextlib import contextmanager
+from itertools import accumulate, islice
+from typing import Callable, Iterable, Iterator
+
+from sqlalchemy import bindparam, func, insert, or_, select, update
+from sqlmodel import Session
+
+import category_summary
+from models import Sweet, normalize_category
+from sweet_images import NAME_TO_IMAGE_URL, default_image_url_for_category
+
+LOAD_BATCH_SIZE = 5000
+
+_COLUMNS = ("name", "category", "category_key", "price", "quantity", "image_url")
+_UPDATE_COLUMNS = ("category", "category_key", "price", "quantity")
+
+DEFAULT_CATEGORIES = "Indian=3,Chocolate=3,Candy=2,Cake=1,Cookie=1,Ice Cream=1"
+DEFAULT_PRICES = "lognormal:1.2,0.6"  # median ~3.3
+
+_ADJECTIVES = ["Classic", "Salted", "Royal", "Golden", "Spiced", "Double", "Mini", "Rose", "Honey", "Midnight"]
+_FORMS = ["Bites", "Bar", "Delight", "Swirl", "Truffle", "Drops", "Squares", "Twist", "Cup", "Box"]
+
+
+def _prepare(row: dict) -> dict:
+    category = row["category"]
+    return {
+        "name": row["name"],
+        "category": category,
+        "category_key": normalize_category(category),
+        "price": float(row["price"]),
+        "quantity": int(row["quantity"]),
+        # Only an explicit URL replaces an existing row's image (see _update_statement)
+        "image_url": row.get("image_url") or None,
+    }
+
+
+def _with_default_image(row: dict) -> dict:
+    if row["image_url"]:
+        return row
+    image_url = NAME_TO_IMAGE_URL.get(row["name"]) or default_image_url_for_category(row["category"])
+    return {**row, "image_url": image_url}
+
+
+def _update_statement():
+    table = Sweet.__table__
+    new = {name: bindparam(f"new_{name}") for name in _UPDATE_COLUMNS}
+    new["image_url"] = func.coalesce(bindparam("new_image_url"), table.c.image_url)
+    return (
+        update(table)
+        .where(table.c.id == bindparam("sweet_id"))
+        # Unchanged rows aren't written (nor re-indexed by the search triggers)
+        .where(or_(*[table.c[name].is_distinct_from(value) for name, value in new.items()]))
+        .values(new)
+    )
+
+
+def _copy_rows(connection, rows: list[dict]) -> None:
+    """`COPY ... FROM STDIN` in the connection's transaction (psycopg2)."""
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([r"\N" if row[name] is None else row[name] for name in _COLUMNS])
+    buffer.seek(0)
+
+    with connection.connection.dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY sweet ({', '.join(_COLUMNS)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+
+
+def _insert_rows(connection, rows: list[dict]) -> None:
+    if connection.dialect.name == "postgresql" and connection.dialect.driver == "psycopg2":
+        _copy_rows(connection, rows)
+    else:
+        connection.execute(insert(Sweet.__table__), rows)
+
+
+def _batches(rows: Iterator[dict], size: int) -> Iterator[list[dict]]:
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def load_sweets(
+    engine,
+    rows: Iterable[dict],
+    batch_size: int = LOAD_BATCH_SIZE,
+    on_conflict: str = "update",
+    defer_search_index: bool = False,
+    progress: Callable[[str], None] | None = None,
+) -> dict[str, float]:
+    """Upsert `rows` (name, category, price, quantity[, image_url]) by name.
+
+    Returns the inserted/updated/unchanged counts, elapsed seconds and rows/s.
+    Within the input, the last row for a name wins.
+    """
+
+    if on_conflict not in ("update", "ignore"):
+        raise ValueError("on_conflict must be 'update' or 'ignore'")
+
+    started = time.perf_counter()
+    with _search_index_deferred(engine, defer_search_index):
+        counts, processed = _load_batches(engine, rows, batch_size, on_conflict, started, progress)
+
+        with Session(engine) as session:
+            category_summary.rebuild(session)
+            session.commit()
+
+    elapsed = time.perf_counter() - started
+    return {**counts, "seconds": elapsed, "rows_per_second": processed / elapsed if elapsed else 0.0}
+
+
+@contextmanager
+def _search_index_deferred(engine, defer: bool) -> Iterator[None]:
+    from database import search_backend
+
+    with engine.begin() as connection:
+        suspended = defer and search_backend.suspend(connection)
+    try:
+        yield
+    finally:
+        if suspended:
+            with engine.begin() as connection:
+                search_backend.install(connection)
+                search_backend.rebuild(connection)
+
+
+def _load_batches(engine, rows, batch_size, on_conflict, started, progress) -> tuple[dict[str, int], int]:
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    processed = 0
+
+    for batch in _batches(iter(rows), batch_size):
+        prepared = {row["name"]: row for row in map(_prepare, batch)}
+        with engine.begin() as connection:
+            existing = dict(
+                connection.execute(select(Sweet.name, Sweet.id).where(Sweet.name.in_(list(prepared)))).all()
+            )
+
+            new_rows = [_with_default_image(row) for name, row in prepared.items() if name not in existing]
+            if new_rows:
+                _insert_rows(connection, new_rows)
+
+            changed = 0
+            if existing and on_conflict == "update":
+                params = [
+                    {
+                        "sweet_id": sweet_id,
+                        **{f"new_{key}": value for key, value in prepared[name].items() if key != "name"},
+                    }
+                    for name, sweet_id in existing.items()
+                ]
+                changed = connection.execute(_update_statement(), params).rowcount
+                # Some drivers can't count executemany rows
+                changed = len(params) if changed < 0 else changed
+
+        counts["inserted"] += len(new_rows)
+        counts["updated"] += changed
+        counts["unchanged"] += len(existing) - changed
+        processed += len(batch)
+        if progress is not None:
+            elapsed = time.perf_counter() - started
+            progress(f"{processed} rows ({processed / elapsed if elapsed else 0:.0f} rows/s)")
+
+    return counts, processed
+
+
+def parse_categories(spec: str) -> dict[str, float]:
+    """"Indian=3,Candy=1" -> {"Indian": 3.0, "Candy": 1.0}; a bare name has weight 1."""
+
+    weights = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight) if weight else 1.0
+    if not weights or any(w < 0 for w in weights.values()) or not sum(weights.values()):
+        raise ValueError(f"Invalid category weights: {spec!r}")
+    return weights
+
+
+def price_sampler(spec: str) -> Callable[[random.Random], float]:
+    """"uniform:LOW,HIGH", "normal:MEAN,STDDEV" or "lognormal:MU,SIGMA" -> a price sampler."""
+
+    kind, _, params = spec.partition(":")
+    try:
+        a, b = (float(p) for p in params.split(","))
+    except ValueError:
+        raise ValueError(f"Invalid price distribution: {spec!r}") from None
+
+    draw = {
+        "uniform": lambda rng: rng.uniform(a, b),
+        "normal": lambda rng: rng.normalvariate(a, b),
+        "lognormal": lambda rng: rng.lognormvariate(a, b),
+    }.get(kind)
+    if draw is None:
+        raise ValueError(f"Unknown price distribution {kind!r}; use uniform, normal or lognormal")
+    # Whole cents, never free
+    return lambda rng: max(0.25, round(draw(rng), 2))
+
+
+def generate_catalog(
+    count: int,
+    seed: int = 0,
+    categories: dict[str, float] | None = None,
+    prices: str = DEFAULT_PRICES,
+    max_quantity: int = 500,
+) -> Iterator[dict]:
+    """`count` synthetic sweets with unique names, deterministic for `seed`.
+
+    Raises ValueError for an invalid `prices` spec before any row is generated.
+    """
+
+    weights = categories or parse_categories(DEFAULT_CATEGORIES)
+    names = list(weights)
+    cumulative = list(accumulate(weights.values()))
+    price = price_sampler(prices)
+    width = max(6, int(math.log10(max(count, 1))) + 1)
+
+    def rows() -> Iterator[dict]:
+        rng = random.Random(seed)
+        for number in range(1, count + 1):
+            category = rng.choices(names, cum_weights=cumulative)[0]
+            yield {
+                "name": f"{rng.choice(_ADJECTIVES)} {category} {rng.choice(_FORMS)} {number:0{width}d}",
+                "category": category,
+                "price": price(rng),
+                "quantity": rng.randint(0, max_quantity),
+            }
+
+    return rows()
+
+
+def read_rows(path: str) -> Iterator[dict]:
+    """Rows from an NDJSON or CSV file, e.g. one written by `/sweets/export`."""
+
+    with open(path, newline="", encoding="utf-8") as handle:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(handle)
+        else:
+            yield from (json.loads(line) for line in handle if line.strip())
+
+
+def main() -> None:
+    from database import create_db_and_tables, engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=LOAD_BATCH_SIZE)
+    parser.add_argument("--on-conflict", choices=("update", "ignore"), default="update")
+    parser.add_argument("--defer-search-index", action="store_true", help="rebuild the search index once at the end")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    loader = subcommands.add_parser("load", help="load an NDJSON or CSV file")
+    loader.add_argument("path")
+    generator = subcommands.add_parser("generate", help="load a synthetic catalog")
+    generator.add_argument("count", type=int)
+    generator.add_argument("--seed", type=int, default=0)
+    generator.add_argument("--categories", default=DEFAULT_CATEGORIES, help="weighted, e.g. %(default)r")
+    generator.add_argument("--prices", default=DEFAULT_PRICES, help="uniform|normal|lognormal:A,B")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        try:
+            rows = generate_catalog(args.count, args.seed, parse_categories(args.categories), args.prices)
+        except ValueError as exc:
+            parser.error(str(exc))
+    else:
+        rows = read_rows(args.path)
+
+    create_db_and_tables()
+    report = load_sweets(
+        engine, rows, args.batch_size, args.on_conflict, defer_search_index=args.defer_search_index, progress=print
+    )
+    print(f"Inserted: {report['inserted']}")
+    print(f"Updated: {report['updated']}")
+    print(f"Unchanged: {report['unchanged']}")
+    print(f"Took {report['seconds']:.1f}s ({report['rows_per_second']:.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
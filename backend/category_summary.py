@@ -0,0 +1,67 @@
+"""Incrementally maintained category facets (distinct categories, counts, stock).
+
+The catalog write endpoints call `record_change` inside their own transaction,
+so `/sweets/categories` reads a handful of summary rows instead of running a
+`GROUP BY` over the whole sweet table on every request.
+"""
+
+from sqlalchemy import delete, func
+from sqlmodel import Session, select
+
+from database import upsert_increment
+from models import CategorySummary, Sweet, normalize_category
+
+
+def record_change(session: Session, category: str | None, items: int = 0, stock: int = 0) -> None:
+    """Apply an item-count / stock delta to `category`'s summary row (not committed)."""
+
+    if not items and not stock:
+        return
+    upsert_increment(
+        session,
+        CategorySummary,
+        key={"category_key": normalize_category(category)},
+        increments={"item_count": items, "total_stock": stock},
+        insert_values={"label": (category or "").strip()},
+    )
+
+
+def list_categories(session: Session) -> list[dict]:
+    statement = (
+        select(CategorySummary)
+        .where(CategorySummary.item_count > 0)
+        .order_by(CategorySummary.category_key)
+    )
+    return [
+        {
+            "category": row.category_key,
+            "label": row.label,
+            "item_count": row.item_count,
+            "total_stock": row.total_stock,
+        }
+        for row in session.exec(statement)
+    ]
+
+
+def rebuild(session: Session) -> int:
+    """Recompute every summary row from the sweet table (one-off, not per request).
+
+    Returns the number of categories written. The caller commits.
+    """
+
+    grouped = session.exec(
+        select(Sweet.category, func.count(), func.coalesce(func.sum(Sweet.quantity), 0))
+        .group_by(Sweet.category)
+        .order_by(Sweet.category)
+    ).all()
+
+    summaries: dict[str, CategorySummary] = {}
+    for category, item_count, total_stock in grouped:
+        key = normalize_category(category)
+        summary = summaries.setdefault(key, CategorySummary(category_key=key, label=(category or "").strip()))
+        summary.item_count += item_count
+        summary.total_stock += total_stock
+
+    session.exec(delete(CategorySummary))
+    session.add_all(summaries.values())
+    return len(summaries)
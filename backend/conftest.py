@@ -3,8 +3,13 @@ from fastapi.testclient import TestClient
 from sqlmodel import Session, SQLModel, create_engine
 from sqlmodel.pool import StaticPool
 from main import app
+from auth_cache import principal_cache
+from cache import catalog_cache
 from database import get_session
+from login_throttle import login_throttle
+from revocation import revocation_list
 from models import Sweet, User
+from security import create_access_token, get_password_hash
 
 # Import pytest, Session, SQLModel, create_engine, StaticPool
 # Import app from main, get_session from database
@@ -37,6 +42,23 @@ def client_fixture(session: Session):
         return session
 
     app.dependency_overrides[get_session] = get_session_override
+    # The catalog cache is process-wide; don't let entries leak between test databases.
+    catalog_cache.invalidate()
+    principal_cache.clear()
+    revocation_list.reset()
+    login_throttle.reset()
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()
+
+
+# Create a fixture "admin_headers" that inserts an admin directly (public
+# registration always creates customers) and returns its bearer auth header.
+
+@pytest.fixture(name="admin_headers")
+def admin_headers_fixture(session: Session):
+    admin = User(username="fixture_admin", password_hash=get_password_hash("adminpass"), role="admin")
+    session.add(admin)
+    session.commit()
+    token = create_access_token({"sub": admin.username, "role": admin.role})
+    return {"Authorization": f"Bearer {token}"}
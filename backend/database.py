@@ -1,8 +1,14 @@
 import os
-from sqlalchemy import text
-from sqlmodel import SQLModel, create_engine, Session
+from sqlalchemy import insert as insert_, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import create_engine, Session
 from dotenv import load_dotenv
 
+import migrations
+from pool_metrics import PoolMetrics, TimedQueuePool
+from search_index import attach_to_table, backend_for_dialect
+from sqlite_tuning import apply_profile, log_effective_pragmas
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -16,74 +22,193 @@ connect_args = {}
 if DATABASE_URL.startswith("sqlite"):
     connect_args = {"check_same_thread": False}
 
+# Connection pool settings (PostgreSQL and file-backed SQLite)
+POOL_SETTINGS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),            # Number of connections to maintain
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),     # Max connections beyond pool_size
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),   # Seconds to wait for a free connection
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "-1")),     # Reconnect after this many seconds (-1: never)
+}
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() in ("1", "true", "yes")
+
+pool_metrics = PoolMetrics()
+
 # Create engine with connection pooling for PostgreSQL
 if DATABASE_URL.startswith("postgresql"):
     engine = create_engine(
         DATABASE_URL,
-        pool_pre_ping=True,  # Verify connections before using them
-        pool_size=5,         # Number of connections to maintain
-        max_overflow=10      # Max connections beyond pool_size
+        poolclass=TimedQueuePool,
+        pool_pre_ping=DB_POOL_PRE_PING,  # Verify connections before using them
+        **POOL_SETTINGS,
     )
+elif DATABASE_URL.startswith("sqlite") and DATABASE_URL not in ("sqlite://", "sqlite:///:memory:"):
+    engine = create_engine(DATABASE_URL, connect_args=connect_args, poolclass=TimedQueuePool, **POOL_SETTINGS)
 else:
     engine = create_engine(DATABASE_URL, connect_args=connect_args)
 
+pool_metrics.attach(engine.pool)
+
+# Optional read replica for the catalog GET endpoints (see read_routing.py)
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+
+read_engine = None
+if DATABASE_READ_URL:
+    if DATABASE_READ_URL.startswith("postgresql"):
+        read_engine = create_engine(DATABASE_READ_URL, pool_pre_ping=DB_POOL_PRE_PING, **POOL_SETTINGS)
+    else:
+        read_engine = create_engine(DATABASE_READ_URL, connect_args={"check_same_thread": False}, **POOL_SETTINGS)
+        apply_profile(read_engine, serialize_writes=False)
+
+# WAL, busy_timeout, mmap... on file-backed SQLite (see sqlite_tuning.py)
+apply_profile(engine)
+
+# Text search backend for this database's dialect (FTS5 / pg_trgm / ilike)
+search_backend = backend_for_dialect(engine.dialect.name)
+attach_to_table(search_backend)
+
 def get_session():
     with Session(engine) as session:
         yield session
 
-def _ensure_sweets_image_url_column() -> None:
-    """Ensure the `sweet` table has an `image_url` column.
+# Async mode (ASYNC_DB=1): the catalog and purchase endpoints are served as
+# `async def` on an AsyncEngine (aiosqlite / asyncpg) instead of from the threadpool.
+ASYNC_DB = os.getenv("ASYNC_DB", "0").lower() in ("1", "true", "yes")
+
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def async_database_url(url: str = DATABASE_URL) -> str:
+    scheme, sep, rest = url.partition("://")
+    return _ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+_async_engine = None
+_async_read_engine = None
+
+
+def _create_async_engine(url: str):
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    if url.startswith("postgresql"):
+        return create_async_engine(url, pool_pre_ping=DB_POOL_PRE_PING, **POOL_SETTINGS)
+    engine = create_async_engine(url)
+    # The write lock is thread-based; async sessions all share the event loop thread
+    apply_profile(engine.sync_engine, serialize_writes=False)
+    return engine
+
+
+def get_async_engine():
+    """The shared AsyncEngine, created on first use so aiosqlite/asyncpg are
+    only required when async mode is on."""
+
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = _create_async_engine(os.getenv("ASYNC_DATABASE_URL") or async_database_url())
+    return _async_engine
+
 
-    SQLModel won't auto-migrate existing tables when models change, so
-    we do a tiny, safe migration on startup.
+def get_async_read_engine():
+    """Async twin of `read_engine`: None without `DATABASE_READ_URL`, else created on first use."""
+
+    global _async_read_engine
+    if _async_read_engine is None and DATABASE_READ_URL:
+        _async_read_engine = _create_async_engine(
+            os.getenv("ASYNC_DATABASE_READ_URL") or async_database_url(DATABASE_READ_URL)
+        )
+    return _async_read_engine
+
+
+def is_read_engine(bind) -> bool:
+    """Whether `bind` is the read replica (for async sessions, the engine behind `run_sync`)."""
+
+    if bind is None:
+        return False
+    return bind is read_engine or (_async_read_engine is not None and bind is _async_read_engine.sync_engine)
+
+
+async def get_async_session():
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    async with AsyncSession(get_async_engine()) as session:
+        yield session
+
+def upsert_increments(
+    session: Session, model, key_columns: list[str], increment_columns: list[str], rows: list[dict]
+) -> None:
+    """Add each row's `increment_columns` to the stored row with the same key,
+    inserting rows that don't exist yet.
+
+    One multi-row `INSERT ... ON CONFLICT DO UPDATE` statement on SQLite and
+    PostgreSQL, so concurrent writers can't lose updates or race on the first
+    insert. Keys must be unique within `rows`.
     """
 
-    with engine.connect() as connection:
-        # Check database type and use appropriate query
-        if DATABASE_URL.startswith("sqlite"):
-            # SQLite: Use PRAGMA to check columns
-            columns = connection.execute(text("PRAGMA table_info('sweet')")).fetchall()
-            column_names = {row[1] for row in columns}  # row[1] is column name
-        else:
-            # PostgreSQL: Query information_schema
-            result = connection.execute(text(
-                "SELECT column_name FROM information_schema.columns "
-                "WHERE table_name = 'sweet'"
-            )).fetchall()
-            column_names = {row[0] for row in result}
+    if not rows:
+        return
+
+    table = model.__table__
+    dialect = session.get_bind().dialect.name
 
-        if "image_url" not in column_names:
-            connection.execute(text("ALTER TABLE sweet ADD COLUMN image_url VARCHAR"))
-            connection.commit()
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={name: table.c[name] + statement.excluded[name] for name in increment_columns},
+        )
+        session.exec(statement)
+        return
 
+    for row in rows:
+        updated = session.exec(
+            update(table)
+            .where(*[table.c[name] == row[name] for name in key_columns])
+            .values({name: table.c[name] + row[name] for name in increment_columns})
+        )
+        if updated.rowcount == 0:
+            session.exec(insert_(table).values(**row))
 
-def _ensure_users_email_column() -> None:
-    """Ensure the `user` table has an `email` column.
+def insert_ignoring_conflicts(session: Session, model, rows: list[dict]) -> int:
+    """Insert `rows`, skipping any that violate a unique constraint; returns how many were inserted.
 
-    SQLModel won't auto-migrate existing tables when models change, so
-    we do a tiny, safe migration on startup.
+    One multi-row `INSERT ... ON CONFLICT DO NOTHING` on SQLite and PostgreSQL;
+    elsewhere each row is tried in its own savepoint.
     """
 
-    with engine.connect() as connection:
-        if DATABASE_URL.startswith("sqlite"):
-            columns = connection.execute(text("PRAGMA table_info('user')")).fetchall()
-            column_names = {row[1] for row in columns}
+    if not rows:
+        return 0
+
+    table = model.__table__
+    dialect = session.get_bind().dialect.name
+
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
         else:
-            result = connection.execute(
-                text(
-                    "SELECT column_name FROM information_schema.columns "
-                    "WHERE table_name = 'user'"
-                )
-            ).fetchall()
-            column_names = {row[0] for row in result}
-
-        if "email" not in column_names:
-            # NOTE: We intentionally do not add a UNIQUE constraint here to avoid
-            # breaking existing data / requiring complex migrations.
-            connection.execute(text('ALTER TABLE "user" ADD COLUMN email VARCHAR'))
-            connection.commit()
+            from sqlalchemy.dialects.postgresql import insert
+        return session.exec(insert(table).values(rows).on_conflict_do_nothing()).rowcount
+
+    inserted = 0
+    for row in rows:
+        try:
+            with session.begin_nested():
+                session.exec(insert_(table).values(**row))
+            inserted += 1
+        except IntegrityError:
+            pass
+    return inserted
+
+def upsert_increment(session: Session, model, key: dict, increments: dict, insert_values: dict | None = None) -> None:
+    """Single-row `upsert_increments`; `insert_values` are only used on insert."""
+
+    row = {**key, **(insert_values or {}), **increments}
+    upsert_increments(session, model, list(key), list(increments), [row])
 
 def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
-    _ensure_sweets_image_url_column()
-    _ensure_users_email_column()
+    """Bring the schema up to date; on a warm start this is one indexed read."""
+
+    migrations.migrate(engine)
+    log_effective_pragmas(engine)
@@ -0,0 +1,64 @@
+"""Streaming catalog export (NDJSON / CSV) for nightly snapshots.
+
+Rows are read as plain column tuples with `yield_per`, which uses a server-side
+cursor where the driver supports one, and are encoded one batch at a time.
+Memory therefore stays flat and the first bytes go out before the whole table
+has been read.
+"""
+
+import csv
+import io
+import json
+from typing import Iterator
+
+from sqlalchemy import select
+from sqlmodel import Session
+
+from models import Sweet
+from pagination import SWEET_FIELDS
+
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _batches(session: Session, batch_size: int) -> Iterator[list[tuple]]:
+    statement = (
+        select(*[getattr(Sweet, name) for name in SWEET_FIELDS])
+        .order_by(Sweet.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for partition in session.exec(statement).partitions():
+        yield partition
+
+
+def ndjson_chunks(session: Session, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    for batch in _batches(session, batch_size):
+        yield "".join(
+            json.dumps(dict(zip(SWEET_FIELDS, row)), separators=(",", ":")) + "\n" for row in batch
+        ).encode()
+
+
+def csv_chunks(session: Session, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(SWEET_FIELDS)
+    for batch in _batches(session, batch_size):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    # Header only, for an empty catalog
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+EXPORT_WRITERS = {
+    "ndjson": ndjson_chunks,
+    "csv": csv_chunks,
+}
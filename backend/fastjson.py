@@ -0,0 +1,33 @@
+"""Fast JSON encoding for the catalog read endpoints.
+
+With `FAST_JSON_RESPONSES=1` the list and detail endpoints encode their rows
+(plain dicts built from column tuples) straight to bytes with orjson and skip
+response-model validation. The output is equivalent JSON to what FastAPI's
+default `JSONResponse` produces for the same rows (compact separators, UTF-8,
+the model's field order), but not always the same bytes: orjson writes some
+floats differently (e.g. `1e16` rather than `1e+16`). Without orjson installed
+the stdlib encoder is used with the default response's settings.
+"""
+
+import json
+import os
+from typing import Any
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+FAST_JSON_RESPONSES = os.getenv("FAST_JSON_RESPONSES", "0").lower() in ("1", "true", "yes")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_response(body: bytes, headers: dict[str, str] | None = None) -> Response:
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,164 @@
+"""Stock changes applied as single conditional statements.
+
+`purchase` decrements with one `UPDATE ... WHERE quantity >= :q RETURNING`,
+so the stock check and the write are atomic: two concurrent buyers can't
+both pass the check and oversell. `checkout` does the same for a whole
+order with one bulk `UPDATE ... CASE`. The failure reason (404 vs. out of
+stock) is only looked up after an update has matched no row.
+"""
+
+from sqlalchemy import case, update
+from sqlmodel import Session, select
+
+import category_summary
+from models import Sweet, normalize_category
+from sales import Sale, record_sales
+
+
+class InventoryError(Exception):
+    status_code = 400
+
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+class SweetNotFound(InventoryError):
+    status_code = 404
+
+    def __init__(self, detail: str = "Sweet not found"):
+        super().__init__(detail)
+
+
+class InsufficientStock(InventoryError):
+    pass
+
+
+def supports_update_returning(session: Session) -> bool:
+    return bool(getattr(session.get_bind().dialect, "update_returning", False))
+
+
+def _stock_failure(session: Session, sweet_id: int) -> InventoryError:
+    """Explain why a conditional decrement matched no row."""
+
+    current = session.exec(select(Sweet.quantity).where(Sweet.id == sweet_id)).first()
+    if current is None:
+        return SweetNotFound()
+    if current <= 0:
+        return InsufficientStock("Out of stock")
+    return InsufficientStock("Not enough stock")
+
+
+def _decrement_statement(wanted: dict[int, int]):
+    ids = sorted(wanted)
+    if len(ids) == 1:
+        amount = wanted[ids[0]]
+    else:
+        amount = case(wanted, value=Sweet.id)
+
+    return (
+        update(Sweet)
+        .where(Sweet.id.in_(ids), Sweet.quantity >= amount)
+        .values(quantity=Sweet.quantity - amount)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _decrement(session: Session, wanted: dict[int, int]) -> dict[int, tuple[int, str, float]]:
+    """Conditionally take `wanted[id]` units from each sweet in one UPDATE.
+
+    Returns `{id: (remaining, category, price)}` for the rows that had enough
+    stock; rows that didn't are left untouched.
+    """
+
+    if supports_update_returning(session):
+        statement = _decrement_statement(wanted).returning(Sweet.id, Sweet.quantity, Sweet.category, Sweet.price)
+        rows = session.exec(statement).all()
+    else:
+        # No RETURNING: a short rowcount wouldn't say which row matched nothing,
+        # so take each sweet with its own conditional UPDATE, in id order, and
+        # stop at the first failure (the caller will roll back anyway). Updated
+        # rows are now write-locked by us, so re-reading them is safe.
+        taken = []
+        for sweet_id in sorted(wanted):
+            if session.exec(_decrement_statement({sweet_id: wanted[sweet_id]})).rowcount == 0:
+                break
+            taken.append(sweet_id)
+        rows = []
+        if taken:
+            rows = session.exec(
+                select(Sweet.id, Sweet.quantity, Sweet.category, Sweet.price).where(Sweet.id.in_(taken))
+            ).all()
+
+    return {sweet_id: (remaining, category, price) for sweet_id, remaining, category, price in rows}
+
+
+def record_sold(session: Session, sales: list[Sale]) -> None:
+    """Book sold stock: category facet totals plus the sales ledger/rollups."""
+
+    by_category: dict[str, tuple[str, int]] = {}
+    for sale in sales:
+        key = normalize_category(sale.category)
+        label, taken = by_category.get(key, (sale.category, 0))
+        by_category[key] = (label, taken + sale.quantity)
+
+    for label, taken in by_category.values():
+        category_summary.record_change(session, label, stock=-taken)
+    record_sales(session, sales)
+
+
+def _sales(wanted: dict[int, int], updated: dict[int, tuple[int, str, float]]) -> list[Sale]:
+    return [Sale(sweet_id, category, wanted[sweet_id], price) for sweet_id, (_, category, price) in updated.items()]
+
+
+def purchase(session: Session, sweet_id: int, quantity: int) -> int:
+    """Take `quantity` units of a sweet; returns the remaining stock.
+
+    Raises `SweetNotFound` / `InsufficientStock` with the API's error details.
+    The caller commits.
+    """
+
+    if quantity <= 0:
+        if session.exec(select(Sweet.id).where(Sweet.id == sweet_id)).first() is None:
+            raise SweetNotFound()
+        raise InventoryError("Quantity must be positive")
+
+    updated = _decrement(session, {sweet_id: quantity})
+    if sweet_id not in updated:
+        raise _stock_failure(session, sweet_id)
+
+    record_sold(session, _sales({sweet_id: quantity}, updated))
+    return updated[sweet_id][0]
+
+
+def checkout(session: Session, lines: list[tuple[int, int]]) -> dict[int, int]:
+    """Take stock for every `(sweet_id, quantity)` line, all or nothing.
+
+    Duplicate lines are merged. Rows are locked in id order before the single
+    bulk UPDATE, so concurrent checkouts always lock in the same order and
+    can't deadlock. Returns `{sweet_id: remaining}`. On any failure the error
+    names the offending sweet and the caller must roll back.
+    """
+
+    if not lines:
+        raise InventoryError("Order has no items")
+
+    wanted: dict[int, int] = {}
+    for sweet_id, quantity in lines:
+        if quantity <= 0:
+            raise InventoryError(f"Quantity must be positive (sweet_id={sweet_id})")
+        wanted[sweet_id] = wanted.get(sweet_id, 0) + quantity
+
+    ids = sorted(wanted)
+    # FOR UPDATE in id order on PostgreSQL; SQLite serializes writers anyway.
+    session.exec(select(Sweet.id).where(Sweet.id.in_(ids)).order_by(Sweet.id).with_for_update()).all()
+
+    updated = _decrement(session, wanted)
+    for sweet_id in ids:
+        if sweet_id not in updated:
+            failure = _stock_failure(session, sweet_id)
+            failure.detail = f"{failure.detail} (sweet_id={sweet_id})"
+            raise failure
+
+    record_sold(session, _sales(wanted, updated))
+    return {sweet_id: values[0] for sweet_id, values in updated.items()}
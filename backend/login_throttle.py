@@ -0,0 +1,206 @@
+"""Login throttling that runs before any password hashing.
+
+Every `/auth/login` attempt takes one token from two buckets: one for the
+submitted username and one for the client IP. A bucket holds up to `burst`
+tokens and refills at `per_minute`. If either bucket is empty, the attempt
+gets a 429 with `Retry-After` before the user row is even read. A
+credential-stuffing burst therefore costs neither database work nor bcrypt
+CPU.
+
+Backends:
+
+- `memory` (default): per-worker buckets in a size-bounded LRU. Evicting a
+  bucket forgets it, so memory stays flat even when attackers rotate
+  usernames.
+- `db`: buckets in the `loginthrottlebucket` table, so the limits hold
+  across all uvicorn workers. Each check costs, per key, one
+  `INSERT ... ON CONFLICT DO NOTHING` (so concurrent first attempts can't
+  collide), one locked row read and one write.
+- `off`: no throttling.
+"""
+
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import NamedTuple
+
+from sqlalchemy import delete
+from sqlmodel import Session, select
+
+from database import insert_ignoring_conflicts
+from models import LoginThrottleBucket
+
+LOGIN_THROTTLE_BACKEND = os.getenv("LOGIN_THROTTLE_BACKEND", "memory")
+LOGIN_USER_BURST = int(os.getenv("LOGIN_USER_BURST", "5"))
+LOGIN_USER_PER_MINUTE = float(os.getenv("LOGIN_USER_PER_MINUTE", "5"))
+LOGIN_IP_BURST = int(os.getenv("LOGIN_IP_BURST", "20"))
+LOGIN_IP_PER_MINUTE = float(os.getenv("LOGIN_IP_PER_MINUTE", "20"))
+LOGIN_THROTTLE_MAX_KEYS = int(os.getenv("LOGIN_THROTTLE_MAX_KEYS", "100000"))
+
+
+class Limit(NamedTuple):
+    burst: int
+    per_minute: float
+
+    def refill(self, tokens: float, elapsed: float) -> float:
+        return min(self.burst, tokens + elapsed * self.per_minute / 60)
+
+    def retry_after(self, tokens: float) -> float:
+        return (1 - tokens) * 60 / self.per_minute
+
+
+class LoginThrottled(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("Too many login attempts")
+        self.retry_after = retry_after
+
+
+class ThrottleBackend(ABC):
+    name: str
+
+    @abstractmethod
+    def take(self, session: Session, key: str, limit: Limit, now: float) -> float:
+        """Take one token from `key`'s bucket; returns 0 if allowed, else seconds until one is available."""
+
+    def clear(self) -> None:
+        pass
+
+    def stats(self) -> dict[str, int]:
+        return {}
+
+
+class MemoryBuckets(ThrottleBackend):
+    name = "memory"
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        # key -> (tokens, updated_at)
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def take(self, session: Session, key: str, limit: Limit, now: float) -> float:
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (limit.burst, now))
+            tokens = limit.refill(tokens, now - updated_at)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = limit.retry_after(tokens)
+
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+            return wait
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"keys": len(self._buckets), "max_keys": self.max_keys, "evictions": self.evictions}
+
+
+class DatabaseBuckets(ThrottleBackend):
+    """Buckets shared through the database. The caller commits right after
+    `check`, so the attempt is counted even when the login then fails."""
+
+    name = "db"
+
+    # Every this many checks, drop rows of buckets idle long enough to be full again
+    PRUNE_EVERY = 1000
+    PRUNE_IDLE_SECONDS = 24 * 3600
+
+    def __init__(self):
+        self._checks = 0
+
+    def take(self, session: Session, key: str, limit: Limit, now: float) -> float:
+        # FOR UPDATE can't lock a row that doesn't exist yet: create it first
+        insert_ignoring_conflicts(session, LoginThrottleBucket, [{"key": key, "tokens": limit.burst, "updated_at": now}])
+        bucket = session.exec(
+            select(LoginThrottleBucket).where(LoginThrottleBucket.key == key).with_for_update()
+        ).one()
+
+        tokens = limit.refill(bucket.tokens, now - bucket.updated_at)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = limit.retry_after(tokens)
+
+        bucket.tokens = tokens
+        bucket.updated_at = now
+        session.add(bucket)
+
+        self._checks += 1
+        if self._checks % self.PRUNE_EVERY == 0:
+            session.exec(
+                delete(LoginThrottleBucket).where(LoginThrottleBucket.updated_at < now - self.PRUNE_IDLE_SECONDS)
+            )
+        return wait
+
+
+USER_LIMIT = Limit(LOGIN_USER_BURST, LOGIN_USER_PER_MINUTE)
+IP_LIMIT = Limit(LOGIN_IP_BURST, LOGIN_IP_PER_MINUTE)
+
+
+class LoginThrottle:
+    def __init__(self, backend: ThrottleBackend | None, user_limit: Limit = USER_LIMIT, ip_limit: Limit = IP_LIMIT):
+        self.backend = backend
+        self.user_limit = user_limit
+        self.ip_limit = ip_limit
+        self.allowed = 0
+        self.rejected_by_user = 0
+        self.rejected_by_ip = 0
+
+    def check(self, session: Session, username: str, client_ip: str | None) -> None:
+        """Count one login attempt; raises `LoginThrottled` when over either limit."""
+
+        if self.backend is None:
+            return
+
+        now = time.time()
+        # Both buckets are charged, so a blocked IP can't keep draining usernames for free
+        user_wait = self.backend.take(session, f"user:{username.lower()}", self.user_limit, now)
+        ip_wait = self.backend.take(session, f"ip:{client_ip or 'unknown'}", self.ip_limit, now)
+
+        if user_wait:
+            self.rejected_by_user += 1
+        elif ip_wait:
+            self.rejected_by_ip += 1
+        else:
+            self.allowed += 1
+
+        if user_wait or ip_wait:
+            raise LoginThrottled(max(user_wait, ip_wait))
+
+    def reset(self) -> None:
+        self.allowed = self.rejected_by_user = self.rejected_by_ip = 0
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> dict[str, int | str]:
+        return {
+            "backend": self.backend.name if self.backend is not None else "off",
+            "allowed": self.allowed,
+            "rejected_by_user": self.rejected_by_user,
+            "rejected_by_ip": self.rejected_by_ip,
+            **(self.backend.stats() if self.backend is not None else {}),
+        }
+
+
+def _backend_from_env() -> ThrottleBackend | None:
+    if LOGIN_THROTTLE_BACKEND == "off":
+        return None
+    if LOGIN_THROTTLE_BACKEND == "db":
+        return DatabaseBuckets()
+    return MemoryBuckets(LOGIN_THROTTLE_MAX_KEYS)
+
+
+login_throttle = LoginThrottle(_backend_from_env())
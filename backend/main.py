@@ -1,15 +1,82 @@
+import math
+import os
 from contextlib import asynccontextmanager
+from datetime import datetime
 from typing import Any
-from fastapi import FastAPI, Depends, HTTPException, Header
+from fastapi import FastAPI, Depends, HTTPException, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy import or_
+from anyio import to_thread
+from sqlalchemy import select as sa_select
+from sqlalchemy.exc import IntegrityError
+from jose import jwt
 from sqlmodel import Session, select
-from database import create_db_and_tables, get_session
-from models import Sweet, User, UserRegister, AdminInit, AdminPasswordReset
-from security import get_password_hash, verify_password, create_access_token
+from sqlmodel.ext.asyncio.session import AsyncSession
+import category_summary
+import fastjson
+import inventory
+import refresh_tokens
+import sales
+from cache import catalog_cache
+from database import (
+    ASYNC_DB,
+    create_db_and_tables,
+    engine,
+    get_async_session,
+    get_session,
+    pool_metrics,
+    search_backend,
+)
+from export import EXPORT_MEDIA_TYPES, EXPORT_WRITERS
+from fastjson import FAST_JSON_RESPONSES
+from inventory import InventoryError
+from login_throttle import LoginThrottled, login_throttle
+from purchase_batching import purchase_combiner
+from read_routing import (
+    STICKY_HEADER,
+    ReadYourWritesMiddleware,
+    get_async_read_session,
+    get_read_session,
+    read_source,
+    replica_health,
+)
+from refresh_tokens import InvalidRefreshToken
+from models import (
+    AdminInit,
+    AdminPasswordReset,
+    CheckoutRequest,
+    LogoutRequest,
+    RefreshRequest,
+    Sweet,
+    SweetRead,
+    User,
+    UserRegister,
+    normalize_category,
+)
+from pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    ORDER_KEYS,
+    SWEET_FIELDS,
+    apply_keyset,
+    count_statement,
+    decode_cursor,
+    next_cursor,
+    parse_fields,
+)
+from security import (
+    PasswordHashingBusy,
+    create_access_token,
+    get_password_hash,
+    password_hasher,
+    verify_and_update_password,
+)
 from security import SECRET_KEY
-from auth_dependencies import get_current_admin
+from auth_cache import principal_cache
+from auth_dependencies import get_current_admin, get_current_user, oauth2_scheme
+from revocation import revocation_list
+from sweet_images import default_image_url_for_category
 
 # Import FastAPI, Depends, SQLModel, Session, select, asynccontextmanager
 # Import create_db_and_tables, get_session from database
@@ -18,10 +85,16 @@ from auth_dependencies import get_current_admin
 # Define lifespan(app: FastAPI): create_db_and_tables() on startup
 # Initialize app = FastAPI(lifespan=lifespan)
 
+# Worker threads for sync (`def`) endpoints and dependencies; anyio's default is 40
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "0"))
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    if THREADPOOL_SIZE > 0:
+        to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
     create_db_and_tables()
     yield
+    password_hasher.shutdown()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -39,27 +112,40 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all methods (GET, POST, etc.)
     allow_headers=["*"],  # Allow all headers
+    expose_headers=["X-Next-Cursor", "X-Total-Count", STICKY_HEADER],  # Pagination, read-your-writes
 )
 
+# Read-your-writes cookie for replica routing (no-op without DATABASE_READ_URL)
+app.add_middleware(ReadYourWritesMiddleware)
 
-def _default_image_url_for_category(category: str | None) -> str | None:
-    if not category:
-        return None
-
-    normalized = category.strip().lower().replace(" ", "_")
-    mapping: dict[str, str] = {
-        # Defaults point to assets in `frontend/public/sweets/`
-        "indian": "/sweets/gulab_jamun.jpg",
-        "chocolate": "/sweets/dark_chocolate_bark.jpg",
-        "candy": "/sweets/gummy_bears.jpg",
-        "cake": "/sweets/red_velvet_cupcake.webp",
-        "cookie": "/sweets/chocochip_cookies.jpg",
-        "cookies": "/sweets/chocochip_cookies.jpg",
-        "ice_cream": "/sweets/ice_cream.svg",
-        "ice-cream": "/sweets/ice_cream.svg",
-        "icecream": "/sweets/ice_cream.svg",
-    }
-    return mapping.get(normalized)
+
+@app.exception_handler(LoginThrottled)
+def login_throttled_handler(request: Request, exc: LoginThrottled):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many login attempts, please retry later"},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+
+@app.exception_handler(PasswordHashingBusy)
+def password_hashing_busy_handler(request: Request, exc: PasswordHashingBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Authentication is busy, please retry shortly"},
+        headers={"Retry-After": "1"},
+    )
+
+
+def _register_if(enabled: bool, route):
+    """Apply the `route` decorator only when `enabled`.
+
+    The catalog and purchase endpoints each have a sync version and an async
+    twin (see ASYNC_DB); exactly one of them is registered, at the same
+    position, so route order is the same in both modes.
+    """
+
+    return route if enabled else (lambda endpoint: endpoint)
 
 @app.get("/")
 def read_root():
@@ -76,65 +162,247 @@ def create_sweet(
     admin: Any = Depends(get_current_admin)
 ):
     if not sweet.image_url:
-        sweet.image_url = _default_image_url_for_category(sweet.category)
+        sweet.image_url = default_image_url_for_category(sweet.category)
     session.add(sweet)
+    category_summary.record_change(session, sweet.category, items=1, stock=sweet.quantity)
     session.commit()
+    catalog_cache.invalidate()
     session.refresh(sweet)
     return sweet
 
-# Create GET /sweets/ endpoint:
-#   Takes session: Session = Depends(get_session)
-#   Returns list of sweets using session.exec(select(Sweet)).all()
+def _sweet_filters(
+    name: str | None = None,
+    category: str | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+) -> list:
+    filters = []
+
+    if name:
+        # Case-insensitive partial match, served by the text search index
+        filters.append(search_backend.name_filter(name))
+
+    if category:
+        # Exact match on the normalized key: an index range scan on (category_key, price)
+        keys = {normalize_category(c) for c in category.split(",")} - {""}
+        if keys:
+            filters.append(Sweet.category_key.in_(sorted(keys)))
 
-@app.get("/sweets/", response_model=list[Sweet])
-def read_sweets(session: Session = Depends(get_session)):
-    return session.exec(select(Sweet)).all()
+    if min_price is not None:
+        filters.append(Sweet.price >= min_price)
 
-@app.get("/sweets/search")
+    if max_price is not None:
+        filters.append(Sweet.price <= max_price)
+
+    return filters
+
+
+def _load_sweet_page(
+    session: Session,
+    filters: list,
+    rank: Any,
+    limit: int | None,
+    after: str | None,
+    order: str | None,
+    fields: str | None,
+    include_total: bool,
+) -> tuple[list[dict], dict[str, str]]:
+    """Run a catalog listing with optional keyset pagination and projection.
+
+    Without `limit`/`after` the whole (filtered) catalog is returned, as before.
+    The next page's cursor is returned in the `X-Next-Cursor` header;
+    `X-Total-Count` is only computed when `include_total` is set, since it
+    costs an extra count query. Rows are plain dicts so they can be cached.
+
+    `order=relevance` (the default for unpaginated name searches) sorts by
+    the search index's `rank`; it can be limited but not paged with a cursor.
+    A paginated request (`limit` or `after`) without an explicit order is
+    therefore ordered by id, so every page comes with its cursor.
+    """
+
+    if order is None:
+        order = "relevance" if rank is not None and limit is None and after is None else "id"
+
+    if order == "relevance":
+        if rank is None:
+            raise HTTPException(status_code=400, detail="order=relevance requires a name search")
+        if after:
+            raise HTTPException(status_code=400, detail="Cursor pagination requires order=id or order=price")
+    elif order not in ORDER_KEYS:
+        raise HTTPException(status_code=400, detail=f"order must be one of: {', '.join(ORDER_KEYS)}")
+
+    try:
+        columns = parse_fields(fields, order if order in ORDER_KEYS else "id")
+        cursor = decode_cursor(after, order) if after else None
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    # Plain column tuples: no per-row ORM object construction
+    statement = sa_select(*[getattr(Sweet, c) for c in columns or SWEET_FIELDS]).where(*filters)
+
+    headers: dict[str, str] = {}
+    if include_total:
+        headers["X-Total-Count"] = str(session.exec(count_statement(statement)).one())
+
+    paginated = False
+    if order == "relevance":
+        statement = statement.order_by(rank, Sweet.id)
+        if limit is not None:
+            statement = statement.limit(limit)
+    elif limit is not None or cursor is not None:
+        paginated = True
+        limit = limit or DEFAULT_PAGE_SIZE
+        statement = apply_keyset(statement, order, cursor, limit)
+    else:
+        statement = statement.order_by(*[getattr(Sweet, key) for key in ORDER_KEYS[order]])
+
+    rows = [dict(row) for row in session.exec(statement).mappings()]
+
+    if paginated:
+        cursor_out = next_cursor(rows, order, limit)
+        if cursor_out:
+            headers["X-Next-Cursor"] = cursor_out
+
+    return rows, headers
+
+
+def _cached_sweet_page(
+    session: Session, response: Response, key: str, filters: list, rank: Any, *page_args
+) -> Any:
+    if FAST_JSON_RESPONSES:
+        # Cache the encoded body so hits skip serialization entirely
+        def load_encoded() -> tuple[bytes, dict[str, str]]:
+            rows, headers = _load_sweet_page(session, filters, rank, *page_args)
+            return fastjson.dumps(rows), headers
+
+        body, headers = catalog_cache.get_or_load(key + ":json", load_encoded)
+        return fastjson.json_response(body, headers)
+
+    rows, headers = catalog_cache.get_or_load(key, lambda: _load_sweet_page(session, filters, rank, *page_args))
+    response.headers.update(headers)
+    return rows
+
+# Create GET /sweets/ endpoint:
+#   Returns the catalog, optionally paginated (limit/after) and projected (fields)
+
+@_register_if(not ASYNC_DB, app.get("/sweets/", response_model=list[SweetRead], response_model_exclude_unset=True))
+def read_sweets(
+    response: Response,
+    limit: int | None = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    after: str | None = None,
+    order: str = "id",
+    fields: str | None = None,
+    include_total: bool = False,
+    session: Session = Depends(get_read_session),
+):
+    page_args = (limit, after, order, fields, include_total)
+    key = catalog_cache.key(read_source(session), "sweets", *page_args)
+    return _cached_sweet_page(session, response, key, [], None, *page_args)
+
+@_register_if(ASYNC_DB, app.get("/sweets/", response_model=list[SweetRead], response_model_exclude_unset=True))
+async def read_sweets_async(
+    response: Response,
+    limit: int | None = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    after: str | None = None,
+    order: str = "id",
+    fields: str | None = None,
+    include_total: bool = False,
+    session: AsyncSession = Depends(get_async_read_session),
+):
+    return await session.run_sync(
+        lambda sync_session: read_sweets(response, limit, after, order, fields, include_total, session=sync_session)
+    )
+
+@_register_if(not ASYNC_DB, app.get("/sweets/search", response_model=list[SweetRead], response_model_exclude_unset=True))
 def search_sweets(
+    response: Response,
     name: str = None,
     category: str = None,
     min_price: float = None,
     max_price: float = None,
-    session: Session = Depends(get_session)
+    limit: int | None = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    after: str | None = None,
+    order: str | None = None,
+    fields: str | None = None,
+    include_total: bool = False,
+    session: Session = Depends(get_read_session)
 ):
-    # Start with a base select statement
-    statement = select(Sweet)
-
-    # Apply filters based on query parameters
-    if name:
-        # Use ilike for case-insensitive partial match
-        statement = statement.where(Sweet.name.ilike(f"%{name}%"))
-    
-    if category:
-        categories = [c.strip() for c in category.split(",") if c.strip()]
-        if len(categories) == 1:
-            statement = statement.where(Sweet.category.ilike(f"%{categories[0]}%"))
-        elif categories:
-            statement = statement.where(or_(*[Sweet.category.ilike(f"%{c}%") for c in categories]))
+    filters = _sweet_filters(name, category, min_price, max_price)
+    rank = search_backend.rank(name) if name else None
+    page_args = (limit, after, order, fields, include_total)
+    key = catalog_cache.key(read_source(session), "search", name, category, min_price, max_price, *page_args)
+    return _cached_sweet_page(session, response, key, filters, rank, *page_args)
+
+@_register_if(ASYNC_DB, app.get("/sweets/search", response_model=list[SweetRead], response_model_exclude_unset=True))
+async def search_sweets_async(
+    response: Response,
+    name: str = None,
+    category: str = None,
+    min_price: float = None,
+    max_price: float = None,
+    limit: int | None = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    after: str | None = None,
+    order: str | None = None,
+    fields: str | None = None,
+    include_total: bool = False,
+    session: AsyncSession = Depends(get_async_read_session),
+):
+    return await session.run_sync(
+        lambda sync_session: search_sweets(
+            response, name, category, min_price, max_price, limit, after, order, fields, include_total,
+            session=sync_session,
+        )
+    )
+
+# Declared before "/sweets/{sweet_id}" so "categories" isn't parsed as an id.
+@app.get("/sweets/categories")
+def read_sweet_categories(session: Session = Depends(get_session)):
+    """Distinct normalized categories with item counts and total stock."""
+
+    return catalog_cache.get_or_load(
+        catalog_cache.key("categories"), lambda: category_summary.list_categories(session)
+    )
+
+@app.get("/sweets/export")
+def export_sweets(
+    format: str = "ndjson",
+    session: Session = Depends(get_session),
+    admin: Any = Depends(get_current_admin),
+):
+    """Stream the full catalog as NDJSON or CSV with constant memory."""
 
-    if min_price is not None:
-        statement = statement.where(Sweet.price >= min_price)
+    if format not in EXPORT_WRITERS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_WRITERS)}")
 
-    if max_price is not None:
-        statement = statement.where(Sweet.price <= max_price)
-        
-    # Execute the query and fetch all results
-    sweets = session.exec(statement).all()
-    
-    return sweets
+    return StreamingResponse(
+        EXPORT_WRITERS[format](session),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="sweets.{format}"'},
+    )
 
 # Create a GET endpoint "/sweets/{sweet_id}"
 # Takes sweet_id: int and session: Session
 # Uses session.get(Sweet, sweet_id) to find the sweet
 # If not found, raise HTTPException status_code=404
 # Returns the sweet
-@app.get("/sweets/{sweet_id}")
-def read_sweet(sweet_id: int, session: Session = Depends(get_session)):
-    sweet = session.get(Sweet, sweet_id)
-    if not sweet:
-        raise HTTPException(status_code=404, detail="Sweet not found")
-    return sweet
+@_register_if(not ASYNC_DB, app.get("/sweets/{sweet_id}"))
+def read_sweet(sweet_id: int, session: Session = Depends(get_read_session)):
+    def load() -> dict:
+        statement = sa_select(*[getattr(Sweet, c) for c in SWEET_FIELDS]).where(Sweet.id == sweet_id)
+        sweet = session.exec(statement).mappings().first()
+        if not sweet:
+            raise HTTPException(status_code=404, detail="Sweet not found")
+        return dict(sweet)
+
+    key = catalog_cache.key(read_source(session), "sweet", sweet_id)
+    if FAST_JSON_RESPONSES:
+        body = catalog_cache.get_or_load(key + ":json", lambda: fastjson.dumps(load()))
+        return fastjson.json_response(body)
+    return catalog_cache.get_or_load(key, load)
+
+@_register_if(ASYNC_DB, app.get("/sweets/{sweet_id}"))
+async def read_sweet_async(sweet_id: int, session: AsyncSession = Depends(get_async_read_session)):
+    return await session.run_sync(lambda sync_session: read_sweet(sweet_id, session=sync_session))
 
 # Create a PUT endpoint "/sweets/{sweet_id}"
 # Takes sweet_id: int, sweet_update: Sweet, session: Session
@@ -153,15 +421,23 @@ def update_sweet(
     if not sweet:
         raise HTTPException(status_code=404, detail="Sweet not found")
     
+    old_category, old_quantity = sweet.category, sweet.quantity
     sweet_data = sweet_update.model_dump(exclude_unset=True)
     for key, value in sweet_data.items():
         setattr(sweet, key, value)
 
+    if normalize_category(old_category) != normalize_category(sweet.category):
+        category_summary.record_change(session, old_category, items=-1, stock=-old_quantity)
+        category_summary.record_change(session, sweet.category, items=1, stock=sweet.quantity)
+    else:
+        category_summary.record_change(session, sweet.category, stock=sweet.quantity - old_quantity)
+
     if not sweet.image_url:
-        sweet.image_url = _default_image_url_for_category(sweet.category)
+        sweet.image_url = default_image_url_for_category(sweet.category)
         
     session.add(sweet)
     session.commit()
+    catalog_cache.invalidate()
     session.refresh(sweet)
     return sweet
 
@@ -180,38 +456,96 @@ def delete_sweet(
     if not sweet:
         raise HTTPException(status_code=404, detail="Sweet not found")
     session.delete(sweet)
+    category_summary.record_change(session, sweet.category, items=-1, stock=-sweet.quantity)
     session.commit()
+    catalog_cache.invalidate()
     return {"ok": True}
 
-@app.post("/sweets/{sweet_id}/purchase")
+def _purchase(session: Session, sweet_id: int, quantity: int, group_commit: bool) -> dict:
+    try:
+        if group_commit and quantity > 0:
+            # Group commit: concurrent purchases of this sweet share one transaction
+            remaining = purchase_combiner.purchase(session, sweet_id, quantity)
+        else:
+            # One conditional UPDATE: the stock check and decrement can't race
+            remaining = inventory.purchase(session, sweet_id, quantity)
+            session.commit()
+    except InventoryError as exc:
+        session.rollback()
+        raise HTTPException(status_code=exc.status_code, detail=exc.detail)
+
+    catalog_cache.invalidate()
+    return {
+        "message": "Purchase successful",
+        "purchased_qty": quantity,
+        "remaining_stock": remaining,
+    }
+
+@_register_if(not ASYNC_DB, app.post("/sweets/{sweet_id}/purchase"))
 def purchase_sweet(
     sweet_id: int,
     quantity: int = 1,
     session: Session = Depends(get_session),
 ):
-    sweet = session.get(Sweet, sweet_id)
-    if not sweet:
-        raise HTTPException(status_code=404, detail="Sweet not found")
+    return _purchase(session, sweet_id, quantity, group_commit=purchase_combiner.enabled)
 
-    if quantity <= 0:
-        raise HTTPException(status_code=400, detail="Quantity must be positive")
+@_register_if(ASYNC_DB, app.post("/sweets/{sweet_id}/purchase"))
+async def purchase_sweet_async(
+    sweet_id: int,
+    quantity: int = 1,
+    session: AsyncSession = Depends(get_async_session),
+):
+    # No group commit here: the combiner blocks while a batch fills, which
+    # would stall the event loop. The single conditional UPDATE is used instead.
+    return await session.run_sync(lambda sync_session: _purchase(sync_session, sweet_id, quantity, group_commit=False))
 
-    if sweet.quantity <= 0:
-        raise HTTPException(status_code=400, detail="Out of stock")
+@_register_if(not ASYNC_DB, app.post("/orders/checkout"))
+def checkout(order: CheckoutRequest, session: Session = Depends(get_session)):
+    """Buy several sweets in one transaction: every line succeeds or none do."""
 
-    if quantity > sweet.quantity:
-        raise HTTPException(status_code=400, detail="Not enough stock")
+    lines = [(line.sweet_id, line.quantity) for line in order.items]
+    try:
+        remaining = inventory.checkout(session, lines)
+    except InventoryError as exc:
+        session.rollback()
+        raise HTTPException(status_code=exc.status_code, detail=exc.detail)
 
-    sweet.quantity -= quantity
-    session.add(sweet)
     session.commit()
-    session.refresh(sweet)
+    catalog_cache.invalidate()
     return {
-        "message": "Purchase successful",
-        "purchased_qty": quantity,
-        "remaining_stock": sweet.quantity,
+        "message": "Checkout successful",
+        "lines": [
+            {"sweet_id": sweet_id, "purchased_qty": quantity, "remaining_stock": remaining[sweet_id]}
+            for sweet_id, quantity in lines
+        ],
     }
 
+@_register_if(ASYNC_DB, app.post("/orders/checkout"))
+async def checkout_async(order: CheckoutRequest, session: AsyncSession = Depends(get_async_session)):
+    return await session.run_sync(lambda sync_session: checkout(order, session=sync_session))
+
+@app.get("/reports/sales")
+def sales_report(
+    granularity: str = "day",
+    scope: str = "category",
+    start: datetime | None = None,
+    end: datetime | None = None,
+    key: str | None = None,
+    session: Session = Depends(get_session),
+    admin: Any = Depends(get_current_admin),
+):
+    """Units and revenue per hour/day bucket, by sweet or by category.
+
+    Reads only the pre-aggregated rollups, never the purchase ledger.
+    """
+
+    if granularity not in sales.GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of: {', '.join(sales.GRANULARITIES)}")
+    if scope not in sales.SCOPES:
+        raise HTTPException(status_code=400, detail=f"scope must be one of: {', '.join(sales.SCOPES)}")
+
+    return sales.sales_report(session, granularity, scope, start, end, key)
+
 # Create a POST endpoint "/auth/register"
 # Takes user: User and session: Session
 # Check if a user with the same username already exists. If so, raise HTTPException 400.
@@ -220,24 +554,33 @@ def purchase_sweet(
 
 @app.post("/auth/register", response_model=User)
 def register_user(user_data: UserRegister, session: Session = Depends(get_session)):
-    existing_user = session.exec(select(User).where(User.username == user_data.username)).first()
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Username already exists")
-
-    existing_email = session.exec(select(User).where(User.email == user_data.email)).first()
-    if existing_email:
-        raise HTTPException(status_code=400, detail="Email already exists")
-    
     # bcrypt only uses the first 72 bytes; truncate to avoid ValueError for longer inputs
     hashed_password = get_password_hash(user_data.password[:72])
     # Public registration is always customer; admins are created separately.
     user = User(username=user_data.username, email=user_data.email, password_hash=hashed_password, role="customer")
     session.add(user)
+
+    # One INSERT: the unique username / lower(email) indexes reject duplicates
+    try:
+        session.flush()
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=400, detail=_registration_conflict(session, user_data))
+
+    # Detach with its attributes loaded, so returning it needs no SELECT after commit
+    session.expunge(user)
     session.commit()
-    session.refresh(user)
     return user
 
 
+def _registration_conflict(session: Session, user_data: UserRegister) -> str:
+    """Name the duplicate field; only runs after an INSERT has been rejected."""
+
+    if session.exec(select(User.id).where(User.username == user_data.username)).first() is not None:
+        return "Username already exists"
+    return "Email already exists"
+
+
 @app.post("/auth/init-admin", response_model=User)
 def init_admin(payload: AdminInit, session: Session = Depends(get_session)):
     """Create the very first admin account.
@@ -283,6 +626,8 @@ def dev_reset_admin_password(
 
     user.password_hash = get_password_hash(payload.new_password[:72])
     session.add(user)
+    # Sessions started with the old password must sign in again
+    refresh_tokens.revoke_user(session, user.id)
     session.commit()
     session.refresh(user)
     return user
@@ -290,19 +635,76 @@ def dev_reset_admin_password(
 
 @app.post("/auth/login")
 def login(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
     session: Session = Depends(get_session),
 ):
+    # Throttle before touching the user row or bcrypt; with the db backend the
+    # commit keeps the attempt counted even if it's rejected or the login fails
+    try:
+        login_throttle.check(session, form_data.username, request.client.host if request.client else None)
+    finally:
+        session.commit()
+
     user = session.exec(select(User).where(User.username == form_data.username)).first()
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
 
-    if not verify_password(form_data.password, user.password_hash):
+    verified, new_hash = verify_and_update_password(form_data.password, user.password_hash)
+    if not verified:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
 
-    # Include role so frontend can detect admin vs customer.
-    token = create_access_token({"sub": user.username, "role": user.role})
-    return {"access_token": token, "token_type": "bearer"}
+    if new_hash:
+        # Stored hash uses outdated settings (e.g. fewer bcrypt rounds): upgrade it
+        user.password_hash = new_hash
+        session.add(user)
+
+    # Include role so frontend can detect admin vs customer. Read before the
+    # commit expires `user`, which would cost another SELECT.
+    claims = {"sub": user.username, "role": user.role}
+    refresh_token = refresh_tokens.issue(session, user.id)
+    session.commit()
+
+    token = create_access_token(claims)
+    return {"access_token": token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+
+@app.post("/auth/refresh")
+def refresh(payload: RefreshRequest, session: Session = Depends(get_session)):
+    """Trade a refresh token for a new access token and a new refresh token.
+
+    No password hashing here: one conditional UPDATE and one INSERT.
+    """
+
+    try:
+        claims, refresh_token = refresh_tokens.rotate(session, payload.refresh_token)
+    except InvalidRefreshToken as exc:
+        # Keep the family revocation when a reused token was presented
+        session.commit()
+        raise HTTPException(status_code=401, detail=exc.detail)
+
+    session.commit()
+    token = create_access_token(claims)
+    return {"access_token": token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+@app.post("/auth/logout")
+def logout(
+    payload: LogoutRequest | None = None,
+    token: str = Depends(oauth2_scheme),
+    current_user: Any = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    """Revoke the presented access token and, if given, the refresh token's family
+    (only one of the caller's own)."""
+
+    if current_user.jti is not None:
+        # Already verified by get_current_user; only the expiry is needed here
+        expires_at = datetime.utcfromtimestamp(jwt.get_unverified_claims(token)["exp"])
+        revocation_list.revoke(session, current_user.jti, expires_at)
+    if payload is not None and payload.refresh_token:
+        refresh_tokens.revoke(session, payload.refresh_token, current_user.id)
+    session.commit()
+    return {"message": "Logged out"}
 
 @app.post("/sweets/{sweet_id}/restock")
 def restock_sweet(
@@ -321,7 +723,64 @@ def restock_sweet(
 
     sweet.quantity += quantity
     session.add(sweet)
+    category_summary.record_change(session, sweet.category, stock=quantity)
     session.commit()
+    catalog_cache.invalidate()
     session.refresh(sweet)
     
-    return {"message": f"Restocked {quantity} units.", "new_stock": sweet.quantity}
\ No newline at end of file
+    return {"message": f"Restocked {quantity} units.", "new_stock": sweet.quantity}
+
+@app.get("/internal/cache")
+def catalog_cache_stats(admin: Any = Depends(get_current_admin)):
+    """Hit/miss/eviction counters for the catalog read cache."""
+
+    return catalog_cache.stats()
+
+
+@app.get("/internal/purchase-batching")
+def purchase_batching_stats(admin: Any = Depends(get_current_admin)):
+    """Requests vs. group commits for the optional purchase write-combining."""
+
+    return purchase_combiner.stats()
+
+
+@app.get("/internal/password-hashing")
+def password_hashing_stats(admin: Any = Depends(get_current_admin)):
+    """Process-pool size and admission counters for bcrypt work."""
+
+    return password_hasher.stats()
+
+
+@app.get("/internal/auth-cache")
+def auth_cache_stats(admin: Any = Depends(get_current_admin)):
+    """Hit/miss counters for the token -> principal cache."""
+
+    return principal_cache.stats()
+
+
+@app.get("/internal/revocations")
+def revocation_stats(admin: Any = Depends(get_current_admin)):
+    """Size and refresh count of this worker's revoked-token mirror."""
+
+    return revocation_list.stats()
+
+
+@app.get("/internal/login-throttle")
+def login_throttle_stats(admin: Any = Depends(get_current_admin)):
+    """Allowed/rejected login attempts and bucket usage."""
+
+    return login_throttle.stats()
+
+
+@app.get("/internal/db-pool")
+def db_pool_stats(admin: Any = Depends(get_current_admin)):
+    """Pool occupancy now, plus checkout wait times and counters since startup."""
+
+    return pool_metrics.snapshot(engine.pool)
+
+
+@app.get("/internal/read-routing")
+def read_routing_stats(admin: Any = Depends(get_current_admin)):
+    """Where catalog reads went: replica, primary (sticky) or primary (fallback)."""
+
+    return replica_health.stats()
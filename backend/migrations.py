@@ -0,0 +1,260 @@
+"""Versioned schema migrations.
+
+`schema_version` records each applied migration. `migrate()` first reads
+the recorded versions, a single primary-key scan. When every migration is
+recorded (a warm start), nothing else runs. Otherwise each pending migration
+runs in its own transaction, together with the insert of its version row.
+On SQLite that is an explicit `BEGIN` (pysqlite would otherwise run DDL
+outside any transaction), so on both databases a failed migration leaves no
+partial schema behind.
+
+A step may return a reason when it could only partly apply (see
+`_add_user_unique_indexes`). What it did apply is committed, but its version
+is not recorded: it is logged as a warning and retried on the next
+`migrate()`, while later migrations still run.
+
+Databases created before this runner existed have no `schema_version`. They
+start at version 0, and every migration is written to be idempotent: it
+checks before it alters. The same steps therefore bring both a blank
+database and an old one up to date.
+
+To change the schema, append a migration to `MIGRATIONS`. `create_all`
+only creates tables that are missing at migration 1; later tables need their
+own migration. Run `python migrations.py` to apply pending migrations by hand.
+"""
+
+import logging
+import warnings
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Float, Index, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError, SAWarning
+from sqlalchemy.schema import CreateIndex
+from sqlmodel import Session, SQLModel
+
+from models import CategorySummary, Sweet, User, normalize_category
+
+logger = logging.getLogger("uvicorn.error")
+
+# Kept out of SQLModel.metadata, like the search index table.
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# For `user` tables that predate the unique username column. Built on a
+# detached copy of the table, so it never joins User.__table__ (or create_all).
+_USERNAME_INDEX = Index(
+    "ux_user_username", Table("user", MetaData(), Column("username", String)).c.username, unique=True
+)
+
+# Sweet indexes as each migration added them, on a detached copy of the table
+# too: migrations must not change when the model's __table_args__ do.
+_sweet = Table(
+    "sweet", MetaData(), Column("id", Integer), Column("name", String),
+    Column("price", Float), Column("category_key", String),
+)
+_SWEET_INDEXES = [
+    Index("ix_sweet_price_id", _sweet.c.price, _sweet.c.id),
+    Index("ix_sweet_category_key_price", _sweet.c.category_key, _sweet.c.price),
+]
+_SWEET_NAME_INDEX = Index("ix_sweet_name", _sweet.c.name)
+
+
+def _column_names(connection, table: str) -> set[str]:
+    # Check database type and use appropriate query
+    if connection.dialect.name == "sqlite":
+        # SQLite: Use PRAGMA to check columns
+        columns = connection.execute(text(f"PRAGMA table_info('{table}')")).fetchall()
+        return {row[1] for row in columns}  # row[1] is column name
+
+    # PostgreSQL: Query information_schema
+    result = connection.execute(
+        text("SELECT column_name FROM information_schema.columns WHERE table_name = :table"),
+        {"table": table},
+    ).fetchall()
+    return {row[0] for row in result}
+
+
+def _create_tables(connection) -> None:
+    # Also installs the search index on a new sweet table (search_index.attach_to_table)
+    SQLModel.metadata.create_all(connection)
+
+
+def _add_sweet_image_url(connection) -> None:
+    if "image_url" not in _column_names(connection, "sweet"):
+        connection.execute(text("ALTER TABLE sweet ADD COLUMN image_url VARCHAR"))
+
+
+def _add_user_email(connection) -> None:
+    if "email" not in _column_names(connection, "user"):
+        # Uniqueness comes from the ux_user_email_lower index (see _add_user_unique_indexes).
+        connection.execute(text('ALTER TABLE "user" ADD COLUMN email VARCHAR'))
+
+
+def _add_sweet_category_key(connection) -> None:
+    """Add `sweet.category_key` and backfill it with one UPDATE per distinct raw category."""
+
+    if "category_key" not in _column_names(connection, "sweet"):
+        connection.execute(text("ALTER TABLE sweet ADD COLUMN category_key VARCHAR"))
+
+    pending = connection.execute(
+        text("SELECT DISTINCT category FROM sweet WHERE category_key IS NULL")
+    ).scalars().all()
+    for category in pending:
+        connection.execute(
+            text("UPDATE sweet SET category_key = :key WHERE category = :category AND category_key IS NULL"),
+            {"key": normalize_category(category), "category": category},
+        )
+
+
+def _add_sweet_indexes(connection) -> None:
+    # create_all skips existing tables entirely, including their indexes.
+    for index in _SWEET_INDEXES:
+        index.create(bind=connection, checkfirst=True)
+
+
+def _add_sweet_name_index(connection) -> None:
+    _SWEET_NAME_INDEX.create(bind=connection, checkfirst=True)
+
+
+def _add_user_unique_indexes(connection) -> str | None:
+    """Unique username / lower(email) indexes for older `user` tables.
+
+    If existing rows already violate one (e.g. the same email in two cases),
+    it is skipped so startup still succeeds, and the migration stays pending:
+    every `migrate()` warns and retries it until the data is cleaned up.
+    """
+
+    with warnings.catch_warnings():
+        # Reflection can't describe the lower(email) expression index; that's fine here
+        warnings.simplefilter("ignore", SAWarning)
+        inspector = inspect(connection)
+        unique_columns = [c["column_names"] for c in inspector.get_unique_constraints("user")]
+        unique_columns += [i["column_names"] for i in inspector.get_indexes("user") if i["unique"]]
+
+    indexes = list(User.__table__.indexes)
+    if ["username"] not in unique_columns:
+        indexes.append(_USERNAME_INDEX)
+
+    skipped = []
+    for index in indexes:
+        try:
+            # Savepoint: a failed CREATE INDEX must not abort the migration's transaction
+            with connection.begin_nested():
+                connection.execute(CreateIndex(index, if_not_exists=True))
+        except IntegrityError as exc:
+            skipped.append(f"unique index {index.name}: existing rows conflict ({exc.orig})")
+    return "; ".join(skipped) or None
+
+
+def _install_search_index(connection) -> None:
+    from database import search_backend  # database imports this module
+
+    if search_backend.install(connection):
+        search_backend.rebuild(connection)
+
+
+def _backfill_category_summary(connection) -> None:
+    import category_summary
+
+    with Session(bind=connection) as session:
+        if session.exec(select(CategorySummary.category_key).limit(1)).first() is None:
+            if session.exec(select(Sweet.id).limit(1)).first() is not None:
+                category_summary.rebuild(session)
+                session.flush()
+
+
+# (version, name, step). Append only; never renumber or edit an applied step.
+MIGRATIONS = [
+    (1, "create tables", _create_tables),
+    (2, "sweet.image_url", _add_sweet_image_url),
+    (3, "user.email", _add_user_email),
+    (4, "sweet.category_key", _add_sweet_category_key),
+    (5, "sweet indexes", _add_sweet_indexes),
+    (6, "user unique indexes", _add_user_unique_indexes),
+    (7, "search index", _install_search_index),
+    (8, "category summary", _backfill_category_summary),
+    (9, "sweet name index", _add_sweet_name_index),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def applied_versions(connection) -> set[int]:
+    try:
+        return set(connection.execute(select(schema_version.c.version)).scalars())
+    except (OperationalError, ProgrammingError):
+        # No schema_version table yet
+        connection.rollback()
+        return set()
+
+
+def current_version(connection) -> int:
+    return max(applied_versions(connection), default=0)
+
+
+@contextmanager
+def _transaction(engine):
+    """A connection inside a transaction that includes DDL, also on SQLite."""
+
+    with engine.connect() as connection:
+        sqlite = connection.dialect.name == "sqlite"
+        if sqlite:
+            # pysqlite only opens transactions before DML; take over with an explicit BEGIN.
+            # (commit/rollback still reach the DBAPI connection, which ends the BEGIN.)
+            connection.execution_options(isolation_level="AUTOCOMMIT")
+        with connection.begin():
+            if sqlite:
+                connection.exec_driver_sql("BEGIN")
+            yield connection
+
+
+def migrate(engine) -> list[str]:
+    """Apply pending migrations; returns the names of those applied."""
+
+    with engine.connect() as connection:
+        applied_before = applied_versions(connection)
+    if all(number in applied_before for number, _, _ in MIGRATIONS):
+        return []
+
+    schema_version.create(engine, checkfirst=True)
+    applied = []
+    for number, name, step in MIGRATIONS:
+        if number in applied_before:
+            continue
+        incomplete = None
+        try:
+            with _transaction(engine) as connection:
+                if connection.dialect.name == "postgresql":
+                    # Serialize concurrent boots; released at commit
+                    connection.execute(text("SELECT pg_advisory_xact_lock(4242)"))
+                if number in applied_versions(connection):
+                    continue
+                incomplete = step(connection)
+                if not incomplete:
+                    connection.execute(
+                        schema_version.insert().values(version=number, name=name, applied_at=datetime.utcnow())
+                    )
+        except IntegrityError:
+            # Fine if another worker recorded this version first; its transaction won
+            with engine.connect() as connection:
+                if number not in applied_versions(connection):
+                    raise
+            continue
+        if incomplete:
+            logger.warning("Migration %s (%s) is incomplete and will be retried: %s", number, name, incomplete)
+            continue
+        applied.append(name)
+    return applied
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    names = migrate(engine)
+    print(f"Applied: {', '.join(names)}" if names else "Schema is up to date")
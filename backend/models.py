@@ -1,4 +1,7 @@
+import re
+from datetime import datetime
 from typing import Optional
+from sqlalchemy import Index, event, func
 from sqlmodel import SQLModel, Field
 
 # Import SQLModel, Field, and Optional
@@ -9,13 +12,88 @@ from sqlmodel import SQLModel, Field
 #   id: Optional[int] primary key
 #   username: str unique, password_hash: str, role: str default "customer"
 
+def normalize_category(category: str | None) -> str:
+    """Canonical category key: "Ice Cream", "ice-cream" and "Ice_Cream" -> "ice_cream"."""
+
+    return re.sub(r"[\s_-]+", "_", (category or "").strip().lower()).strip("_")
+
+
 class Sweet(SQLModel, table=True):
+    __table_args__ = (
+        # (price, id) backs keyset pagination when the catalog is ordered by price.
+        Index("ix_sweet_price_id", "price", "id"),
+        # Category + price filters in /sweets/search are a range scan on this.
+        Index("ix_sweet_category_key_price", "category_key", "price"),
+        # Bulk loads (catalog_loader.py) upsert by name.
+        Index("ix_sweet_name", "name"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
     category: str
     price: float
     quantity: int
     image_url: Optional[str] = Field(default=None)
+    # normalize_category(category), set on every write; internal, not part of the API.
+    category_key: Optional[str] = Field(default=None, exclude=True)
+
+
+@event.listens_for(Sweet, "before_insert")
+@event.listens_for(Sweet, "before_update")
+def _set_category_key(mapper, connection, sweet: Sweet) -> None:
+    sweet.category_key = normalize_category(sweet.category)
+
+
+class SweetRead(SQLModel):
+    """Response shape for catalog listings; `fields=` may project a subset."""
+
+    id: Optional[int] = None
+    name: Optional[str] = None
+    category: Optional[str] = None
+    price: Optional[float] = None
+    quantity: Optional[int] = None
+    image_url: Optional[str] = None
+
+class CheckoutLine(SQLModel):
+    sweet_id: int
+    quantity: int = 1
+
+
+class CheckoutRequest(SQLModel):
+    items: list[CheckoutLine]
+
+
+class CategorySummary(SQLModel, table=True):
+    """Per-category item count and stock, kept current by the catalog writes."""
+
+    category_key: str = Field(primary_key=True)
+    label: str
+    item_count: int = Field(default=0)
+    total_stock: int = Field(default=0)
+
+
+class SaleRecord(SQLModel, table=True):
+    """Append-only purchase ledger, written in the same transaction as the stock decrement."""
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    sweet_id: int = Field(index=True)
+    category_key: str
+    quantity: int
+    unit_price: float
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
+class SalesRollup(SQLModel, table=True):
+    """Units and revenue per (hour|day) bucket for one sweet or one category."""
+
+    granularity: str = Field(primary_key=True)  # "hour" or "day"
+    scope: str = Field(primary_key=True)  # "sweet" or "category"
+    bucket_start: datetime = Field(primary_key=True)
+    scope_key: str = Field(primary_key=True)  # sweet id or category key
+    units: int = Field(default=0)
+    revenue: float = Field(default=0)
+    sales: int = Field(default=0)
+
 
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -24,6 +102,11 @@ class User(SQLModel, table=True):
     password_hash: str
     role: str = Field(default="customer")
 
+# Emails are unique case-insensitively. Registration relies on this index
+# (and the username constraint) instead of checking for duplicates first.
+Index("ux_user_email_lower", func.lower(User.email), unique=True)
+
+
 class UserRegister(SQLModel):
     username: str
     email: str
@@ -39,3 +122,44 @@ class AdminInit(SQLModel):
 class AdminPasswordReset(SQLModel):
     username: str
     new_password: str
+
+
+class RefreshToken(SQLModel, table=True):
+    """One issued refresh token, stored as a SHA-256 digest.
+
+    Rotation marks the presented token used and issues its successor in the
+    same `family_id`; presenting a used or revoked token revokes the family.
+    """
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    token_hash: str = Field(unique=True)
+    family_id: str = Field(index=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime
+    used_at: Optional[datetime] = Field(default=None)
+    revoked_at: Optional[datetime] = Field(default=None)
+
+
+class RefreshRequest(SQLModel):
+    refresh_token: str
+
+
+class RevokedToken(SQLModel, table=True):
+    """Access token ids revoked before their expiry; rows are useless once `expires_at` passes."""
+
+    jti: str = Field(primary_key=True)
+    expires_at: datetime = Field(index=True)
+    revoked_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
+class LogoutRequest(SQLModel):
+    refresh_token: Optional[str] = None
+
+
+class LoginThrottleBucket(SQLModel, table=True):
+    """Token bucket for login attempts, shared by all workers (LOGIN_THROTTLE_BACKEND=db)."""
+
+    key: str = Field(primary_key=True)  # "user:<name>" or "ip:<address>"
+    tokens: float
+    updated_at: float = Field(index=True)  # epoch seconds
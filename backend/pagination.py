@@ -0,0 +1,113 @@
+"""Keyset (cursor) pagination and column projection for the sweets catalog.
+
+Pages are ordered either by `id` or by `(price, id)` so every page is a single
+index range scan: the cursor carries the sort key of the last row returned and
+the next page starts strictly after it (no OFFSET).
+"""
+
+import base64
+import json
+import math
+from typing import Any
+
+from sqlalchemy import func, tuple_
+from sqlmodel import select
+
+from models import Sweet
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Sort orders that can be paginated with a cursor, mapped to their key columns.
+ORDER_KEYS: dict[str, tuple[str, ...]] = {
+    "id": ("id",),
+    "price": ("price", "id"),
+}
+
+# JSON types a cursor may carry for each key column.
+_KEY_TYPES: dict[str, type | tuple[type, ...]] = {
+    "id": int,
+    "price": (int, float),
+}
+
+SWEET_FIELDS: tuple[str, ...] = tuple(name for name, field in Sweet.model_fields.items() if not field.exclude)
+
+
+def encode_cursor(values: tuple[Any, ...]) -> str:
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, order: str) -> tuple[Any, ...]:
+    """Decode a cursor produced by `encode_cursor` for the given sort order.
+
+    Raises ValueError if the cursor is malformed or was issued for another order.
+    """
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+    keys = ORDER_KEYS[order]
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise ValueError("Invalid cursor")
+    for name, value in zip(keys, values):
+        # bool is an int to Python, but not to the database
+        if isinstance(value, bool) or not isinstance(value, _KEY_TYPES[name]):
+            raise ValueError("Invalid cursor")
+        if isinstance(value, float) and not math.isfinite(value):
+            raise ValueError("Invalid cursor")
+    return tuple(values)
+
+
+def parse_fields(fields: str | None, order: str = "id") -> list[str] | None:
+    """Parse a comma-separated `fields=` projection.
+
+    The sort key columns (`id`, plus `price` when ordering by price) are always
+    included so the client can page on from any row.
+    """
+
+    if not fields:
+        return None
+
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in SWEET_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+
+    keep = set(requested) | set(ORDER_KEYS[order])
+    return [f for f in SWEET_FIELDS if f in keep]
+
+
+def count_statement(statement):
+    """Wrap a filtered select in `SELECT count(*)` (used only when asked for)."""
+
+    return select(func.count()).select_from(statement.order_by(None).subquery())
+
+
+def apply_keyset(statement, order: str, after: tuple[Any, ...] | None, limit: int):
+    key_columns = [getattr(Sweet, name) for name in ORDER_KEYS[order]]
+
+    if after is not None:
+        if len(key_columns) == 1:
+            statement = statement.where(key_columns[0] > after[0])
+        else:
+            statement = statement.where(tuple_(*key_columns) > tuple_(*after))
+
+    return statement.order_by(*key_columns).limit(limit)
+
+
+def next_cursor(rows: list[Any], order: str, limit: int) -> str | None:
+    """Return the cursor for the page after `rows`, or None on the last page.
+
+    Rows may be `Sweet` objects or projected dicts.
+    """
+
+    if len(rows) < limit:
+        return None
+    last = rows[-1]
+    if isinstance(last, dict):
+        return encode_cursor(tuple(last[name] for name in ORDER_KEYS[order]))
+    return encode_cursor(tuple(getattr(last, name) for name in ORDER_KEYS[order]))
@@ -0,0 +1,116 @@
+"""Connection pool metrics for `/internal/db-pool`.
+
+`TimedQueuePool` is a `QueuePool` that measures how long each checkout waited
+for a connection, including opening a new one, and counts timeouts.
+`PoolMetrics` listens to the pool's `connect`, `checkout`, `checkin` and
+`invalidate` events for the rest. Together they show whether latency under
+load comes from waiting on the pool, rather than from the queries themselves.
+"""
+
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.max_checked_out = 0
+        self._checked_out = 0
+
+    def record_wait(self, seconds: float, timed_out: bool) -> None:
+        with self._lock:
+            self.waits += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def _on_connect(self, dbapi_connection, record) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, record, proxy) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self._checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self._checked_out)
+
+    def _on_checkin(self, dbapi_connection, record) -> None:
+        with self._lock:
+            self.checkins += 1
+            self._checked_out = max(0, self._checked_out - 1)
+
+    def _on_invalidate(self, dbapi_connection, record, exception) -> None:
+        with self._lock:
+            self.invalidations += 1
+
+    def attach(self, pool) -> None:
+        event.listen(pool, "connect", self._on_connect)
+        event.listen(pool, "checkout", self._on_checkout)
+        event.listen(pool, "checkin", self._on_checkin)
+        event.listen(pool, "invalidate", self._on_invalidate)
+        if isinstance(pool, TimedQueuePool):
+            pool.metrics = self
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            counters = {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "max_checked_out": self.max_checked_out,
+                "wait_ms_avg": round(self.wait_total / self.waits * 1000, 3) if self.waits else 0.0,
+                "wait_ms_max": round(self.wait_max * 1000, 3),
+            }
+
+        live = {"pool": type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            live.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                # Negative while the pool hasn't opened `size` connections yet
+                overflow=max(0, pool.overflow()),
+                max_overflow=pool._max_overflow,
+                timeout=pool.timeout(),
+            )
+        live["recycle"] = pool._recycle
+        return {**live, **counters}
+
+
+class TimedQueuePool(QueuePool):
+    """`QueuePool` that reports how long each checkout waited for a connection."""
+
+    metrics: PoolMetrics | None = None
+
+    def recreate(self) -> "TimedQueuePool":
+        # engine.dispose() swaps in a new pool; event listeners carry over, this doesn't
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            timed_out = True
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.record_wait(time.perf_counter() - started, timed_out)
@@ -0,0 +1,150 @@
+"""Optional group commit for purchases of the same sweet.
+
+During promotions most purchases hit a few hot rows, and every request
+contends for the same row lock and pays for its own commit. With
+`PURCHASE_GROUP_COMMIT_MS` > 0, the first purchase of a sweet becomes the
+batch leader. It waits that long while concurrent purchases of the same
+sweet join its batch, then applies the whole batch in one transaction:
+
+1. a no-op `UPDATE` locks the row and returns its current stock,
+2. each request is settled in arrival order against that stock (so every
+   caller still gets an exact "remaining" or "not enough stock" answer),
+3. one `UPDATE` writes the combined decrement and the leader commits once.
+
+Followers don't touch the database; they block until the leader has
+committed and hand back their own result.
+"""
+
+import os
+import threading
+import time
+
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from inventory import InsufficientStock, SweetNotFound, record_sold, supports_update_returning
+from models import Sweet
+from sales import Sale
+
+PURCHASE_GROUP_COMMIT_MS = float(os.getenv("PURCHASE_GROUP_COMMIT_MS", "0"))
+
+
+class _PendingPurchase:
+    def __init__(self, quantity: int):
+        self.quantity = quantity
+        self.remaining: int | None = None
+        self.error: Exception | None = None
+        self.done = threading.Event()
+
+    def outcome(self) -> int:
+        if self.error is not None:
+            raise self.error
+        return self.remaining
+
+
+class PurchaseCombiner:
+    def __init__(self, window_ms: float):
+        self.window = window_ms / 1000
+        self._lock = threading.Lock()
+        self._open: dict[int, list[_PendingPurchase]] = {}
+        self.requests = 0
+        self.batches = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def purchase(self, session: Session, sweet_id: int, quantity: int) -> int:
+        """Buy `quantity` (> 0) units, possibly batched; returns the remaining stock.
+
+        Raises the same `InventoryError`s as `inventory.purchase`. Unlike it,
+        this commits: followers can only be answered once the batch is durable.
+        """
+
+        pending = _PendingPurchase(quantity)
+        with self._lock:
+            self.requests += 1
+            batch = self._open.get(sweet_id)
+            is_leader = batch is None
+            if is_leader:
+                batch = self._open[sweet_id] = []
+            batch.append(pending)
+
+        if not is_leader:
+            pending.done.wait()
+            return pending.outcome()
+
+        time.sleep(self.window)
+        with self._lock:
+            # Close the batch; later arrivals start a new one
+            del self._open[sweet_id]
+            self.batches += 1
+
+        try:
+            self._apply(session, sweet_id, batch)
+        except Exception as exc:
+            session.rollback()
+            for request in batch:
+                request.error = exc
+        finally:
+            for request in batch:
+                request.done.set()
+
+        return pending.outcome()
+
+    def _lock_and_read(self, session: Session, sweet_id: int):
+        lock = (
+            update(Sweet)
+            .where(Sweet.id == sweet_id)
+            .values(quantity=Sweet.quantity)
+            .execution_options(synchronize_session=False)
+        )
+        if supports_update_returning(session):
+            return session.exec(lock.returning(Sweet.quantity, Sweet.category, Sweet.price)).first()
+        session.exec(lock)
+        return session.exec(select(Sweet.quantity, Sweet.category, Sweet.price).where(Sweet.id == sweet_id)).first()
+
+    def _apply(self, session: Session, sweet_id: int, batch: list[_PendingPurchase]) -> None:
+        row = self._lock_and_read(session, sweet_id)
+        if row is None:
+            for request in batch:
+                request.error = SweetNotFound()
+            session.rollback()
+            return
+
+        available, category, price = row
+        for request in batch:
+            if available <= 0:
+                request.error = InsufficientStock("Out of stock")
+            elif request.quantity > available:
+                request.error = InsufficientStock("Not enough stock")
+            else:
+                available -= request.quantity
+                request.remaining = available
+
+        taken = row[0] - available
+        if taken:
+            session.exec(
+                update(Sweet)
+                .where(Sweet.id == sweet_id)
+                .values(quantity=available)
+                .execution_options(synchronize_session=False)
+            )
+            # One ledger row per successful request, but a single rollup/facet update
+            record_sold(
+                session,
+                [Sale(sweet_id, category, r.quantity, price) for r in batch if r.error is None],
+            )
+        session.commit()
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "window_ms": self.window * 1000,
+                "requests": self.requests,
+                "batches": self.batches,
+            }
+
+
+purchase_combiner = PurchaseCombiner(PURCHASE_GROUP_COMMIT_MS)
@@ -0,0 +1,193 @@
+"""Send catalog reads to a read replica when `DATABASE_READ_URL` is set.
+
+`get_read_session` gives `read_sweets`, `search_sweets` and `read_sweet` a
+session on the replica (`get_async_read_session` does the same for their
+async twins). It returns the primary session instead when:
+
+- there is no replica configured;
+- the client wrote something in the last `READ_STICKY_SECONDS`
+  (read-your-writes). Every successful non-GET request answers with the
+  deadline, via `ReadYourWritesMiddleware`, both as a short-lived cookie and
+  as an `X-Read-Primary-Until` header. Browsers don't send the cookie to a
+  cross-site API without credentials (or at all, when they block third-party
+  cookies), so the frontend echoes the header back on its requests instead;
+- the replica is unhealthy. A failed connect, or any disconnect-type error
+  on the read engine, routes reads back to the primary for
+  `READ_REPLICA_RETRY_SECONDS`.
+
+Reads served by the replica can lag the primary by the replication delay.
+They are cached under their own keys (see `read_source`), so a lagging result
+never answers a read-your-writes request.
+"""
+
+import math
+import os
+import threading
+import time
+
+from fastapi import Depends, Request
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlmodel import Session
+
+import database
+from database import get_async_session, get_session
+
+READ_STICKY_SECONDS = float(os.getenv("READ_STICKY_SECONDS", "5"))
+READ_REPLICA_RETRY_SECONDS = float(os.getenv("READ_REPLICA_RETRY_SECONDS", "30"))
+
+STICKY_COOKIE = "read_primary_until"
+STICKY_HEADER = "X-Read-Primary-Until"
+
+_SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class ReplicaHealth:
+    def __init__(self, retry_seconds: float):
+        self.retry_seconds = retry_seconds
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+        self.replica_reads = 0
+        self.primary_fallbacks = 0
+        self.sticky_reads = 0
+        self.failures = 0
+
+    def available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def mark_down(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._down_until = time.monotonic() + self.retry_seconds
+
+    def reset(self) -> None:
+        with self._lock:
+            self._down_until = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "configured": database.read_engine is not None,
+            "available": self.available(),
+            "replica_reads": self.replica_reads,
+            "sticky_reads": self.sticky_reads,
+            "primary_fallbacks": self.primary_fallbacks,
+            "failures": self.failures,
+        }
+
+
+replica_health = ReplicaHealth(READ_REPLICA_RETRY_SECONDS)
+
+
+def _replica_error(context) -> None:
+    if context.is_disconnect:
+        replica_health.mark_down()
+
+
+def watch_replica(engine) -> None:
+    """Take the replica out of rotation when one of its connections breaks mid-request."""
+
+    if not event.contains(engine, "handle_error", _replica_error):
+        event.listen(engine, "handle_error", _replica_error)
+
+
+if database.read_engine is not None:
+    watch_replica(database.read_engine)
+
+
+def _is_sticky(request: Request) -> bool:
+    until = request.headers.get(STICKY_HEADER) or request.cookies.get(STICKY_COOKIE, "0")
+    try:
+        return float(until) > time.time()
+    except ValueError:
+        return False
+
+
+def _use_replica(request: Request, configured: bool) -> bool:
+    """Whether this read may try the replica; counts why not."""
+
+    if not configured:
+        return False
+    if _is_sticky(request):
+        replica_health.sticky_reads += 1
+        return False
+    if not replica_health.available():
+        replica_health.primary_fallbacks += 1
+        return False
+    return True
+
+
+def get_read_session(request: Request, session: Session = Depends(get_session)):
+    """A session on the read replica, or the primary `session` (see module docstring)."""
+
+    read_engine = database.read_engine
+    if not _use_replica(request, read_engine is not None):
+        yield session
+        return
+
+    with Session(read_engine) as replica:
+        try:
+            # Check out a connection now, so an unreachable replica falls back here
+            replica.connection()
+        except DBAPIError:
+            replica_health.mark_down()
+            replica_health.primary_fallbacks += 1
+            yield session
+            return
+        replica_health.replica_reads += 1
+        yield replica
+
+
+async def get_async_read_session(request: Request, session=Depends(get_async_session)):
+    """`get_read_session` for the async endpoints (`ASYNC_DB=1`), on the replica's async engine."""
+
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    read_engine = database.get_async_read_engine()
+    if not _use_replica(request, read_engine is not None):
+        yield session
+        return
+
+    watch_replica(read_engine.sync_engine)
+    async with AsyncSession(read_engine) as replica:
+        try:
+            await replica.connection()
+        except DBAPIError:
+            replica_health.mark_down()
+            replica_health.primary_fallbacks += 1
+            yield session
+            return
+        replica_health.replica_reads += 1
+        yield replica
+
+
+def read_source(session: Session) -> str:
+    """Cache namespace for a read: results from the replica may lag the primary."""
+
+    return "replica" if database.is_read_engine(session.get_bind()) else "primary"
+
+
+class ReadYourWritesMiddleware:
+    """Set the sticky cookie and header on successful writes while a replica is configured."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or database.read_engine is None or scope["method"] in _SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        secure = scope.get("scheme") == "https"
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + READ_STICKY_SECONDS
+                max_age = max(1, math.ceil(READ_STICKY_SECONDS))
+                cookie = f"{STICKY_COOKIE}={until:.3f}; Max-Age={max_age}; Path=/; HttpOnly"
+                # Cross-site frontends only send the cookie back with SameSite=None; Secure
+                cookie += "; SameSite=None; Secure" if secure else "; SameSite=Lax"
+                sticky = [(b"set-cookie", cookie.encode()), (STICKY_HEADER.lower().encode(), f"{until:.3f}".encode())]
+                message = {**message, "headers": [*message.get("headers", []), *sticky]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -0,0 +1,155 @@
+"""Rotating refresh tokens, so bcrypt only runs at real sign-in.
+
+`/auth/login` hands out a short-lived access token plus an opaque refresh
+token. `/auth/refresh` trades a refresh token for a new pair. That costs two
+statements: an indexed UPDATE on the token's SHA-256 digest that also reads
+the user's name and role, and the INSERT of the successor. The raw token is
+never stored.
+
+Every refresh token is single-use. Rotation claims the presented token with
+one conditional `UPDATE ... WHERE used_at IS NULL`, so two concurrent
+refreshes can't both succeed. If a token that was already used (or revoked)
+is presented again, it has leaked: the whole family descending from that
+login is revoked and the user has to sign in again.
+
+Rows are kept until the token expires, so that reuse is still detected, and
+deleted at the user's next login. After its expiry a token is rejected as
+plain invalid.
+"""
+
+import hashlib
+import os
+import secrets
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, update
+from sqlmodel import Session, select
+
+from inventory import supports_update_returning
+from models import RefreshToken, User
+
+REFRESH_TOKEN_DAYS = float(os.getenv("REFRESH_TOKEN_DAYS", "14"))
+
+
+class InvalidRefreshToken(Exception):
+    def __init__(self, detail: str = "Invalid refresh token"):
+        super().__init__(detail)
+        self.detail = detail
+
+
+def _digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue(session: Session, user_id: int, family_id: str | None = None) -> str:
+    """Create a refresh token (a new family unless `family_id` is given). The caller commits."""
+
+    now = datetime.utcnow()
+    if family_id is None:
+        # Housekeeping at login: the user's expired tokens (used, revoked or not) are no longer needed
+        session.exec(
+            delete(RefreshToken)
+            .where(RefreshToken.user_id == user_id, RefreshToken.expires_at <= now)
+            .execution_options(synchronize_session=False)
+        )
+
+    token = secrets.token_urlsafe(32)
+    session.add(
+        RefreshToken(
+            token_hash=_digest(token),
+            family_id=family_id or uuid.uuid4().hex,
+            user_id=user_id,
+            expires_at=now + timedelta(days=REFRESH_TOKEN_DAYS),
+        )
+    )
+    return token
+
+
+def _claim(session: Session, digest: str, now: datetime):
+    """Mark a live token used; returns its (family_id, user_id, username, role), or None.
+
+    The user's columns are scalar subqueries in RETURNING (SQLite doesn't allow
+    an UPDATE ... FROM table there), so no separate SELECT of the user is needed.
+    """
+
+    statement = (
+        update(RefreshToken)
+        .where(
+            RefreshToken.token_hash == digest,
+            RefreshToken.used_at.is_(None),
+            RefreshToken.revoked_at.is_(None),
+            RefreshToken.expires_at > now,
+        )
+        .values(used_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    if supports_update_returning(session):
+        user_columns = [
+            select(column).where(User.id == RefreshToken.user_id).scalar_subquery() for column in (User.username, User.role)
+        ]
+        return session.exec(statement.returning(RefreshToken.family_id, RefreshToken.user_id, *user_columns)).first()
+    if session.exec(statement).rowcount != 1:
+        return None
+    return session.exec(
+        select(RefreshToken.family_id, RefreshToken.user_id, User.username, User.role)
+        .outerjoin(User, User.id == RefreshToken.user_id)
+        .where(RefreshToken.token_hash == digest)
+    ).first()
+
+
+def rotate(session: Session, token: str) -> tuple[dict[str, str], str]:
+    """Consume `token`; returns its user's access-token claims and the successor refresh token.
+
+    Raises `InvalidRefreshToken`. On reuse the family has been revoked in
+    this session, so the caller should commit before answering 401.
+    """
+
+    now = datetime.utcnow()
+    digest = _digest(token)
+    claimed = _claim(session, digest, now)
+    if claimed is None:
+        stored = session.exec(
+            select(RefreshToken.family_id, RefreshToken.used_at, RefreshToken.revoked_at).where(
+                RefreshToken.token_hash == digest
+            )
+        ).first()
+        if stored is not None and (stored.used_at is not None or stored.revoked_at is not None):
+            revoke_family(session, stored.family_id)
+            raise InvalidRefreshToken("Refresh token reuse detected")
+        raise InvalidRefreshToken()
+
+    family_id, user_id, username, role = claimed
+    if username is None:
+        raise InvalidRefreshToken()
+    return {"sub": username, "role": role}, issue(session, user_id, family_id)
+
+
+def revoke_family(session: Session, family_id: str) -> None:
+    session.exec(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def revoke_user(session: Session, user_id: int) -> None:
+    """Revoke every refresh token of a user (e.g. after a password change)."""
+
+    session.exec(
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def revoke(session: Session, token: str, user_id: int) -> None:
+    """Revoke the family of `token` (logout) if it belongs to `user_id`; other tokens are ignored."""
+
+    family_id = session.exec(
+        select(RefreshToken.family_id).where(RefreshToken.token_hash == _digest(token), RefreshToken.user_id == user_id)
+    ).first()
+    if family_id is not None:
+        revoke_family(session, family_id)
@@ -1,10 +1,106 @@
-import requests
+"""Register users.
 
-# Register a test user
-response = requests.post(
-    "http://127.0.0.1:8000/auth/register",
-    json={"username": "loginuser", "password": "password123"}
-)
+    python register_user.py                 # register the test user via the running API
+    python register_user.py import users.csv [--batch-size 500] [--workers 4]
 
-print(f"Status: {response.status_code}")
-print(f"Response: {response.json()}")
+`import` loads users straight into the database from a CSV file with a
+`username,email,password[,role]` header. Passwords are hashed in parallel in
+a process pool. Users are inserted in batches with one multi-row INSERT that
+skips duplicate usernames/emails, so re-running an import is safe. Usernames
+that already exist aren't hashed again.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterator
+
+from sqlmodel import Session, select
+
+from database import create_db_and_tables, engine, insert_ignoring_conflicts
+from models import User
+from security import hash_password
+
+IMPORT_BATCH_SIZE = 500
+
+
+def register_test_user() -> None:
+    import requests
+
+    # Register a test user
+    response = requests.post(
+        "http://127.0.0.1:8000/auth/register",
+        json={"username": "loginuser", "password": "password123"}
+    )
+
+    print(f"Status: {response.status_code}")
+    print(f"Response: {response.json()}")
+
+
+def _batches(rows: Iterator[dict], size: int) -> Iterator[list[dict]]:
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def import_users(path: str, batch_size: int = IMPORT_BATCH_SIZE, workers: int | None = None) -> dict[str, float]:
+    create_db_and_tables()
+    started = time.perf_counter()
+    inserted = skipped = 0
+
+    with open(path, newline="", encoding="utf-8") as handle, ProcessPoolExecutor(max_workers=workers) as pool:
+        for batch in _batches(csv.DictReader(handle), batch_size):
+            with Session(engine) as session:
+                existing = set(
+                    session.exec(select(User.username).where(User.username.in_([r["username"] for r in batch]))).all()
+                )
+                pending = [r for r in batch if r["username"] not in existing]
+
+                # bcrypt only uses the first 72 bytes, as in /auth/register
+                hashes = pool.map(hash_password, [r["password"][:72] for r in pending], chunksize=16)
+                rows = [
+                    {
+                        "username": r["username"],
+                        "email": r.get("email") or None,
+                        "password_hash": password_hash,
+                        "role": r.get("role") or "customer",
+                    }
+                    for r, password_hash in zip(pending, hashes)
+                ]
+
+                added = insert_ignoring_conflicts(session, User, rows)
+                session.commit()
+
+            inserted += added
+            skipped += len(batch) - added
+
+    elapsed = time.perf_counter() - started
+    return {"inserted": inserted, "skipped": skipped, "seconds": elapsed}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcommands = parser.add_subparsers(dest="command")
+    importer = subcommands.add_parser("import", help="bulk-import users from a CSV file")
+    importer.add_argument("path")
+    importer.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    importer.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    if args.command != "import":
+        register_test_user()
+        return
+
+    report = import_users(args.path, args.batch_size, args.workers)
+    rate = report["inserted"] / report["seconds"] if report["seconds"] else 0
+    print(f"Inserted: {report['inserted']}")
+    print(f"Skipped (already exist): {report['skipped']}")
+    print(f"Took {report['seconds']:.1f}s ({rate:.0f} users/s)")
+
+
+if __name__ == "__main__":
+    main()
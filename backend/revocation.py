@@ -0,0 +1,87 @@
+"""Access-token revocation without a per-request query.
+
+Every access token carries a `jti`. Logging out writes that id to the
+`revokedtoken` table together with the token's expiry. Each worker mirrors the
+unexpired rows in an in-memory dict, so checking a token is a dict lookup.
+
+The mirror is refreshed incrementally at most every `REVOCATION_REFRESH_SECONDS`.
+Only rows revoked since the previous refresh are read, with a small overlap for
+clock skew and late commits. Entries, and the rows themselves, are dropped once
+the token they revoke has expired anyway. Revocations made by this worker apply
+immediately; other workers pick them up within one refresh interval.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete
+from sqlmodel import Session, select
+
+from models import RevokedToken
+
+REVOCATION_REFRESH_SECONDS = float(os.getenv("REVOCATION_REFRESH_SECONDS", "5"))
+
+# Re-read this much history on every refresh: revocations committed late or
+# stamped by a worker with a slightly slow clock are still picked up.
+_REFRESH_OVERLAP = timedelta(seconds=30)
+
+
+class RevocationList:
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._revoked: dict[str, datetime] = {}
+        self._synced_at: datetime | None = None
+        self._next_refresh = 0.0
+        self._refresh_lock = threading.Lock()
+        self.refreshes = 0
+
+    def _refresh(self, session: Session) -> None:
+        now = datetime.utcnow()
+        statement = select(RevokedToken.jti, RevokedToken.expires_at).where(RevokedToken.expires_at > now)
+        if self._synced_at is not None:
+            statement = statement.where(RevokedToken.revoked_at >= self._synced_at - _REFRESH_OVERLAP)
+
+        revoked = dict(self._revoked)
+        revoked.update(session.exec(statement).all())
+        # Tokens past their expiry are rejected anyway
+        self._revoked = {jti: expires_at for jti, expires_at in revoked.items() if expires_at > now}
+        self._synced_at = now
+        self.refreshes += 1
+
+    def is_revoked(self, session: Session, jti: str | None) -> bool:
+        if time.monotonic() >= self._next_refresh and self._refresh_lock.acquire(blocking=False):
+            # One thread refreshes; the others keep using the current snapshot
+            try:
+                self._refresh(session)
+                self._next_refresh = time.monotonic() + self.refresh_seconds
+            finally:
+                self._refresh_lock.release()
+        return jti is not None and jti in self._revoked
+
+    def revoke(self, session: Session, jti: str, expires_at: datetime) -> None:
+        """Persist a revocation (the caller commits) and apply it in this worker right away."""
+
+        now = datetime.utcnow()
+        if session.get(RevokedToken, jti) is None:
+            session.add(RevokedToken(jti=jti, expires_at=expires_at, revoked_at=now))
+        # Housekeeping: rows for expired tokens are no longer needed
+        session.exec(delete(RevokedToken).where(RevokedToken.expires_at <= now))
+        self._revoked = {**self._revoked, jti: expires_at}
+
+    def reset(self) -> None:
+        with self._refresh_lock:
+            self._revoked = {}
+            self._synced_at = None
+            self._next_refresh = 0.0
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "revoked": len(self._revoked),
+            "refreshes": self.refreshes,
+            "refresh_seconds": self.refresh_seconds,
+        }
+
+
+revocation_list = RevocationList(REVOCATION_REFRESH_SECONDS)
@@ -0,0 +1,106 @@
+"""Sales ledger and incrementally maintained sales rollups.
+
+Every successful purchase appends `SaleRecord` rows and bumps the matching
+hourly and daily `SalesRollup` buckets (per sweet and per category) in the
+same transaction as the stock decrement. `/reports/sales` only reads
+rollups, so a report costs O(buckets), not O(purchases).
+"""
+
+from datetime import datetime
+from typing import NamedTuple
+
+from sqlalchemy import insert
+from sqlmodel import Session, select
+
+from database import upsert_increments
+from models import SaleRecord, SalesRollup, normalize_category
+
+GRANULARITIES = ("hour", "day")
+SCOPES = ("sweet", "category")
+
+
+class Sale(NamedTuple):
+    sweet_id: int
+    category: str
+    quantity: int
+    unit_price: float
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def record_sales(session: Session, sales: list[Sale], at: datetime | None = None) -> None:
+    """Append ledger rows and update rollups for `sales` (the caller commits)."""
+
+    if not sales:
+        return
+    at = at or datetime.utcnow()
+
+    session.exec(
+        insert(SaleRecord).values(
+            [
+                {
+                    "sweet_id": sale.sweet_id,
+                    "category_key": normalize_category(sale.category),
+                    "quantity": sale.quantity,
+                    "unit_price": sale.unit_price,
+                    "created_at": at,
+                }
+                for sale in sales
+            ]
+        )
+    )
+
+    # Aggregate first: one upsert row per bucket, whatever the number of sales
+    rollups: dict[tuple, dict] = {}
+    for sale in sales:
+        for granularity in GRANULARITIES:
+            for scope, scope_key in (("sweet", str(sale.sweet_id)), ("category", normalize_category(sale.category))):
+                key = (granularity, scope, bucket_start(at, granularity), scope_key)
+                row = rollups.setdefault(
+                    key,
+                    dict(zip(("granularity", "scope", "bucket_start", "scope_key"), key), units=0, revenue=0.0, sales=0),
+                )
+                row["units"] += sale.quantity
+                row["revenue"] += sale.quantity * sale.unit_price
+                row["sales"] += 1
+
+    upsert_increments(
+        session,
+        SalesRollup,
+        key_columns=["granularity", "scope", "bucket_start", "scope_key"],
+        increment_columns=["units", "revenue", "sales"],
+        rows=list(rollups.values()),
+    )
+
+
+def sales_report(
+    session: Session,
+    granularity: str,
+    scope: str,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    key: str | None = None,
+) -> list[dict]:
+    statement = select(SalesRollup).where(SalesRollup.granularity == granularity, SalesRollup.scope == scope)
+    if start is not None:
+        statement = statement.where(SalesRollup.bucket_start >= bucket_start(start, granularity))
+    if end is not None:
+        statement = statement.where(SalesRollup.bucket_start <= end)
+    if key is not None:
+        statement = statement.where(SalesRollup.scope_key == (normalize_category(key) if scope == "category" else key))
+
+    statement = statement.order_by(SalesRollup.bucket_start, SalesRollup.scope_key)
+    return [
+        {
+            "bucket_start": row.bucket_start,
+            "key": row.scope_key,
+            "units": row.units,
+            "revenue": round(row.revenue, 2),
+            "sales": row.sales,
+        }
+        for row in session.exec(statement)
+    ]
@@ -0,0 +1,184 @@
+"""Index-backed text search for sweet names.
+
+`ilike '%term%'` can't use a B-tree index, so `/sweets/search` goes through a
+dialect-specific backend instead:
+
+- SQLite: an external-content FTS5 table (`sweet_fts`) with the trigram
+  tokenizer, kept in sync with `sweet` by triggers. Trigrams keep the old
+  case-insensitive substring semantics and rank matches with bm25.
+- PostgreSQL: `pg_trgm` GIN indexes, which serve `ILIKE '%term%'` directly;
+  matches are ranked by trigram similarity.
+
+The category column is indexed too, but category filters now use the
+normalized `sweet.category_key` instead (see `models.normalize_category`).
+- Anything else falls back to plain `ilike`.
+
+Run `python search_index.py` to (re)build the index for an existing database.
+"""
+
+import sqlite3
+
+from sqlalchemy import Column, DDL, Integer, MetaData, String, Table, event, func, literal_column, select, text
+
+from models import Sweet
+
+# Trigram matching needs at least three characters; shorter terms use ilike.
+MIN_TERM_LENGTH = 3
+
+# Kept out of SQLModel.metadata: create_all must not create it as a plain table.
+sweet_fts = Table(
+    "sweet_fts",
+    MetaData(),
+    Column("rowid", Integer),
+    Column("name", String),
+    Column("category", String),
+    Column("rank"),
+)
+
+SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS sweet_fts USING fts5("
+    "name, category, content='sweet', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS sweet_fts_ai AFTER INSERT ON sweet BEGIN "
+    "INSERT INTO sweet_fts(rowid, name, category) VALUES (new.id, new.name, new.category); END",
+    "CREATE TRIGGER IF NOT EXISTS sweet_fts_ad AFTER DELETE ON sweet BEGIN "
+    "INSERT INTO sweet_fts(sweet_fts, rowid, name, category) VALUES ('delete', old.id, old.name, old.category); END",
+    # Only name/category changes touch the index, so stock updates stay cheap.
+    "CREATE TRIGGER IF NOT EXISTS sweet_fts_au AFTER UPDATE OF name, category ON sweet BEGIN "
+    "INSERT INTO sweet_fts(sweet_fts, rowid, name, category) VALUES ('delete', old.id, old.name, old.category); "
+    "INSERT INTO sweet_fts(rowid, name, category) VALUES (new.id, new.name, new.category); END",
+]
+
+POSTGRES_TRGM_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_sweet_name_trgm ON sweet USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_sweet_category_trgm ON sweet USING gin (category gin_trgm_ops)",
+]
+
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+class LikeSearch:
+    """Unindexed fallback: the original `ilike '%term%'` filters."""
+
+    name = "like"
+    dialect: str | None = None
+    ddl: list[str] = []
+
+    def install(self, connection) -> bool:
+        """Create the index objects; returns True if the index must be rebuilt."""
+
+        for statement in self.ddl:
+            connection.execute(text(statement))
+        return False
+
+    def rebuild(self, connection) -> None:
+        pass
+
+    def suspend(self, connection) -> bool:
+        """Stop syncing the index on writes, for bulk loads; returns False if
+        there's nothing to suspend. `install` + `rebuild` bring it back."""
+
+        return False
+
+    def name_filter(self, term: str):
+        return Sweet.name.ilike(f"%{term}%")
+
+    def rank(self, term: str):
+        return None
+
+
+class SqliteFtsSearch(LikeSearch):
+    name = "sqlite-fts5"
+    dialect = "sqlite"
+    ddl = SQLITE_FTS_DDL
+
+    def install(self, connection) -> bool:
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sweet_fts'")
+        ).first()
+        super().install(connection)
+        # A new external-content table starts empty even if `sweet` has rows.
+        return exists is None
+
+    def rebuild(self, connection) -> None:
+        connection.execute(text("INSERT INTO sweet_fts(sweet_fts) VALUES ('rebuild')"))
+
+    def suspend(self, connection) -> bool:
+        # Per-row trigger inserts cost more than one 'rebuild' after a large load
+        for trigger in ("sweet_fts_ai", "sweet_fts_ad", "sweet_fts_au"):
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        return True
+
+    def _matching_ids(self, query: str):
+        return select(sweet_fts.c.rowid).where(literal_column("sweet_fts").match(query))
+
+    def name_filter(self, term: str):
+        if len(term) < MIN_TERM_LENGTH:
+            return super().name_filter(term)
+        return Sweet.id.in_(self._matching_ids(f"name : {_fts_phrase(term)}"))
+
+    def rank(self, term: str):
+        if len(term) < MIN_TERM_LENGTH:
+            return None
+        return (
+            select(sweet_fts.c.rank)
+            .where(literal_column("sweet_fts").match(f"name : {_fts_phrase(term)}"))
+            .where(sweet_fts.c.rowid == Sweet.id)
+            .scalar_subquery()
+        )
+
+
+class PostgresTrigramSearch(LikeSearch):
+    """`pg_trgm` GIN indexes serve the inherited `ilike` filters."""
+
+    name = "postgres-trgm"
+    dialect = "postgresql"
+    ddl = POSTGRES_TRGM_DDL
+
+    def rebuild(self, connection) -> None:
+        connection.execute(text("REINDEX INDEX ix_sweet_name_trgm"))
+        connection.execute(text("REINDEX INDEX ix_sweet_category_trgm"))
+
+    def rank(self, term: str):
+        return func.similarity(Sweet.name, term).desc()
+
+
+def _sqlite_has_trigram_fts() -> bool:
+    probe = sqlite3.connect(":memory:")
+    try:
+        probe.execute("CREATE VIRTUAL TABLE probe USING fts5(x, tokenize='trigram')")
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        probe.close()
+
+
+def backend_for_dialect(dialect_name: str) -> LikeSearch:
+    if dialect_name == "sqlite" and _sqlite_has_trigram_fts():
+        return SqliteFtsSearch()
+    if dialect_name == "postgresql":
+        return PostgresTrigramSearch()
+    return LikeSearch()
+
+
+def attach_to_table(backend: LikeSearch) -> None:
+    """Create the search index whenever `create_all` creates the sweet table."""
+
+    for statement in backend.ddl:
+        event.listen(Sweet.__table__, "after_create", DDL(statement).execute_if(dialect=backend.dialect))
+
+
+def rebuild_index() -> None:
+    from database import engine, search_backend
+
+    with engine.begin() as connection:
+        search_backend.install(connection)
+        search_backend.rebuild(connection)
+    print(f"Rebuilt {search_backend.name} search index")
+
+
+if __name__ == "__main__":
+    rebuild_index()
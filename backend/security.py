@@ -1,4 +1,8 @@
+import multiprocessing
 import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 
 from jose import jwt
@@ -12,22 +16,116 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey-change-in-production")
 ALGORITHM = "HS256"
 
+# bcrypt cost factor; hashes with a different cost are upgraded on next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Processes that run bcrypt off the request threads (0 = hash inline)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(os.cpu_count() or 1, 4))))
+# Hashing jobs allowed in flight or queued before new ones get a 503 (0 = no bound)
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(max(PASSWORD_HASH_WORKERS, 1) * 4)))
+
 # Import PassLib CryptContext
 # Create a pwd_context using "bcrypt", deprecated="auto"
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class PasswordHashingBusy(Exception):
+    """Raised when the password hashing queue is full; the API answers 503."""
+
+
+# Module-level so they can be pickled into the worker processes
+
+def hash_password(password: str) -> str:
+    """Hash in the calling process. Requests use `get_password_hash`, which
+    goes through the shared pool; batch jobs can map this over their own."""
+
+    return pwd_context.hash(password)
+
+def _verify_and_update(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    try:
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+    except Exception:
+        return False, None
+
+
+class PasswordHasher:
+    """Runs bcrypt in a dedicated process pool, outside the GIL.
+
+    A burst of logins then can't starve the request threadpool of CPU, and
+    `max_pending` bounds the queue: beyond it requests fail fast with
+    `PasswordHashingBusy` instead of piling up behind each other.
+    `max_pending <= 0` means no bound.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending) if max_pending > 0 else None
+        self._executor: ProcessPoolExecutor | None = None
+        self._executor_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                # The pool starts lazily inside a threaded server, where fork()
+                # can copy a lock held by another thread and deadlock the worker
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._executor
+
+    def run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+
+        if self._slots is not None and not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self.rejected += 1
+            raise PasswordHashingBusy()
+        try:
+            result = self._pool().submit(fn, *args).result()
+            with self._stats_lock:
+                self.completed += 1
+            return result
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    def shutdown(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def stats(self) -> dict[str, int]:
+        with self._stats_lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
 
 # Define a function get_password_hash(password) that returns the hashed password
 # Define a function verify_password(plain_password, hashed_password) that returns True if they match
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return password_hasher.run(hash_password, password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    try:
-        return pwd_context.verify(plain_password, hashed_password)
-    except Exception:
-        return False
+    return verify_and_update_password(plain_password, hashed_password)[0]
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Verify a password; also returns a fresh hash if the stored one is outdated
+    (e.g. `BCRYPT_ROUNDS` changed), or None."""
+
+    return password_hasher.run(_verify_and_update, plain_password, hashed_password)
 
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
@@ -41,8 +139,9 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
 
-    # Add "exp": expire to the dict
+    # Add "exp": expire to the dict, and a unique id so the token can be revoked
     to_encode.update({"exp": expire})
+    to_encode.setdefault("jti", uuid.uuid4().hex)
 
     # Return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
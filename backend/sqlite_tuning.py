@@ -0,0 +1,137 @@
+"""Production PRAGMA profile for file-backed SQLite databases.
+
+Without tuning, SQLite runs in rollback-journal mode: readers block behind
+writers, and a writer that finds the database busy fails with "database is
+locked". A `connect` event therefore sets up every new connection with:
+
+- `journal_mode=WAL`: readers no longer block writers, and vice versa.
+- `synchronous=NORMAL`: in WAL mode this is still safe across crashes.
+  Only the last transactions may be lost on power failure.
+- `busy_timeout`: wait for the write lock instead of failing immediately.
+- `mmap_size` / `cache_size`: memory-mapped reads and a bigger page cache.
+
+SQLite allows one writer at a time. The optional write lock makes threads of
+this process queue in Python for the first write statement of a
+transaction. This replaces spinning in SQLite's busy handler, and the lock is
+released on commit or rollback. Other processes are still covered by
+`busy_timeout` only.
+
+Every setting can be overridden from the environment (see `.env.example`).
+Set `SQLITE_TUNING=0` to keep SQLite's defaults.
+"""
+
+import logging
+import os
+import threading
+
+from sqlalchemy import event
+
+logger = logging.getLogger("uvicorn.error")
+
+SQLITE_TUNING = os.getenv("SQLITE_TUNING", "1").lower() in ("1", "true", "yes")
+SQLITE_WRITE_LOCK = os.getenv("SQLITE_WRITE_LOCK", "1").lower() in ("1", "true", "yes")
+
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000")),  # ms
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),  # bytes
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),  # negative = KiB, i.e. 64 MiB
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+}
+
+_WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def _is_file_database(engine) -> bool:
+    database = engine.url.database or ""
+    if engine.dialect.name != "sqlite" or database in ("", ":memory:"):
+        return False
+    return not database.startswith("file::memory:")
+
+
+def _set_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+class WriteLock:
+    """Per-process lock held from a transaction's first write until it ends.
+
+    The holder is the connection (flagged in its `info`), not a thread: a
+    transaction may be committed, rolled back or checked in on another thread
+    than the one that wrote, and whichever thread ends it releases the lock.
+    A second write transaction opened while one is pending (from any thread)
+    waits at most `timeout_ms`, as it would in SQLite's busy handler.
+    """
+
+    def __init__(self, timeout_ms: int):
+        self.timeout = timeout_ms / 1000
+        self._lock = threading.BoundedSemaphore(1)
+        self._stats_lock = threading.Lock()
+        self.acquired = 0
+        self.timeouts = 0
+
+    def before_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        if conn.info.get("sqlite_write_lock") or not statement.lstrip().upper().startswith(_WRITE_PREFIXES):
+            return
+        acquired = self._lock.acquire(timeout=self.timeout)
+        if acquired:
+            conn.info["sqlite_write_lock"] = True
+        with self._stats_lock:
+            if acquired:
+                self.acquired += 1
+            else:
+                # Give up queueing here; SQLite's own busy_timeout still applies
+                self.timeouts += 1
+
+    def release(self, info: dict) -> None:
+        # pop(): commit, rollback and checkin can all fire for one transaction
+        if info.pop("sqlite_write_lock", False):
+            self._lock.release()
+
+    def attach(self, engine) -> None:
+        event.listen(engine, "before_cursor_execute", self.before_execute)
+        event.listen(engine, "commit", lambda conn: self.release(conn.info))
+        event.listen(engine, "rollback", lambda conn: self.release(conn.info))
+        # Connections returned to the pool without an explicit commit/rollback
+        event.listen(engine.pool, "checkin", lambda dbapi_connection, record: self.release(record.info))
+
+    def stats(self) -> dict[str, int]:
+        return {"acquired": self.acquired, "timeouts": self.timeouts}
+
+
+write_lock = WriteLock(SQLITE_PRAGMAS["busy_timeout"])
+
+
+def apply_profile(engine, serialize_writes: bool = SQLITE_WRITE_LOCK) -> bool:
+    """Install the PRAGMA profile (and the write lock) on a file-backed SQLite engine.
+
+    Returns False, changing nothing, for other databases, in-memory SQLite or
+    `SQLITE_TUNING=0`.
+    """
+
+    if not SQLITE_TUNING or not _is_file_database(engine):
+        return False
+    event.listen(engine, "connect", _set_pragmas)
+    if serialize_writes:
+        write_lock.attach(engine)
+    return True
+
+
+def log_effective_pragmas(engine) -> None:
+    """Log what SQLite actually applied (e.g. WAL can't be enabled on some filesystems)."""
+
+    if not _is_file_database(engine):
+        return
+    with engine.connect() as connection:
+        effective = {
+            name: connection.exec_driver_sql(f"PRAGMA {name}").scalar() for name in SQLITE_PRAGMAS
+        }
+    lock = "on" if SQLITE_TUNING and SQLITE_WRITE_LOCK else "off"
+    settings = ", ".join(f"{name}={value}" for name, value in effective.items())
+    logger.info("SQLite PRAGMAs: %s; write lock %s", settings, lock)
@@ -0,0 +1,262 @@
+"""Assign catalog image URLs.
+
+    python sweet_images.py [--dry-run] [--force] [--chunk-size 1000] [--checkpoint PATH] [--restart]
+
+Images are served from the frontend's public assets (`frontend/public/sweets`).
+A sweet gets the image mapped to its exact name in `NAME_TO_IMAGE_URL`, or
+else the default image for its category. Only rows without an image, or with
+one of the old placeholder SVGs, are changed. `--force` also replaces other
+URLs of sweets in the name map.
+
+The catalog is processed in primary-key chunks. Each chunk is one UPDATE per
+rule, and the rule's whole mapping is a `CASE` expression, so no rows are
+loaded into Python. Every chunk commits on its own, then records its last id
+in the checkpoint file. An interrupted run resumes after that id, and the
+file is removed once the run completes. Re-running a chunk is harmless: the
+UPDATEs only match rows whose URL would change. `--dry-run` counts those rows
+and writes nothing.
+
+The UPDATEs bypass the API, so a running server keeps serving cached catalog
+pages until they expire (`CATALOG_CACHE_TTL`).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Callable
+
+from sqlalchemy import case, func, or_, select, update
+
+from models import Sweet, normalize_category
+
+CHUNK_SIZE = 1000
+CHECKPOINT_PATH = Path("sweet_images.checkpoint.json")
+
+# Seed/default values from older versions; these files no longer exist in the frontend.
+PLACEHOLDER_IMAGE_URLS = {
+    "/sweets/indian.svg",
+    "/sweets/chocolate.svg",
+    "/sweets/candy.svg",
+    "/sweets/cake.svg",
+    "/sweets/cookie.svg",
+    "/sweets/icecream.svg",
+}
+
+NAME_TO_IMAGE_URL: dict[str, str] = {
+    # Indian sweets
+    "Gulab Jamun": "/sweets/gulab_jamun.jpg",
+    "Rasgulla": "/sweets/rasgulla.jpg",
+    "Jalebi": "/sweets/jalebi.webp",
+    "Ladoo": "/sweets/gulab_jamun.jpg",
+    "Barfi": "/sweets/kaju_katli.jpg",
+    "Kaju Katli": "/sweets/kaju_katli.jpg",
+    "Rasmalai": "/sweets/rasgulla.jpg",
+    "Mysore Pak": "/sweets/kaju_katli.jpg",
+
+    # Chocolate
+    "Dark Chocolate Bar": "/sweets/dark_chocolate_bark.jpg",
+    "Dark Chocolate Bark": "/sweets/dark_chocolate_bark.jpg",
+    "Milk Chocolate": "/sweets/wonka-bar.jpeg",
+    "Chocolate Truffle": "/sweets/chocolate_truffle.jpg",
+    "Ferrero Rocher": "/sweets/chocolate_truffle.jpg",
+    "Kit Kat": "/sweets/wonka-bar.jpeg",
+    "Snickers": "/sweets/wonka-bar.jpeg",
+    "Wonka Bar": "/sweets/wonka-bar.jpeg",
+
+    # Cookies
+    "Chocolate Chip Cookies": "/sweets/chocochip_cookies.jpg",
+    "Choco Chip Cookies": "/sweets/chocochip_cookies.jpg",
+    "Oreo": "/sweets/chocochip_cookies.jpg",
+    "Butter Cookies": "/sweets/butter_cookies.jpg",
+    "Coconut Cookies": "/sweets/butter_cookies.jpg",
+
+    # Cakes / pastries
+    "Black Forest Cake": "/sweets/red_velvet_cupcake.webp",
+    "Vanilla Cupcake": "/sweets/red_velvet_cupcake.webp",
+    "Red Velvet Cake": "/sweets/red_velvet_cupcake.webp",
+    "Red Velvet Cupcake": "/sweets/red_velvet_cupcake.webp",
+    "Chocolate Pastry": "/sweets/chocolate_brownie.jpg",
+    "Chocolate Brownie": "/sweets/chocolate_brownie.jpg",
+
+    # Candy
+    "Lollipop": "/sweets/sour_worms.jpg",
+    "Gummy Bears": "/sweets/gummy_bears.jpg",
+    "Sour Worms": "/sweets/sour_worms.jpg",
+    "Cotton Candy": "/sweets/sour_worms.jpg",
+    "Peppermint Candy": "/sweets/sour_worms.jpg",
+
+    # Ice cream
+    "Vanilla Ice Cream": "/sweets/vanilla_icecream_cup.jpg",
+    "Vanilla Ice Cream Cup": "/sweets/vanilla_icecream_cup.jpg",
+    "Chocolate Ice Cream": "/sweets/ice_cream.svg",
+    "Strawberry Ice Cream": "/sweets/ice_cream.svg",
+    "Mango Ice Cream": "/sweets/mango_kulfi.jpg",
+    "Mango Kulfi": "/sweets/mango_kulfi.jpg",
+}
+
+# Keyed by models.normalize_category
+CATEGORY_TO_IMAGE_URL: dict[str, str] = {
+    "indian": "/sweets/gulab_jamun.jpg",
+    "chocolate": "/sweets/dark_chocolate_bark.jpg",
+    "candy": "/sweets/gummy_bears.jpg",
+    "cake": "/sweets/red_velvet_cupcake.webp",
+    "cookie": "/sweets/chocochip_cookies.jpg",
+    "cookies": "/sweets/chocochip_cookies.jpg",
+    "ice_cream": "/sweets/ice_cream.svg",
+    "icecream": "/sweets/ice_cream.svg",
+}
+
+
+def default_image_url_for_category(category: str | None) -> str | None:
+    if not category:
+        return None
+    return CATEGORY_TO_IMAGE_URL.get(normalize_category(category))
+
+
+def _replaceable():
+    return or_(Sweet.image_url.is_(None), Sweet.image_url.in_(sorted(PLACEHOLDER_IMAGE_URLS)))
+
+
+def _rules(force: bool) -> dict[str, tuple]:
+    """(target URL expression, row filter) per rule; the filters don't overlap."""
+
+    by_name = case(NAME_TO_IMAGE_URL, value=Sweet.name)
+    by_category = case(CATEGORY_TO_IMAGE_URL, value=Sweet.category_key)
+    return {
+        "by_name": (
+            by_name,
+            Sweet.name.in_(list(NAME_TO_IMAGE_URL)),
+            Sweet.image_url.is_distinct_from(by_name),
+            *(() if force else (_replaceable(),)),
+        ),
+        "by_category": (
+            by_category,
+            Sweet.name.not_in(list(NAME_TO_IMAGE_URL)),
+            Sweet.category_key.in_(list(CATEGORY_TO_IMAGE_URL)),
+            Sweet.image_url.is_distinct_from(by_category),
+            _replaceable(),
+        ),
+    }
+
+
+def _chunk_end(connection, after: int, size: int) -> int | None:
+    """Id of the `size`-th row after `after` (or the last one); None when there are none left."""
+
+    later = select(Sweet.id).where(Sweet.id > after)
+    end = connection.execute(later.order_by(Sweet.id).offset(size - 1).limit(1)).scalar()
+    if end is None:
+        end = connection.execute(select(func.max(Sweet.id)).where(Sweet.id > after)).scalar()
+    return end
+
+
+def _load_checkpoint(path: Path | None, force: bool) -> dict:
+    if path is None or not path.exists():
+        return {"after": 0, "scanned": 0, "by_name": 0, "by_category": 0, "force": force}
+    state = json.loads(path.read_text())
+    if state.get("force") != force:
+        raise SystemExit(f"{path} was written by a run with force={state.get('force')}; pass --restart to start over")
+    return state
+
+
+def update_images(
+    engine,
+    chunk_size: int = CHUNK_SIZE,
+    force: bool = False,
+    dry_run: bool = False,
+    checkpoint: Path | None = None,
+    progress: Callable[[str], None] | None = None,
+) -> dict[str, float]:
+    """Apply the image rules to the whole catalog; returns row counts and elapsed seconds.
+
+    With a `checkpoint` path the run resumes from it and keeps it current.
+    Counts include the chunks done before a resume.
+    """
+
+    state = _load_checkpoint(checkpoint, force)
+    rules = _rules(force)
+    started = time.perf_counter()
+    scanned_here = 0
+
+    while True:
+        with engine.begin() as connection:
+            after = state["after"]
+            end = _chunk_end(connection, after, chunk_size)
+            if end is None:
+                break
+
+            in_chunk = (Sweet.id > after, Sweet.id <= end)
+            scanned = connection.execute(select(func.count()).where(*in_chunk)).scalar()
+            changed = {}
+            for name, (target, *conditions) in rules.items():
+                if dry_run:
+                    statement = select(func.count()).where(*in_chunk, *conditions)
+                    changed[name] = connection.execute(statement).scalar()
+                else:
+                    statement = update(Sweet).where(*in_chunk, *conditions).values(image_url=target)
+                    changed[name] = connection.execute(statement).rowcount
+
+        state["after"] = end
+        state["scanned"] += scanned
+        for name, count in changed.items():
+            state[name] += count
+        scanned_here += scanned
+
+        if checkpoint is not None and not dry_run:
+            # Written after the commit: a crash in between only repeats this (idempotent) chunk
+            checkpoint.write_text(json.dumps(state))
+        if progress is not None:
+            elapsed = time.perf_counter() - started
+            rate = scanned_here / elapsed if elapsed else 0
+            progress(f"ids {after + 1}..{end}: {sum(changed.values())} to update ({rate:.0f} rows/s)")
+
+    if checkpoint is not None and not dry_run:
+        checkpoint.unlink(missing_ok=True)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "scanned": state["scanned"],
+        "by_name": state["by_name"],
+        "by_category": state["by_category"],
+        "seconds": elapsed,
+        "rows_per_second": scanned_here / elapsed if elapsed else 0.0,
+    }
+
+
+def main() -> None:
+    from database import engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="count the rows that would change; write nothing")
+    parser.add_argument("--force", action="store_true", help="replace any URL of sweets in the name map")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--checkpoint", type=Path, default=CHECKPOINT_PATH)
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    if args.restart and not args.dry_run:
+        args.checkpoint.unlink(missing_ok=True)
+    elif args.checkpoint.exists() and not args.restart:
+        print(f"Resuming from {args.checkpoint}")
+
+    report = update_images(
+        engine,
+        chunk_size=args.chunk_size,
+        force=args.force,
+        dry_run=args.dry_run,
+        # A dry run reads the checkpoint (to show what's left) but never writes it;
+        # with --restart it ignores the checkpoint instead of deleting it
+        checkpoint=None if args.restart and args.dry_run else args.checkpoint,
+        progress=print,
+    )
+    verb = "Would update" if args.dry_run else "Updated"
+    print(f"{verb} by name: {report['by_name']}")
+    print(f"{verb} by category: {report['by_category']}")
+    print(f"Scanned: {report['scanned']} sweets")
+    print(f"Took {report['seconds']:.1f}s ({report['rows_per_second']:.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
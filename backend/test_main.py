@@ -1,6 +1,11 @@
 # Import FastAPI, Depends, and HTTPException
+import time
+import pytest
 from fastapi import FastAPI, Depends, HTTPException
+from sqlalchemy import text
+from sqlmodel import select
 from main import app
+from models import Sweet, User
 
 # We don't need to create a client here because the fixture in conftest.py handles it,
 # but we import it to keep the linter happy if needed.
@@ -228,3 +233,1250 @@ def test_restock_sweet_admin_only(client):
     )
     assert admin_restock.status_code == 200
     assert admin_restock.json()["new_stock"] == 11
+
+def test_read_sweets_keyset_pagination(client, admin_headers):
+    for i, price in enumerate([3.0, 1.0, 2.0, 1.0]):
+        client.post(
+            "/sweets/",
+            json={"name": f"Page {i}", "category": "Test", "price": price, "quantity": 1},
+            headers=admin_headers,
+        )
+
+    # Unpaginated listing still returns everything
+    assert len(client.get("/sweets/").json()) == 4
+
+    # Page by id, two at a time, with the optional total
+    first = client.get("/sweets/?limit=2&include_total=true")
+    assert first.status_code == 200
+    assert [s["name"] for s in first.json()] == ["Page 0", "Page 1"]
+    assert first.headers["X-Total-Count"] == "4"
+    second = client.get(f"/sweets/?limit=2&after={first.headers['X-Next-Cursor']}")
+    assert [s["name"] for s in second.json()] == ["Page 2", "Page 3"]
+    last = client.get(f"/sweets/?limit=2&after={second.headers['X-Next-Cursor']}")
+    assert last.json() == []
+    assert "X-Next-Cursor" not in last.headers
+
+    # Page by (price, id), ties on price broken by id
+    names = []
+    cursor = None
+    while True:
+        url = "/sweets/search?order=price&limit=3" + (f"&after={cursor}" if cursor else "")
+        page = client.get(url)
+        names += [s["name"] for s in page.json()]
+        cursor = page.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert names == ["Page 1", "Page 3", "Page 2", "Page 0"]
+
+    assert client.get("/sweets/?after=not-a-cursor").status_code == 400
+    assert client.get("/sweets/?order=name").status_code == 400
+
+    # Well-formed cursors whose values don't fit the order's key columns
+    from pagination import encode_cursor
+    for order, values in [("id", ("5",)), ("id", (True,)), ("price", ("cheap", 1)), ("price", (1.5, 2.5)), ("price", (None, 1))]:
+        response = client.get(f"/sweets/?order={order}&after={encode_cursor(values)}")
+        assert (response.status_code, response.json()["detail"]) == (400, "Invalid cursor")
+    assert client.get(f"/sweets/?order=price&after={encode_cursor((2, 1))}").status_code == 200
+
+def test_read_sweets_field_projection(client, admin_headers):
+    client.post(
+        "/sweets/",
+        json={"name": "Projected", "category": "Test", "price": 1.5, "quantity": 3},
+        headers=admin_headers,
+    )
+
+    response = client.get("/sweets/?fields=name,price")
+    assert response.status_code == 200
+    assert response.json() == [{"id": 1, "name": "Projected", "price": 1.5}]
+
+    response = client.get("/sweets/search?name=proj&fields=quantity")
+    assert response.json() == [{"id": 1, "quantity": 3}]
+
+    assert client.get("/sweets/?fields=password_hash").status_code == 400
+
+def test_catalog_cache_read_through_and_invalidation(client, admin_headers):
+    from cache import catalog_cache
+
+    create_res = client.post(
+        "/sweets/",
+        json={"name": "Cached", "category": "Test", "price": 1.0, "quantity": 5},
+        headers=admin_headers,
+    )
+    sweet_id = create_res.json()["id"]
+
+    before = catalog_cache.stats()
+    assert client.get(f"/sweets/{sweet_id}").json()["quantity"] == 5
+    assert client.get(f"/sweets/{sweet_id}").json()["quantity"] == 5
+    after = catalog_cache.stats()
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 1
+
+    # Writes invalidate, so the next read sees the new stock
+    client.post(f"/sweets/{sweet_id}/purchase?quantity=2")
+    assert client.get(f"/sweets/{sweet_id}").json()["quantity"] == 3
+    client.post(f"/sweets/{sweet_id}/restock?quantity=4", headers=admin_headers)
+    assert client.get("/sweets/").json()[0]["quantity"] == 7
+
+    stats = client.get("/internal/cache", headers=admin_headers).json()
+    assert {"hits", "misses", "evictions", "entries"} <= stats.keys()
+
+def test_lru_cache_evicts_least_recently_used():
+    from cache import LRUCache, _MISSING
+
+    lru = LRUCache(max_entries=2)
+    lru.set("a", 1, ttl=60)
+    lru.set("b", 2, ttl=60)
+    assert lru.get("a") == 1
+    lru.set("c", 3, ttl=60)
+
+    assert lru.get("b") is _MISSING
+    assert lru.get("a") == 1
+    assert lru.stats()["evictions"] == 1
+
+def test_catalog_cache_skips_values_loaded_across_an_invalidation():
+    from cache import CatalogCache, LRUCache
+
+    cache = CatalogCache(LRUCache(max_entries=10), ttl=60)
+    stock = {"quantity": 5}
+
+    def load_then_write():
+        value = dict(stock)
+        # A write commits (and invalidates) while this reader is still loading
+        stock["quantity"] = 3
+        cache.invalidate()
+        return value
+
+    assert cache.get_or_load("k", load_then_write) == {"quantity": 5}
+    assert cache.get_or_load("k", lambda: dict(stock)) == {"quantity": 3}
+    assert cache.get_or_load("k", lambda: {"quantity": -1}) == {"quantity": 3}
+
+def test_search_sweets_uses_text_index(client, admin_headers, session):
+    from database import search_backend
+
+    for name, category in [("Jelly Bean Mix", "Jelly"), ("Bean Jelly", "Jelly"), ("Kaju Katli", "Indian")]:
+        client.post(
+            "/sweets/",
+            json={"name": name, "category": category, "price": 1.0, "quantity": 1},
+            headers=admin_headers,
+        )
+
+    # Substring, case-insensitive, ranked by relevance by default
+    names = [s["name"] for s in client.get("/sweets/search?name=JELL").json()]
+    assert sorted(names) == ["Bean Jelly", "Jelly Bean Mix"]
+    assert [s["name"] for s in client.get("/sweets/search?name=atl").json()] == ["Kaju Katli"]
+    # Short terms still match (via ilike)
+    assert len(client.get("/sweets/search?name=ka").json()) == 1
+    assert client.get("/sweets/search?name=jelly&after=abc&order=relevance").status_code == 400
+
+    # Paginated name searches without an order page by id, cursor included
+    first = client.get("/sweets/search?name=jelly&limit=1")
+    rest = client.get(f"/sweets/search?name=jelly&limit=1&after={first.headers['X-Next-Cursor']}")
+    assert [s["name"] for s in first.json() + rest.json()] == ["Jelly Bean Mix", "Bean Jelly"]
+
+    # Renames are picked up by the sync triggers
+    sweet_id = client.get("/sweets/search?name=kaju").json()[0]["id"]
+    client.put(
+        f"/sweets/{sweet_id}",
+        json={"name": "Soan Papdi", "category": "Indian", "price": 1.0, "quantity": 1},
+        headers=admin_headers,
+    )
+    assert client.get("/sweets/search?name=kaju").json() == []
+    assert len(client.get("/sweets/search?name=papdi").json()) == 1
+
+    if search_backend.name == "sqlite-fts5":
+        statement = select(Sweet.id).where(search_backend.name_filter("jelly"))
+        plan = session.exec(text("EXPLAIN QUERY PLAN " + str(statement.compile(compile_kwargs={"literal_binds": True})))).all()
+        assert any("VIRTUAL TABLE" in row[3] for row in plan)
+
+def test_sweet_categories_facets(client, admin_headers, session):
+    import category_summary
+
+    created = []
+    for name, category, quantity in [
+        ("Vanilla Cup", "Ice Cream", 10),
+        ("Mango Kulfi", "Ice_Cream", 5),
+        ("Jalebi", "Indian", 7),
+    ]:
+        res = client.post(
+            "/sweets/",
+            json={"name": name, "category": category, "price": 1.0, "quantity": quantity},
+            headers=admin_headers,
+        )
+        created.append(res.json()["id"])
+
+    client.post(f"/sweets/{created[0]}/purchase?quantity=3")
+    client.post(f"/sweets/{created[2]}/restock?quantity=3", headers=admin_headers)
+    client.put(
+        f"/sweets/{created[1]}",
+        json={"name": "Mango Kulfi", "category": "Indian", "price": 1.0, "quantity": 6},
+        headers=admin_headers,
+    )
+
+    response = client.get("/sweets/categories")
+    assert response.status_code == 200
+    assert response.json() == [
+        {"category": "ice_cream", "label": "Ice Cream", "item_count": 1, "total_stock": 7},
+        {"category": "indian", "label": "Indian", "item_count": 2, "total_stock": 16},
+    ]
+
+    client.delete(f"/sweets/{created[0]}", headers=admin_headers)
+    assert [c["category"] for c in client.get("/sweets/categories").json()] == ["indian"]
+
+    # The incremental counts agree with a full recompute
+    incremental = category_summary.list_categories(session)
+    category_summary.rebuild(session)
+    session.commit()
+    assert category_summary.list_categories(session) == incremental
+
+def test_search_sweets_by_normalized_category(client, admin_headers, session):
+    for name, category, price in [
+        ("Vanilla Cup", "Ice Cream", 2.0),
+        ("Mango Kulfi", "ice-cream", 4.0),
+        ("Choco Cone", "Ice_Cream", 6.0),
+        ("Jalebi", "Indian", 3.0),
+    ]:
+        client.post(
+            "/sweets/",
+            json={"name": name, "category": category, "price": price, "quantity": 1},
+            headers=admin_headers,
+        )
+
+    response = client.get("/sweets/search?category=ICE CREAM&min_price=3&max_price=6")
+    assert [s["name"] for s in response.json()] == ["Mango Kulfi", "Choco Cone"]
+    assert "category_key" not in response.json()[0]
+    assert len(client.get("/sweets/search?category=ice_cream,indian").json()) == 4
+
+    statement = select(Sweet.id).where(Sweet.category_key == "ice_cream", Sweet.price >= 3)
+    plan = session.exec(text("EXPLAIN QUERY PLAN " + str(statement.compile(compile_kwargs={"literal_binds": True})))).all()
+    assert "ix_sweet_category_key_price" in plan[0][3]
+
+def test_export_sweets_streams_ndjson_and_csv(client, admin_headers, session):
+    import csv
+    import io
+    import json
+    import export
+
+    for i in range(5):
+        session.add(Sweet(name=f"Export {i}", category="Test", price=1.5 + i, quantity=i))
+    session.commit()
+
+    assert client.get("/sweets/export").status_code == 401
+
+    response = client.get("/sweets/export?format=ndjson", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["name"] for r in rows] == [f"Export {i}" for i in range(5)]
+    assert rows[0] == {"id": 1, "name": "Export 0", "category": "Test", "price": 1.5, "quantity": 0, "image_url": None}
+
+    response = client.get("/sweets/export?format=csv", headers=admin_headers)
+    assert response.status_code == 200
+    records = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(records) == 5
+    assert records[4]["price"] == "5.5"
+
+    # Rows are produced in batches, not as one buffered document
+    assert len(list(export.ndjson_chunks(session, batch_size=2))) == 3
+
+    assert client.get("/sweets/export?format=xml", headers=admin_headers).status_code == 400
+
+def test_fast_json_responses_are_byte_compatible(client, admin_headers, monkeypatch):
+    import main
+    from cache import catalog_cache
+
+    for name, price in [("Kaju Katlī", 6.99), ("Gummy \"Bears\"", 2.1), ("Ladoo", 3.0)]:
+        client.post(
+            "/sweets/",
+            json={"name": name, "category": "Mithai", "price": price, "quantity": 4},
+            headers=admin_headers,
+        )
+
+    urls = [
+        "/sweets/",
+        "/sweets/?limit=2&fields=name,price",
+        "/sweets/search?name=kaju&include_total=true",
+        "/sweets/search?category=mithai&order=price",
+        "/sweets/1",
+    ]
+    default = [client.get(url) for url in urls]
+
+    monkeypatch.setattr(main, "FAST_JSON_RESPONSES", True)
+    catalog_cache.invalidate()
+    fast = [client.get(url) for url in urls]
+
+    for slow_res, fast_res in zip(default, fast):
+        assert fast_res.status_code == 200
+        assert fast_res.content == slow_res.content
+        assert fast_res.headers["content-type"] == slow_res.headers["content-type"]
+        assert fast_res.headers.get("X-Next-Cursor") == slow_res.headers.get("X-Next-Cursor")
+        assert fast_res.headers.get("X-Total-Count") == slow_res.headers.get("X-Total-Count")
+
+    assert client.get("/sweets/999").status_code == 404
+
+def test_purchase_is_a_single_conditional_update(client, admin_headers, session):
+    from sqlalchemy import event
+
+    sweet_id = client.post(
+        "/sweets/",
+        json={"name": "Atomic", "category": "Test", "price": 1.0, "quantity": 3},
+        headers=admin_headers,
+    ).json()["id"]
+
+    statements = []
+    engine = session.get_bind()
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        response = client.post(f"/sweets/{sweet_id}/purchase?quantity=2")
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert response.json()["remaining_stock"] == 1
+    assert not any(s.lstrip().upper().startswith("SELECT") for s in statements)
+    assert any("quantity >=" in s for s in statements if s.startswith("UPDATE sweet"))
+
+    not_enough = client.post(f"/sweets/{sweet_id}/purchase?quantity=2")
+    assert not_enough.status_code == 400
+    assert not_enough.json()["detail"] == "Not enough stock"
+    client.post(f"/sweets/{sweet_id}/purchase?quantity=1")
+    out = client.post(f"/sweets/{sweet_id}/purchase")
+    assert (out.status_code, out.json()["detail"]) == (400, "Out of stock")
+    assert client.post(f"/sweets/{sweet_id}/purchase?quantity=0").status_code == 400
+    assert client.post("/sweets/999/purchase").status_code == 404
+    assert client.post("/sweets/999/purchase?quantity=0").status_code == 404
+    assert client.get(f"/sweets/{sweet_id}").json()["quantity"] == 0
+
+def test_purchase_without_returning_support(session, monkeypatch):
+    import inventory
+
+    session.add(Sweet(name="Legacy", category="Test", price=1.0, quantity=2))
+    session.commit()
+    monkeypatch.setattr(inventory, "supports_update_returning", lambda session: False)
+
+    assert inventory.purchase(session, 1, 2) == 0
+    try:
+        inventory.purchase(session, 1, 1)
+        assert False, "expected InsufficientStock"
+    except inventory.InsufficientStock as exc:
+        assert exc.detail == "Out of stock"
+
+    # A checkout names the sweet that was short, not the first one in the order
+    session.add_all([Sweet(name="Plenty", category="Test", price=1.0, quantity=9),
+                     Sweet(name="Scarce", category="Test", price=1.0, quantity=1)])
+    session.commit()
+    try:
+        inventory.checkout(session, [(2, 1), (3, 2)])
+        assert False, "expected InsufficientStock"
+    except inventory.InsufficientStock as exc:
+        assert exc.detail == "Not enough stock (sweet_id=3)"
+    session.rollback()
+    assert inventory.checkout(session, [(2, 4), (3, 1)]) == {2: 5, 3: 0}
+
+def test_checkout_is_all_or_nothing(client, admin_headers):
+    ids = []
+    for name, quantity in [("Cart A", 5), ("Cart B", 2), ("Cart C", 9)]:
+        res = client.post(
+            "/sweets/",
+            json={"name": name, "category": "Cart", "price": 1.0, "quantity": quantity},
+            headers=admin_headers,
+        )
+        ids.append(res.json()["id"])
+
+    response = client.post(
+        "/orders/checkout",
+        json={"items": [{"sweet_id": ids[2], "quantity": 4}, {"sweet_id": ids[0], "quantity": 1}, {"sweet_id": ids[0], "quantity": 2}]},
+    )
+    assert response.status_code == 200
+    assert response.json()["lines"] == [
+        {"sweet_id": ids[2], "purchased_qty": 4, "remaining_stock": 5},
+        {"sweet_id": ids[0], "purchased_qty": 1, "remaining_stock": 2},
+        {"sweet_id": ids[0], "purchased_qty": 2, "remaining_stock": 2},
+    ]
+
+    # One short line fails the whole order and leaves every stock level alone
+    response = client.post(
+        "/orders/checkout",
+        json={"items": [{"sweet_id": ids[0], "quantity": 1}, {"sweet_id": ids[1], "quantity": 3}]},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == f"Not enough stock (sweet_id={ids[1]})"
+    assert [client.get(f"/sweets/{i}").json()["quantity"] for i in ids] == [2, 2, 5]
+
+    missing = client.post("/orders/checkout", json={"items": [{"sweet_id": 999, "quantity": 1}]})
+    assert missing.status_code == 404
+    assert client.post("/orders/checkout", json={"items": []}).status_code == 400
+
+    categories = client.get("/sweets/categories").json()
+    assert categories[0]["total_stock"] == 9
+
+def test_purchase_combiner_settles_concurrent_buyers_in_one_commit(session):
+    import threading
+    from inventory import InsufficientStock
+    from purchase_batching import PurchaseCombiner
+
+    session.add(Sweet(name="Hot Item", category="Promo", price=1.0, quantity=10))
+    session.commit()
+    combiner = PurchaseCombiner(window_ms=200)
+
+    quantities = [3, 4, 5, 2, 1]
+    results: dict[int, object] = {}
+    start = threading.Barrier(len(quantities))
+
+    def buy(index: int, quantity: int):
+        start.wait()
+        time.sleep(0.01 * index)  # arrive in a known order within the window
+        try:
+            results[index] = combiner.purchase(session, 1, quantity)
+        except InsufficientStock as exc:
+            results[index] = exc.detail
+
+    threads = [threading.Thread(target=buy, args=(i, q)) for i, q in enumerate(quantities)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {0: 7, 1: 3, 2: "Not enough stock", 3: 1, 4: 0}
+    assert combiner.stats()["batches"] == 1
+    assert session.exec(select(Sweet.quantity).where(Sweet.id == 1)).one() == 0
+
+    # A later purchase starts a fresh batch against the committed stock
+    try:
+        combiner.purchase(session, 1, 1)
+        assert False, "expected InsufficientStock"
+    except InsufficientStock as exc:
+        assert exc.detail == "Out of stock"
+
+def test_sales_ledger_and_rollups(client, admin_headers, session):
+    from models import SaleRecord
+
+    ids = []
+    for name, category, price in [("Ledger A", "Ice Cream", 2.5), ("Ledger B", "ice_cream", 4.0), ("Ledger C", "Indian", 1.0)]:
+        res = client.post(
+            "/sweets/",
+            json={"name": name, "category": category, "price": price, "quantity": 20},
+            headers=admin_headers,
+        )
+        ids.append(res.json()["id"])
+
+    client.post(f"/sweets/{ids[0]}/purchase?quantity=2")
+    client.post("/orders/checkout", json={"items": [{"sweet_id": ids[1], "quantity": 1}, {"sweet_id": ids[2], "quantity": 3}]})
+    # Failed purchases leave no trace in the ledger
+    client.post(f"/sweets/{ids[2]}/purchase?quantity=100")
+
+    ledger = session.exec(select(SaleRecord).order_by(SaleRecord.id)).all()
+    assert [(r.sweet_id, r.category_key, r.quantity, r.unit_price) for r in ledger] == [
+        (ids[0], "ice_cream", 2, 2.5),
+        (ids[1], "ice_cream", 1, 4.0),
+        (ids[2], "indian", 3, 1.0),
+    ]
+
+    response = client.get("/reports/sales?granularity=day&scope=category", headers=admin_headers)
+    assert response.status_code == 200
+    assert [(r["key"], r["units"], r["revenue"], r["sales"]) for r in response.json()] == [
+        ("ice_cream", 3, 9.0, 2),
+        ("indian", 3, 3.0, 1),
+    ]
+
+    hourly = client.get(f"/reports/sales?granularity=hour&scope=sweet&key={ids[0]}", headers=admin_headers).json()
+    assert [(r["units"], r["revenue"]) for r in hourly] == [(2, 5.0)]
+
+    assert client.get("/reports/sales?granularity=week", headers=admin_headers).status_code == 400
+    assert client.get("/reports/sales").status_code == 401
+
+def test_login_rehashes_outdated_password_hash(client, session):
+    from passlib.hash import bcrypt
+    from security import pwd_context
+
+    weak_hash = bcrypt.using(rounds=4).hash("oldrounds")
+    session.add(User(username="legacy", password_hash=weak_hash, role="customer"))
+    session.commit()
+
+    response = client.post("/auth/login", data={"username": "legacy", "password": "oldrounds"})
+    assert response.status_code == 200
+
+    user = session.exec(select(User).where(User.username == "legacy")).one()
+    assert user.password_hash != weak_hash
+    assert not pwd_context.needs_update(user.password_hash)
+    assert pwd_context.verify("oldrounds", user.password_hash)
+
+def test_password_hashing_admission_control(client, session, monkeypatch):
+    import security
+
+    session.add(User(username="busy", password_hash=security.pwd_context.hash("pw"), role="customer"))
+    session.commit()
+
+    saturated = security.PasswordHasher(workers=1, max_pending=1)
+    assert saturated._slots.acquire(blocking=False)  # the one slot is taken
+    monkeypatch.setattr(security, "password_hasher", saturated)
+
+    response = client.post("/auth/login", data={"username": "busy", "password": "pw"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert saturated.stats()["rejected"] == 1
+
+def test_password_hasher_process_pool():
+    import security
+
+    hasher = security.PasswordHasher(workers=2, max_pending=4)
+    try:
+        hashed = hasher.run(security.hash_password, "pooled")
+        assert hasher.run(security._verify_and_update, "pooled", hashed) == (True, None)
+        assert hasher.run(security._verify_and_update, "wrong", hashed) == (False, None)
+    finally:
+        hasher.shutdown()
+
+    # 0 means no bound, not "reject everything"
+    unbounded = security.PasswordHasher(workers=1, max_pending=0)
+    try:
+        assert unbounded.run(security._verify_and_update, "pooled", hashed) == (True, None)
+        assert unbounded.stats()["completed"] == 1
+    finally:
+        unbounded.shutdown()
+
+def test_admin_checks_reuse_cached_principal(client, session, admin_headers):
+    from sqlalchemy import event
+    from auth_cache import principal_cache
+
+    user_queries = []
+
+    def count_user_queries(conn, cursor, statement, parameters, context, executemany):
+        if "FROM user" in statement:
+            user_queries.append(statement)
+
+    bind = session.get_bind()
+    event.listen(bind, "before_cursor_execute", count_user_queries)
+    try:
+        for _ in range(3):
+            assert client.get("/internal/cache", headers=admin_headers).status_code == 200
+        assert len(user_queries) == 1
+
+        principal_cache.clear()
+        assert client.get("/internal/cache", headers=admin_headers).status_code == 200
+        assert len(user_queries) == 2
+    finally:
+        event.remove(bind, "before_cursor_execute", count_user_queries)
+
+def test_role_change_invalidates_cached_principal(client, session, admin_headers):
+    assert client.get("/internal/cache", headers=admin_headers).status_code == 200
+
+    admin = session.exec(select(User).where(User.username == "fixture_admin")).one()
+    admin.role = "customer"
+    session.add(admin)
+    session.commit()
+
+    assert client.get("/internal/cache", headers=admin_headers).status_code == 403
+
+def test_password_reset_invalidates_cached_principal(client, session, admin_headers):
+    from security import SECRET_KEY
+
+    assert client.get("/internal/cache", headers=admin_headers).status_code == 200
+    response = client.post(
+        "/auth/dev-reset-admin-password",
+        json={"username": "fixture_admin", "new_password": "rotated"},
+        headers={"X-Setup-Key": SECRET_KEY},
+    )
+    assert response.status_code == 200
+
+    stats = client.get("/internal/auth-cache", headers=admin_headers).json()
+    assert stats["invalidations"] >= 1
+    assert stats["misses"] >= 2
+
+def _login(client, session, username="refresher", password="refreshpass"):
+    from security import get_password_hash
+
+    session.add(User(username=username, password_hash=get_password_hash(password), role="admin"))
+    session.commit()
+    response = client.post("/auth/login", data={"username": username, "password": password})
+    assert response.status_code == 200
+    return response.json()
+
+def test_refresh_rotates_without_password_hashing(client, session, monkeypatch):
+    import security
+
+    tokens = _login(client, session)
+
+    def no_bcrypt(*args):
+        raise AssertionError("refresh must not hash passwords")
+
+    monkeypatch.setattr(security.password_hasher, "run", no_bcrypt)
+
+    response = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    rotated = response.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+
+    headers = {"Authorization": f"Bearer {rotated['access_token']}"}
+    assert client.get("/internal/cache", headers=headers).status_code == 200
+
+    # The raw token is never stored
+    from models import RefreshToken
+    stored = session.exec(select(RefreshToken.token_hash)).all()
+    assert tokens["refresh_token"] not in stored
+
+def test_refresh_token_reuse_revokes_family(client, session):
+    tokens = _login(client, session)
+    first = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).json()
+
+    # Replaying the consumed token is treated as theft...
+    replay = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert replay.status_code == 401
+    assert replay.json()["detail"] == "Refresh token reuse detected"
+
+    # ...and the legitimate successor is revoked with the rest of the family
+    response = client.post("/auth/refresh", json={"refresh_token": first["refresh_token"]})
+    assert response.status_code == 401
+
+    assert client.post("/auth/refresh", json={"refresh_token": "not-a-token"}).status_code == 401
+
+def test_logout_revokes_access_and_refresh_tokens(client, session):
+    tokens = _login(client, session)
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.get("/internal/cache", headers=headers).status_code == 200
+
+    response = client.post("/auth/logout", json={"refresh_token": tokens["refresh_token"]}, headers=headers)
+    assert response.status_code == 200
+
+    # Rejected even though the principal for this token is still cached
+    assert client.get("/internal/cache", headers=headers).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+def test_logout_only_revokes_the_callers_refresh_tokens(client, session):
+    victim = _login(client, session, username="victim", password="victimpass")
+    caller = _login(client, session, username="caller", password="callerpass")
+
+    headers = {"Authorization": f"Bearer {caller['access_token']}"}
+    response = client.post("/auth/logout", json={"refresh_token": victim["refresh_token"]}, headers=headers)
+    assert response.status_code == 200
+
+    # Someone else's refresh token is ignored, not revoked
+    assert client.post("/auth/refresh", json={"refresh_token": victim["refresh_token"]}).status_code == 200
+
+def test_login_deletes_the_users_expired_refresh_tokens(client, session):
+    from datetime import datetime, timedelta
+    from models import RefreshToken
+    from refresh_tokens import _digest
+
+    first = _login(client, session)
+    other = _login(client, session, username="other", password="otherpass")
+    user_ids = dict(session.exec(select(User.username, User.id)).all())
+    past = datetime.utcnow() - timedelta(days=1)
+    session.add(RefreshToken(token_hash=_digest("old"), family_id="old", user_id=user_ids["refresher"], expires_at=past))
+    session.add(RefreshToken(token_hash=_digest("other-old"), family_id="other-old", user_id=user_ids["other"], expires_at=past))
+    session.commit()
+
+    response = client.post("/auth/login", data={"username": "refresher", "password": "refreshpass"})
+    assert response.status_code == 200
+
+    session.expire_all()
+    stored = set(session.exec(select(RefreshToken.token_hash)).all())
+    # Only the user's expired row is gone: live tokens and other users' rows stay
+    assert _digest("old") not in stored and _digest("other-old") in stored
+    assert {_digest(first["refresh_token"]), _digest(other["refresh_token"])} <= stored
+    assert client.post("/auth/refresh", json={"refresh_token": first["refresh_token"]}).status_code == 200
+
+def test_revocation_list_refreshes_incrementally(session):
+    from datetime import datetime, timedelta
+    from models import RevokedToken
+    from revocation import RevocationList
+
+    # Another worker's view: it only learns about revocations by refreshing
+    other_worker = RevocationList(refresh_seconds=0)
+    assert not other_worker.is_revoked(session, "abc")
+
+    future = datetime.utcnow() + timedelta(minutes=10)
+    session.add(RevokedToken(jti="abc", expires_at=future))
+    session.add(RevokedToken(jti="expired", expires_at=datetime.utcnow() - timedelta(minutes=1)))
+    session.commit()
+
+    assert other_worker.is_revoked(session, "abc")
+    assert not other_worker.is_revoked(session, "expired")
+    assert not other_worker.is_revoked(session, None)
+    assert other_worker.stats()["revoked"] == 1
+
+def test_login_throttle_rejects_before_hashing(client, session, monkeypatch):
+    import security
+    from login_throttle import LoginThrottle, Limit, MemoryBuckets
+    import main
+
+    throttle = LoginThrottle(MemoryBuckets(max_keys=100), user_limit=Limit(2, 1), ip_limit=Limit(100, 1))
+    monkeypatch.setattr(main, "login_throttle", throttle)
+
+    for _ in range(2):
+        response = client.post("/auth/login", data={"username": "victim", "password": "guess"})
+        assert response.status_code == 400
+
+    def no_bcrypt(*args):
+        raise AssertionError("throttled attempts must not hash")
+
+    monkeypatch.setattr(security.password_hasher, "run", no_bcrypt)
+    response = client.post("/auth/login", data={"username": "Victim", "password": "guess"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+    stats = throttle.stats()
+    assert stats["allowed"] == 2
+    assert stats["rejected_by_user"] == 1
+
+def test_login_throttle_limits_ip_and_bounds_memory(session):
+    from login_throttle import LoginThrottle, LoginThrottled, Limit, MemoryBuckets
+
+    throttle = LoginThrottle(MemoryBuckets(max_keys=4), user_limit=Limit(5, 1), ip_limit=Limit(3, 1))
+    for attempt in range(3):
+        throttle.check(session, f"user{attempt}", "10.0.0.1")
+    with pytest.raises(LoginThrottled):
+        throttle.check(session, "user9", "10.0.0.1")
+
+    # 4 usernames + 1 ip were tracked in a 4-key LRU
+    stats = throttle.stats()
+    assert stats["keys"] == 4
+    assert stats["evictions"] >= 1
+    assert stats["rejected_by_ip"] == 1
+
+def test_login_throttle_database_backend_is_shared(session):
+    from login_throttle import DatabaseBuckets, LoginThrottle, LoginThrottled, Limit
+
+    limits = dict(user_limit=Limit(2, 1), ip_limit=Limit(100, 1))
+    worker_a = LoginThrottle(DatabaseBuckets(), **limits)
+    worker_b = LoginThrottle(DatabaseBuckets(), **limits)
+
+    worker_a.check(session, "shared", "10.0.0.2")
+    session.commit()
+    worker_b.check(session, "shared", "10.0.0.3")
+    session.commit()
+    with pytest.raises(LoginThrottled):
+        worker_a.check(session, "shared", "10.0.0.4")
+
+def test_login_throttle_database_backend_survives_concurrent_first_attempts(tmp_path):
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from sqlmodel import Session, SQLModel, create_engine
+    from login_throttle import DatabaseBuckets, Limit
+    from models import LoginThrottleBucket
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'throttle.db'}")
+    SQLModel.metadata.create_all(engine)
+    limit = Limit(2, 1)
+    now = time.time()
+
+    def attempt(session):
+        wait = DatabaseBuckets().take(session, "user:race", limit, now)
+        session.commit()
+        return wait
+
+    # Worker A's first attempt is still uncommitted when worker B's arrives
+    with Session(engine) as a, Session(engine) as b, ThreadPoolExecutor(max_workers=1) as worker_b:
+        assert DatabaseBuckets().take(a, "user:race", limit, now) == 0
+        second = worker_b.submit(attempt, b)
+        time.sleep(0.1)
+        a.commit()
+        assert second.result() == 0
+
+    with Session(engine) as check:
+        assert attempt(check) > 0
+        assert check.exec(select(LoginThrottleBucket)).one().key == "user:race"
+    engine.dispose()
+
+def test_register_inserts_once_and_rejects_duplicates(client, session):
+    from sqlalchemy import event
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split()[0])
+
+    bind = session.get_bind()
+    event.listen(bind, "before_cursor_execute", record)
+    try:
+        response = client.post(
+            "/auth/register", json={"username": "fresh", "email": "Fresh@Example.com", "password": "pw"}
+        )
+    finally:
+        event.remove(bind, "before_cursor_execute", record)
+    assert response.status_code == 200
+    assert response.json()["username"] == "fresh"
+    assert statements == ["INSERT"]
+
+    response = client.post("/auth/register", json={"username": "fresh", "email": "other@example.com", "password": "pw"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Username already exists"
+
+    # Emails are compared case-insensitively
+    response = client.post("/auth/register", json={"username": "other", "email": "fresh@example.COM", "password": "pw"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Email already exists"
+
+def test_insert_ignoring_conflicts_skips_duplicates(session):
+    from database import insert_ignoring_conflicts
+
+    session.add(User(username="taken", email="Taken@example.com", password_hash="x"))
+    session.commit()
+
+    rows = [
+        {"username": "taken", "email": "new@example.com", "password_hash": "x", "role": "customer"},
+        {"username": "clash", "email": "taken@EXAMPLE.com", "password_hash": "x", "role": "customer"},
+        {"username": "ok", "email": "ok@example.com", "password_hash": "x", "role": "customer"},
+    ]
+    assert insert_ignoring_conflicts(session, User, rows) == 1
+    session.commit()
+    assert session.exec(select(User.username).order_by(User.username)).all() == ["ok", "taken"]
+
+def test_async_endpoints_share_the_sync_logic(tmp_path):
+    import asyncio
+    from fastapi import Response
+    from sqlmodel import Session, SQLModel, create_engine
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlmodel.ext.asyncio.session import AsyncSession
+    import main
+    from cache import catalog_cache
+    from database import async_database_url
+
+    url = f"sqlite:///{tmp_path / 'async.db'}"
+    sync_engine = create_engine(url)
+    SQLModel.metadata.create_all(sync_engine)
+    with Session(sync_engine) as setup:
+        setup.add(Sweet(name="Async Fudge", category="Fudge", price=2.5, quantity=3))
+        setup.commit()
+    catalog_cache.invalidate()
+
+    async def scenario():
+        engine = create_async_engine(async_database_url(url))
+        try:
+            async with AsyncSession(engine) as session:
+                listed = await main.read_sweets_async(Response(), None, None, "id", None, False, session=session)
+                bought = await main.purchase_sweet_async(listed[0]["id"], 2, session=session)
+                detail = await main.read_sweet_async(listed[0]["id"], session=session)
+            return listed, bought, detail
+        finally:
+            await engine.dispose()
+
+    listed, bought, detail = asyncio.run(scenario())
+    assert [s["name"] for s in listed] == ["Async Fudge"]
+    assert bought["remaining_stock"] == 1
+    assert detail["quantity"] == 1
+
+    # Only one variant of each endpoint is routed (sync unless ASYNC_DB=1)
+    endpoints = {route.endpoint for route in main.app.routes if getattr(route, "path", None) == "/sweets/"}
+    assert main.read_sweets_async not in endpoints
+
+def test_sqlite_profile_applies_to_file_databases(tmp_path):
+    from sqlmodel import create_engine
+    from sqlite_tuning import WriteLock, apply_profile
+
+    assert not apply_profile(create_engine("sqlite://"))
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'tuned.db'}")
+    assert apply_profile(engine, serialize_writes=False)
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert connection.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+        assert connection.exec_driver_sql("PRAGMA busy_timeout").scalar() > 0
+
+    lock = WriteLock(timeout_ms=1000)
+    lock.attach(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE t (x INTEGER)")
+        connection.exec_driver_sql("SELECT 1")
+        connection.exec_driver_sql("INSERT INTO t VALUES (1)")
+        connection.exec_driver_sql("INSERT INTO t VALUES (2)")
+        assert connection.info["sqlite_write_lock"]
+    # Taken once per transaction (at the first write) and released on commit
+    assert lock.stats() == {"acquired": 1, "timeouts": 0}
+    assert lock._lock.acquire(blocking=False)
+    engine.dispose()
+
+def test_sqlite_write_lock_released_by_the_thread_that_ends_the_transaction(tmp_path):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from sqlmodel import create_engine
+    from sqlite_tuning import WriteLock
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'locked.db'}")
+    lock = WriteLock(timeout_ms=200)
+    lock.attach(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE t (x INTEGER)")
+
+    connection = engine.connect()
+    # Long-lived workers, as in the server's thread pool: thread A stays alive throughout
+    with ThreadPoolExecutor(max_workers=1) as thread_a, ThreadPoolExecutor(max_workers=1) as thread_b:
+        thread_a.submit(connection.exec_driver_sql, "INSERT INTO t VALUES (1)").result()
+        assert connection.info["sqlite_write_lock"]
+
+        def end_transaction():
+            connection.rollback()
+            connection.close()
+
+        thread_b.submit(end_transaction).result()
+
+        def write():
+            with engine.begin() as other:
+                other.exec_driver_sql("INSERT INTO t VALUES (2)")
+            return threading.get_ident()
+
+        # Neither a fresh thread nor thread A itself waits for the lock
+        assert thread_b.submit(write).result() != thread_a.submit(write).result()
+
+    assert lock.stats() == {"acquired": 3, "timeouts": 0}
+    engine.dispose()
+
+def test_pool_metrics_report_waits_and_timeouts(tmp_path, client, admin_headers):
+    from sqlalchemy import create_engine
+    from sqlalchemy.exc import TimeoutError as PoolTimeout
+    from pool_metrics import PoolMetrics, TimedQueuePool
+
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}", poolclass=TimedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05
+    )
+    metrics = PoolMetrics()
+    metrics.attach(engine.pool)
+
+    with engine.connect():
+        assert metrics.snapshot(engine.pool)["checked_out"] == 1
+        with pytest.raises(PoolTimeout):
+            engine.connect()
+
+    snapshot = metrics.snapshot(engine.pool)
+    assert snapshot["timeouts"] == 1
+    assert snapshot["wait_ms_max"] >= 50
+    assert snapshot["checkouts"] == snapshot["checkins"] == 1
+    assert snapshot["max_checked_out"] == 1
+
+    # dispose() replaces the pool; the new one keeps reporting to the same metrics
+    engine.dispose()
+    with engine.connect():
+        pass
+    assert metrics.waits == 3  # two checkouts (one timed out) before, one after
+    assert metrics.snapshot(engine.pool)["checkouts"] == 2
+    engine.dispose()
+
+    response = client.get("/internal/db-pool", headers=admin_headers)
+    assert response.status_code == 200
+    assert {"checked_out", "overflow", "wait_ms_avg", "timeouts"} <= response.json().keys()
+
+def test_catalog_reads_use_replica_with_read_your_writes(tmp_path, client, session, monkeypatch):
+    from sqlmodel import Session, SQLModel, create_engine
+    import database
+    import read_routing
+
+    # Primary: the fixture database. Replica: a second SQLite file that "lags".
+    session.add(Sweet(name="Fresh Fudge", category="Fudge", price=2.0, quantity=5))
+    session.commit()
+    replica_engine = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    SQLModel.metadata.create_all(replica_engine)
+    with Session(replica_engine) as replica:
+        replica.add(Sweet(name="Stale Fudge", category="Fudge", price=2.0, quantity=5))
+        replica.commit()
+
+    health = read_routing.ReplicaHealth(retry_seconds=60)
+    monkeypatch.setattr(database, "read_engine", replica_engine)
+    monkeypatch.setattr(read_routing, "replica_health", health)
+
+    assert [s["name"] for s in client.get("/sweets/").json()] == ["Stale Fudge"]
+
+    # After a write, this client reads from the primary for a short while
+    response = client.post("/sweets/1/purchase")
+    assert response.status_code == 200
+    assert read_routing.STICKY_COOKIE in response.cookies
+    assert [s["name"] for s in client.get("/sweets/").json()] == ["Fresh Fudge"]
+    assert health.stats()["sticky_reads"] == 1
+
+    # A cross-site browser client can't rely on the cookie: it echoes the header back
+    until = response.headers[read_routing.STICKY_HEADER]
+    client.cookies.clear()
+    assert [s["name"] for s in client.get("/sweets/").json()] == ["Stale Fudge"]
+    fresh = client.get("/sweets/", headers={read_routing.STICKY_HEADER: until, "Origin": "http://localhost:5173"})
+    assert [s["name"] for s in fresh.json()] == ["Fresh Fudge"]
+    assert read_routing.STICKY_HEADER in fresh.headers["access-control-expose-headers"]
+    assert health.stats()["sticky_reads"] == 2
+    replica_engine.dispose()
+
+def test_async_catalog_reads_use_replica_with_read_your_writes(tmp_path, monkeypatch):
+    import asyncio
+    from fastapi import Request, Response
+    from sqlmodel import Session, SQLModel, create_engine
+    from sqlmodel.ext.asyncio.session import AsyncSession
+    import database
+    import main
+    import read_routing
+    from cache import catalog_cache
+
+    urls = {}
+    for name, label in [("primary", "Fresh Fudge"), ("replica", "Stale Fudge")]:
+        urls[name] = f"sqlite:///{tmp_path / f'{name}.db'}"
+        engine = create_engine(urls[name])
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as setup:
+            setup.add(Sweet(name=label, category="Fudge", price=2.0, quantity=5))
+            setup.commit()
+        engine.dispose()
+    catalog_cache.invalidate()
+
+    health = read_routing.ReplicaHealth(retry_seconds=60)
+    monkeypatch.setattr(read_routing, "replica_health", health)
+    monkeypatch.setattr(database, "DATABASE_READ_URL", urls["replica"])
+    monkeypatch.setattr(database, "_async_read_engine", None)
+
+    def request(headers: dict) -> Request:
+        return Request({"type": "http", "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()]})
+
+    async def list_names(headers: dict) -> list[str]:
+        primary_engine = database._create_async_engine(database.async_database_url(urls["primary"]))
+        async with AsyncSession(primary_engine) as primary:
+            sessions = read_routing.get_async_read_session(request(headers), session=primary)
+            session = await sessions.__anext__()
+            try:
+                rows = await main.read_sweets_async(Response(), None, None, "id", None, False, session=session)
+            finally:
+                await sessions.aclose()
+        await primary_engine.dispose()
+        return [row["name"] for row in rows]
+
+    async def scenario():
+        try:
+            stale = await list_names({})
+            sticky = await list_names({read_routing.STICKY_HEADER: str(time.time() + 5)})
+            return stale, sticky
+        finally:
+            await database.get_async_read_engine().dispose()
+
+    assert asyncio.run(scenario()) == (["Stale Fudge"], ["Fresh Fudge"])
+    assert (health.replica_reads, health.sticky_reads) == (1, 1)
+
+def test_catalog_reads_fall_back_when_replica_is_down(tmp_path, client, session, monkeypatch):
+    from sqlmodel import create_engine
+    import database
+    import read_routing
+
+    session.add(Sweet(name="Primary Fudge", category="Fudge", price=2.0, quantity=5))
+    session.commit()
+
+    health = read_routing.ReplicaHealth(retry_seconds=60)
+    unreachable = create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    monkeypatch.setattr(database, "read_engine", unreachable)
+    monkeypatch.setattr(read_routing, "replica_health", health)
+
+    for _ in range(2):
+        assert [s["name"] for s in client.get("/sweets/").json()] == ["Primary Fudge"]
+
+    stats = health.stats()
+    # One failed connect, then the replica is skipped until the retry window ends
+    assert stats["failures"] == 1
+    assert stats["primary_fallbacks"] == 2
+    assert not stats["available"]
+
+def test_migrations_upgrade_legacy_schema_and_skip_when_current(tmp_path):
+    from sqlalchemy import create_engine, event
+    import migrations
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as connection:
+        # A database from before image_url, email and category_key existed
+        connection.execute(text("CREATE TABLE sweet (id INTEGER PRIMARY KEY, name VARCHAR, category VARCHAR, price FLOAT, quantity INTEGER)"))
+        connection.execute(text('CREATE TABLE "user" (id INTEGER PRIMARY KEY, username VARCHAR, password_hash VARCHAR, role VARCHAR)'))
+        connection.execute(text("INSERT INTO sweet (name, category, price, quantity) VALUES ('Old Fudge', 'Fudge ', 2.0, 4)"))
+
+    assert len(migrations.migrate(engine)) == migrations.LATEST_VERSION
+    with engine.connect() as connection:
+        assert migrations.current_version(connection) == migrations.LATEST_VERSION
+        assert connection.execute(text("SELECT category_key FROM sweet")).scalar() == "fudge"
+        assert connection.execute(text("SELECT item_count FROM categorysummary")).scalar() == 1
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    assert migrations.migrate(engine) == []
+    assert len(statements) == 1
+
+def test_sweet_index_migrations_are_frozen(tmp_path, monkeypatch):
+    from sqlalchemy import create_engine
+    import migrations
+
+    def sweet_indexes():
+        with engine.connect() as connection:
+            return {row[0] for row in connection.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'sweet' AND name LIKE 'ix_%'"
+            ))}
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'indexes.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE sweet (id INTEGER PRIMARY KEY, name VARCHAR, category VARCHAR, price FLOAT, quantity INTEGER)"))
+
+    # Migration 5 creates the indexes it always did, whatever the model declares today
+    all_migrations = migrations.MIGRATIONS
+    monkeypatch.setattr(migrations, "MIGRATIONS", all_migrations[:8])
+    migrations.migrate(engine)
+    assert sweet_indexes() == {"ix_sweet_price_id", "ix_sweet_category_key_price"}
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", all_migrations)
+    assert migrations.migrate(engine) == ["sweet name index"]
+    assert sweet_indexes() == {"ix_sweet_price_id", "ix_sweet_category_key_price", "ix_sweet_name"}
+
+def test_failed_migration_leaves_no_partial_schema(tmp_path, monkeypatch):
+    from sqlalchemy import create_engine
+    import migrations
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'failing.db'}")
+    migrations.migrate(engine)
+
+    def half_done(connection):
+        connection.execute(text("ALTER TABLE sweet ADD COLUMN half_done VARCHAR"))
+        connection.execute(text("CREATE TABLE half_done (id INTEGER PRIMARY KEY)"))
+        raise RuntimeError("step failed")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", [*migrations.MIGRATIONS, (99, "half done", half_done)])
+    with pytest.raises(RuntimeError):
+        migrations.migrate(engine)
+
+    with engine.connect() as connection:
+        assert "half_done" not in migrations._column_names(connection, "sweet")
+        assert not connection.execute(text("SELECT name FROM sqlite_master WHERE name = 'half_done'")).all()
+        assert 99 not in migrations.applied_versions(connection)
+
+def test_skipped_unique_index_migration_is_retried(tmp_path, caplog):
+    from sqlalchemy import create_engine
+    from sqlalchemy.exc import IntegrityError
+    import migrations
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'duplicates.db'}")
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE "user" (id INTEGER PRIMARY KEY, username VARCHAR, email VARCHAR, password_hash VARCHAR, role VARCHAR)'))
+        connection.execute(text(
+            "INSERT INTO \"user\" (username, email, password_hash, role) "
+            "VALUES ('a', 'Same@example.com', 'x', 'customer'), ('b', 'same@example.com', 'x', 'customer')"
+        ))
+
+    applied = migrations.migrate(engine)
+    assert "user unique indexes" not in applied and "sweet name index" in applied
+    assert "ux_user_email_lower" in caplog.text
+    with engine.connect() as connection:
+        assert 6 not in migrations.applied_versions(connection)
+
+    # Still pending: retried (and still skipped) at the next start
+    caplog.clear()
+    assert migrations.migrate(engine) == []
+    assert "ux_user_email_lower" in caplog.text
+
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE \"user\" SET email = 'b@example.com' WHERE username = 'b'"))
+    assert migrations.migrate(engine) == ["user unique indexes"]
+    with engine.begin() as connection, pytest.raises(IntegrityError):
+        connection.execute(text("UPDATE \"user\" SET email = 'SAME@example.com' WHERE username = 'b'"))
+
+def test_image_maintenance_updates_in_resumable_chunks(tmp_path):
+    import json
+    from sqlmodel import Session, SQLModel, create_engine
+    from sweet_images import update_images
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'images.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as setup:
+        setup.add_all([
+            Sweet(name="Jalebi", category="Indian", price=1, quantity=1, image_url="/sweets/indian.svg"),
+            Sweet(name="Rasgulla", category="Indian", price=1, quantity=1, image_url="/custom.png"),
+            Sweet(name="Cheesecake Slice", category="Cake", price=1, quantity=1),
+            Sweet(name="Mystery", category="Other", price=1, quantity=1),
+            Sweet(name="Gummy Bears", category="Candy", price=1, quantity=1),
+        ])
+        setup.commit()
+
+    def image_urls():
+        with Session(engine) as check:
+            return check.exec(select(Sweet.name, Sweet.image_url).order_by(Sweet.id)).all()
+
+    before = image_urls()
+    report = update_images(engine, chunk_size=2, dry_run=True)
+    assert (report["scanned"], report["by_name"], report["by_category"]) == (5, 2, 1)
+    assert image_urls() == before
+
+    # Resume after the first chunk (ids 1-2) as if a run had stopped there
+    checkpoint = tmp_path / "images.checkpoint.json"
+    checkpoint.write_text(json.dumps({"after": 2, "scanned": 2, "by_name": 1, "by_category": 0, "force": False}))
+    report = update_images(engine, chunk_size=2, checkpoint=checkpoint)
+    assert (report["scanned"], report["by_name"], report["by_category"]) == (5, 2, 1)
+    assert not checkpoint.exists()
+    assert image_urls() == [
+        ("Jalebi", "/sweets/indian.svg"),  # in the skipped chunk
+        ("Rasgulla", "/custom.png"),
+        ("Cheesecake Slice", "/sweets/red_velvet_cupcake.webp"),
+        ("Mystery", None),
+        ("Gummy Bears", "/sweets/gummy_bears.jpg"),
+    ]
+
+    report = update_images(engine, force=True)
+    assert report["by_name"] == 2
+    assert image_urls()[:2] == [("Jalebi", "/sweets/jalebi.webp"), ("Rasgulla", "/sweets/rasgulla.jpg")]
+
+def test_image_maintenance_restart_is_resumable(tmp_path, monkeypatch, capsys):
+    import json
+    import sys
+    import database
+    import sweet_images
+    from sqlmodel import Session, SQLModel, create_engine
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'images.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as setup:
+        setup.add_all([Sweet(name=f"Cake {i}", category="Cake", price=1, quantity=1) for i in range(5)])
+        setup.commit()
+    monkeypatch.setattr(database, "engine", engine)
+
+    checkpoint = tmp_path / "images.checkpoint.json"
+    checkpoint.write_text(json.dumps({"after": 4, "scanned": 4, "by_name": 0, "by_category": 4, "force": False}))
+
+    def run(*args):
+        monkeypatch.setattr(sys, "argv", ["sweet_images.py", "--chunk-size", "2", "--checkpoint", str(checkpoint), *args])
+        sweet_images.main()
+
+    def interrupt_after_first_chunk(message):
+        if message.startswith("ids"):
+            raise KeyboardInterrupt
+
+    # --restart drops the stale checkpoint but still records its own progress
+    monkeypatch.setattr(sweet_images, "print", interrupt_after_first_chunk, raising=False)
+    with pytest.raises(KeyboardInterrupt):
+        run("--restart")
+    assert json.loads(checkpoint.read_text())["after"] == 2
+
+    monkeypatch.delattr(sweet_images, "print")
+    run()
+    output = capsys.readouterr().out
+    assert f"Resuming from {checkpoint}" in output
+    assert "Updated by category: 5" in output
+    assert not checkpoint.exists()
+    with Session(engine) as check:
+        assert set(check.exec(select(Sweet.image_url)).all()) == {"/sweets/red_velvet_cupcake.webp"}
+
+def test_bulk_loader_upserts_by_name_and_generator_is_deterministic(tmp_path):
+    from sqlmodel import Session, SQLModel, create_engine
+    from catalog_loader import generate_catalog, load_sweets, parse_categories
+    from models import CategorySummary
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'bulk.db'}")
+    SQLModel.metadata.create_all(engine)
+
+    options = {"seed": 3, "categories": parse_categories("Fudge=3,Ice Cream=1"), "prices": "uniform:1,2"}
+    rows = list(generate_catalog(500, **options))
+    assert rows[:100] == list(generate_catalog(100, **options))
+    assert len({row["name"] for row in rows}) == 500
+    assert all(1 <= row["price"] <= 2 for row in rows)
+
+    report = load_sweets(engine, rows, batch_size=128)
+    assert (report["inserted"], report["updated"], report["unchanged"]) == (500, 0, 0)
+
+    # Same rows again: nothing to write
+    report = load_sweets(engine, rows, batch_size=128, defer_search_index=True)
+    assert (report["inserted"], report["updated"], report["unchanged"]) == (0, 0, 500)
+
+    changed = [{**rows[0], "quantity": 7}, {"name": "Brand New", "category": "Fudge", "price": 1.5, "quantity": 2}]
+    report = load_sweets(engine, changed, on_conflict="ignore")
+    assert (report["inserted"], report["updated"], report["unchanged"]) == (1, 0, 1)
+    report = load_sweets(engine, changed)
+    assert (report["inserted"], report["updated"], report["unchanged"]) == (0, 1, 1)
+
+    with Session(engine) as check:
+        sweet = check.exec(select(Sweet).where(Sweet.name == rows[0]["name"])).one()
+        assert (sweet.quantity, sweet.category_key) == (7, rows[0]["category"].lower())
+        summary = {row.category_key: row.item_count for row in check.exec(select(CategorySummary))}
+        assert sum(summary.values()) == 501 and set(summary) == {"fudge", "ice_cream"}
+        # The search index was rebuilt after the deferred load
+        assert check.exec(text("SELECT count(*) FROM sweet_fts WHERE sweet_fts MATCH '\"Brand New\"'")).one()[0] == 1
@@ -0,0 +1,249 @@
+"""Query-plan regression tests for the API's hot paths.
+
+Every scenario calls one endpoint against a seeded catalog of `CATALOG_SIZE`
+sweets, with `ANALYZE` statistics, and records each statement it sends to the
+database. The test fails if:
+
+- the endpoint sends more statements than its budget; or
+- the plan of any of those statements reads a whole table or index. On
+  SQLite that is any `EXPLAIN QUERY PLAN` step `SCAN <table>`, including one
+  `USING [COVERING] INDEX` (a full pass over the index); only `SEARCH` is a
+  lookup. On PostgreSQL it is a `Seq Scan` node in `EXPLAIN`.
+
+Scans that are the point of the query, such as a full export, are listed in
+the scenario's `scans`: a table name for a table scan, or
+`<table> USING INDEX <index>` for one deliberate ordered scan. A scenario's
+`lookups` lists columns that some statement must find through an index. The
+suite runs on a temporary SQLite file. To check
+PostgreSQL plans, point `QUERY_PLAN_DATABASE_URL` at a scratch database; its
+tables are dropped afterwards.
+"""
+
+import os
+import re
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, insert
+from sqlmodel import Session, SQLModel, create_engine
+
+from auth_cache import principal_cache
+from cache import catalog_cache
+from database import get_session
+from login_throttle import login_throttle
+from main import app
+from models import CategorySummary, RefreshToken, Sweet, User
+from pagination import encode_cursor
+from refresh_tokens import _digest
+from revocation import revocation_list
+from security import SECRET_KEY, create_access_token, get_password_hash
+
+CATALOG_SIZE = 20_000
+USER_COUNT = 2_000
+PLAN_REFRESH_TOKEN = "plan-refresh-token"
+CATEGORIES = ["Chocolate", "Candy", "Gummy", "Fudge", "Toffee", "Lollipop", "Caramel", "Marshmallow"]
+
+# Statements that are transaction control, not queries
+_UNPLANNED = re.compile(r"^\s*(SAVEPOINT|RELEASE|ROLLBACK|BEGIN|COMMIT|PRAGMA)", re.IGNORECASE)
+
+
+class Scenario(NamedTuple):
+    name: str
+    method: str
+    path: str
+    budget: int
+    status: int = 200
+    json: dict | None = None
+    data: dict | None = None
+    admin: bool = False
+    headers: dict | None = None
+    scans: frozenset = frozenset()
+    lookups: frozenset = frozenset()
+
+
+def explain(connection, statement: str, parameters) -> list[str]:
+    """The plan of one recorded statement, one line per step."""
+
+    if connection.dialect.name == "postgresql":
+        rows = connection.exec_driver_sql("EXPLAIN " + statement, parameters).all()
+        return [row[0] for row in rows]
+    rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+    return [row[-1] for row in rows]
+
+
+def full_scans(plan: list[str]) -> set[str]:
+    """Tables and indexes read in full by `plan` (virtual-table scans don't count)."""
+
+    scanned = set()
+    for step in plan:
+        sqlite = re.match(r"\s*SCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?(.*)", step)
+        if sqlite and not re.search(r"VIRTUAL TABLE|CONSTANT ROW", sqlite.group(3)):
+            table, index = sqlite.group(1), sqlite.group(2)
+            scanned.add(f"{table} USING INDEX {index}" if index else table)
+        postgres = re.search(r"Seq Scan on (\w+)", step)
+        if postgres:
+            scanned.add(postgres.group(1))
+    return scanned
+
+
+def index_lookups(plan: list[str]) -> set[str]:
+    """Columns that `plan` finds through an index (`SEARCH` / `Index Cond`)."""
+
+    columns = set()
+    for step in plan:
+        found = re.match(r"\s*SEARCH \w+ USING .*\((\w+)[=<>]", step) or re.search(r"Index Cond: \(+(\w+)", step)
+        if found:
+            columns.add(found.group(1))
+    return columns
+
+
+@pytest.fixture(name="catalog_engine", scope="module")
+def catalog_engine_fixture(tmp_path_factory):
+    url = os.getenv("QUERY_PLAN_DATABASE_URL") or f"sqlite:///{tmp_path_factory.mktemp('plans') / 'catalog.db'}"
+    engine = create_engine(url)
+    SQLModel.metadata.create_all(engine)
+
+    with engine.begin() as connection:
+        connection.execute(insert(Sweet), [
+            {
+                "name": f"{CATEGORIES[i % len(CATEGORIES)]} Treat {i}",
+                "category": CATEGORIES[i % len(CATEGORIES)],
+                "category_key": CATEGORIES[i % len(CATEGORIES)].lower(),
+                "price": round(0.5 + (i * 37 % 1000) / 100, 2),
+                "quantity": 1_000_000,
+            }
+            for i in range(CATALOG_SIZE)
+        ])
+        connection.execute(insert(CategorySummary), [
+            {"category_key": c.lower(), "label": c, "item_count": CATALOG_SIZE // len(CATEGORIES), "total_stock": 0}
+            for c in CATEGORIES
+        ])
+        connection.execute(insert(User), [
+            {"username": f"user{i}", "email": f"user{i}@example.com", "password_hash": "x", "role": "customer"}
+            for i in range(USER_COUNT)
+        ] + [{"username": "plan_admin", "email": None, "password_hash": get_password_hash("adminpass"), "role": "admin"}])
+        # One live refresh token per user; plan_admin's is PLAN_REFRESH_TOKEN
+        expires_at = datetime.utcnow() + timedelta(days=1)
+        connection.execute(insert(RefreshToken), [
+            {"token_hash": _digest(f"token{i}"), "family_id": f"family{i}", "user_id": i + 1, "expires_at": expires_at}
+            for i in range(USER_COUNT)
+        ] + [{"token_hash": _digest(PLAN_REFRESH_TOKEN), "family_id": "plan_admin", "user_id": USER_COUNT + 1,
+              "expires_at": expires_at}])
+        # Give the planner real statistics, as a long-lived database would have
+        connection.exec_driver_sql("ANALYZE")
+
+    yield engine
+    SQLModel.metadata.drop_all(engine)
+    engine.dispose()
+
+
+@pytest.fixture(name="plan_client")
+def plan_client_fixture(catalog_engine):
+    def get_session_override():
+        with Session(catalog_engine) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = get_session_override
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def _admin_headers() -> dict[str, str]:
+    return {"Authorization": f"Bearer {create_access_token({'sub': 'plan_admin', 'role': 'admin'})}"}
+
+
+SCENARIOS = [
+    # Sweets catalog
+    Scenario("catalog first page", "GET", "/sweets/?limit=20", 1,
+             # Reads rowids in order and stops after 20 rows
+             scans=frozenset({"sweet"})),
+    Scenario("catalog next page", "GET", f"/sweets/?limit=20&after={encode_cursor((5000,))}", 1),
+    Scenario("catalog by price", "GET", f"/sweets/?limit=20&order=price&after={encode_cursor((3.0, 42))}", 1),
+    Scenario("search by name", "GET", "/sweets/search?name=fudge%20treat%2012&limit=20", 1),
+    Scenario("search by category and price", "GET",
+             "/sweets/search?category=Toffee&min_price=2&max_price=3&limit=20&order=price", 1),
+    Scenario("search with total", "GET", "/sweets/search?category=gummy&max_price=1&include_total=true", 2),
+    Scenario("one sweet", "GET", "/sweets/1234", 1),
+    Scenario("categories", "GET", "/sweets/categories", 1,
+             # One row per category: this is the whole answer, in key order
+             # (SQLite walks the primary key index; PostgreSQL reads the table and sorts)
+             scans=frozenset({"categorysummary", "categorysummary USING INDEX sqlite_autoindex_categorysummary_1"})),
+    Scenario("export", "GET", "/sweets/export", 3, admin=True, scans=frozenset({"sweet"})),
+    # Purchases
+    Scenario("purchase", "POST", "/sweets/77/purchase?quantity=2", 4),
+    Scenario("checkout", "POST", "/orders/checkout", 6,
+             json={"items": [{"sweet_id": 10, "quantity": 1}, {"sweet_id": 11, "quantity": 3}]}),
+    # Admin catalog writes
+    Scenario("create sweet", "POST", "/sweets/", 5, status=201, admin=True,
+             json={"name": "Plan Brittle", "category": "Toffee", "price": 2.0, "quantity": 5}),
+    Scenario("update sweet", "PUT", "/sweets/200", 7, admin=True,
+             json={"name": "Renamed", "category": "Candy", "price": 1.0, "quantity": 5}),
+    Scenario("restock", "POST", "/sweets/300/restock?quantity=5", 6, admin=True),
+    Scenario("delete sweet", "DELETE", "/sweets/400", 5, admin=True),
+    Scenario("sales report", "GET", "/reports/sales?scope=category&key=toffee", 3, admin=True),
+    # Accounts
+    Scenario("register", "POST", "/auth/register", 1,
+             json={"username": "plan_new", "email": "plan_new@example.com", "password": "pw"}),
+    Scenario("register duplicate", "POST", "/auth/register", 2, status=400,
+             json={"username": "user7", "email": "other@example.com", "password": "pw"}),
+    Scenario("login", "POST", "/auth/login", 3, data={"username": "plan_admin", "password": "adminpass"}),
+    Scenario("refresh", "POST", "/auth/refresh", 2, json={"refresh_token": PLAN_REFRESH_TOKEN},
+             lookups=frozenset({"token_hash"})),
+    Scenario("logout", "POST", "/auth/logout", 5, admin=True),
+    Scenario("init admin", "POST", "/auth/init-admin", 1, status=403, json={"username": "second", "password": "pw"},
+             # Rejected: an admin exists. `role` is unindexed, and this runs once per deployment
+             scans=frozenset({"user"})),
+    Scenario("dev reset admin password", "POST", "/auth/dev-reset-admin-password", 4,
+             json={"username": "plan_admin", "new_password": "adminpass"}, headers={"X-Setup-Key": SECRET_KEY}),
+]
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS, ids=[s.name for s in SCENARIOS])
+def test_endpoint_query_plans(scenario: Scenario, plan_client, catalog_engine):
+    # Cold caches: measure the statements a cache miss costs
+    catalog_cache.invalidate()
+    principal_cache.clear()
+    revocation_list.reset()
+    login_throttle.reset()
+
+    headers = {**(_admin_headers() if scenario.admin else {}), **(scenario.headers or {})}
+    recorded = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not _UNPLANNED.match(statement):
+            recorded.append((statement, parameters[0] if executemany else parameters))
+
+    event.listen(catalog_engine, "before_cursor_execute", record)
+    try:
+        response = plan_client.request(
+            scenario.method, scenario.path, json=scenario.json, data=scenario.data, headers=headers
+        )
+    finally:
+        event.remove(catalog_engine, "before_cursor_execute", record)
+    assert response.status_code == scenario.status, response.text
+
+    with catalog_engine.connect() as connection:
+        plans = [(statement, explain(connection, statement, parameters)) for statement, parameters in recorded]
+
+    report = "\n\n".join(f"{statement}\n  -> " + "\n  -> ".join(plan) for statement, plan in plans)
+    assert len(recorded) <= scenario.budget, f"{len(recorded)} statements, budget {scenario.budget}:\n\n{report}"
+    for statement, plan in plans:
+        unexpected = full_scans(plan) - scenario.scans
+        assert not unexpected, f"full scan of {', '.join(sorted(unexpected))}:\n{statement}\n  -> " + "\n  -> ".join(plan)
+    missing = scenario.lookups - set().union(*(index_lookups(plan) for _, plan in plans))
+    assert not missing, f"no index lookup on {', '.join(sorted(missing))}:\n\n{report}"
+
+
+def test_full_scans_reads_both_plan_formats():
+    assert full_scans(["SCAN sweet"]) == {"sweet"}
+    assert full_scans(["SCAN sweet USING INDEX ix_sweet_price_id"]) == {"sweet USING INDEX ix_sweet_price_id"}
+    assert full_scans(["SCAN sweet USING COVERING INDEX ix_sweet_name"]) == {"sweet USING INDEX ix_sweet_name"}
+    assert full_scans(["SEARCH sweet USING INDEX ix_sweet_price_id (price>?)", "SCAN sweet_fts VIRTUAL TABLE INDEX 0:M2"]) == set()
+    assert full_scans(["SCAN 4 CONSTANT ROWS", "SEARCH user USING INDEX sqlite_autoindex_user_1 (username=?)"]) == set()
+    assert full_scans(["Limit  (cost=0.00..1.05 rows=20 width=64)", "  ->  Seq Scan on sweet  (cost=0.00..1050.00 rows=20000 width=64)"]) == {"sweet"}
+    assert full_scans(["Index Scan using ix_sweet_price_id on sweet  (cost=0.29..8.31 rows=1 width=64)"]) == set()
+    assert index_lookups(["SEARCH refreshtoken USING INDEX sqlite_autoindex_refreshtoken_1 (token_hash=?)"]) == {"token_hash"}
+    assert index_lookups(["SEARCH user USING INTEGER PRIMARY KEY (rowid=?)", "SCAN sweet"]) == {"rowid"}
+    assert index_lookups(["Index Scan using refreshtoken_token_hash_key on refreshtoken", "  Index Cond: ((token_hash)::text = 'x'::text)"]) == {"token_hash"}
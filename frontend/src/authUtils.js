@@ -1,4 +1,5 @@
 // Install jwt-decode: npm install jwt-decode
+import axios from 'axios';
 import { jwtDecode } from 'jwt-decode';
 
 // Define a function getUserRole()
@@ -19,3 +20,75 @@ export function getUserRole() {
         return null;
     }
 }
+
+// Access tokens are short-lived. When a request comes back 401, trade the
+// stored refresh token for a new pair once and retry the request, instead of
+// sending the user back to the login form.
+let refreshing = null;
+
+async function refreshTokens(apiUrl) {
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (!refreshToken) {
+        throw new Error('No refresh token');
+    }
+    const response = await axios.post(`${apiUrl}/auth/refresh`, { refresh_token: refreshToken });
+    localStorage.setItem('access_token', response.data.access_token);
+    localStorage.setItem('refresh_token', response.data.refresh_token);
+    return response.data.access_token;
+}
+
+export function installTokenRefresh(apiUrl) {
+    axios.interceptors.response.use(undefined, async (error) => {
+        const request = error.config;
+        if (
+            !error.response ||
+            error.response.status !== 401 ||
+            !request ||
+            request._retried ||
+            request.url.endsWith('/auth/refresh')
+        ) {
+            throw error;
+        }
+
+        // Concurrent 401s share one refresh: refresh tokens are single-use
+        refreshing = refreshing || refreshTokens(apiUrl).finally(() => {
+            refreshing = null;
+        });
+
+        let token;
+        try {
+            token = await refreshing;
+        } catch {
+            localStorage.removeItem('access_token');
+            localStorage.removeItem('refresh_token');
+            throw error;
+        }
+
+        request._retried = true;
+        request.headers.Authorization = `Bearer ${token}`;
+        return axios(request);
+    });
+}
+
+// After a write, the API answers with X-Read-Primary-Until. Sending it back
+// keeps this client's catalog reads on the primary database until then, so it
+// sees its own purchases and edits even when reads go to a replica. (The API
+// is on another site, so its read_primary_until cookie never comes back.)
+const READ_PRIMARY_HEADER = 'X-Read-Primary-Until';
+let readPrimaryUntil = null;
+
+export function installReadYourWrites() {
+    axios.interceptors.request.use((config) => {
+        if (readPrimaryUntil) {
+            config.headers[READ_PRIMARY_HEADER] = readPrimaryUntil;
+        }
+        return config;
+    });
+    axios.interceptors.response.use((response) => {
+        const until = response.headers[READ_PRIMARY_HEADER.toLowerCase()];
+        if (until) {
+            readPrimaryUntil = until;
+        }
+        return response;
+    });
+}
@@ -2,10 +2,13 @@ import { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import '../dashboard.css';
-import { getUserRole } from '../authUtils';
+import { getUserRole, installReadYourWrites, installTokenRefresh } from '../authUtils';
 
 const API_URL = 'https://sweet-shop-management-system-production-df3f.up.railway.app';
 
+installTokenRefresh(API_URL);
+installReadYourWrites();
+
 function Dashboard() {
   const userRole = getUserRole();
   const isAdmin = userRole === 'admin';
@@ -85,17 +88,15 @@ function Dashboard() {
 
   const fetchCategoryOptions = async () => {
     try {
-      const response = await axios.get(`${API_URL}/sweets/`, {
+      // Distinct categories with counts, maintained server-side (no full catalog download)
+      const response = await axios.get(`${API_URL}/sweets/categories`, {
         headers: getAuthHeaders(),
       });
       const all = Array.isArray(response.data) ? response.data : [];
-      const categories = Array.from(
-        new Set(
-          all
-            .map((s) => (s?.category ?? '').toString().trim())
-            .filter(Boolean)
-        )
-      ).sort((a, b) => a.localeCompare(b));
+      const categories = all
+        .map((c) => (c?.label ?? '').toString().trim())
+        .filter(Boolean)
+        .sort((a, b) => a.localeCompare(b));
       setCategoryOptions(categories);
     } catch (err) {
       // Non-fatal: filtering still works, user just won't see category suggestions
@@ -145,9 +146,23 @@ function Dashboard() {
     }));
   };
 
-  const handleLogout = () => {
-    localStorage.removeItem('access_token');
-    navigate('/login');
+  const handleLogout = async () => {
+    // Revoke both tokens server-side; sign out locally even if that fails.
+    // Storage is cleared only afterwards: with an expired access token, the
+    // refresh interceptor still needs the refresh token to retry the logout.
+    try {
+      await axios.post(
+        `${API_URL}/auth/logout`,
+        { refresh_token: localStorage.getItem('refresh_token') },
+        { headers: getAuthHeaders() }
+      );
+    } catch {
+      // Signed out locally regardless
+    } finally {
+      localStorage.removeItem('access_token');
+      localStorage.removeItem('refresh_token');
+      navigate('/login');
+    }
   };
 
   const getPurchaseQty = (sweet) => {
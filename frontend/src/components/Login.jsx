@@ -37,6 +37,7 @@ function Login() {
 
       // Save the access token to localStorage
       localStorage.setItem('access_token', response.data.access_token);
+      localStorage.setItem('refresh_token', response.data.refresh_token);
       
       // Navigate to dashboard
       navigate('/dashboard');